@@ -1,3 +1,128 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from django_project.testing import QueryBudgetTestCase, add_events, make_work_order, without_throttling
+from workorders.models import EventTombstone
+
+
+class CalendarQueryBudgetTests(QueryBudgetTestCase):
+    def setUpFixtures(self):
+        self.work_order = make_work_order()
+
+    def add_events(self, rows):
+        return add_events(self.work_order, rows)
+
+    def test_full_window(self):
+        self.assertQueryBudget(1, self.add_events, lambda _: self.client.get('/api/calendar/events/'))
+
+    def test_since_cursor(self):
+        def make_rows(rows):
+            since = timezone.now()
+            events = self.add_events(rows + 1)
+            events[-1].delete()
+            return since
+
+        self.assertQueryBudget(
+            2, make_rows, lambda since: self.client.get('/api/calendar/events/', {'since': since.isoformat()}),
+        )
+
+    def test_expired_cursor_resets(self):
+        since = timezone.now() - timedelta(days=365)
+        self.assertQueryBudget(
+            1, self.add_events, lambda _: self.client.get('/api/calendar/events/', {'since': since.isoformat()}),
+        )
+
+
+@without_throttling
+# No overlap, so a delta holds exactly what changed after the cursor.
+@override_settings(CALENDAR_SYNC_OVERLAP_SECONDS=0)
+class CalendarSyncTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('calendar', password='calendar-pass'))
+        self.work_order = make_work_order()
+        self.events = add_events(self.work_order, 4)
+        self.cursor = self.client.get('/api/calendar/events/')['X-Calendar-Cursor']
+
+    def delta(self, since=None):
+        response = self.client.get('/api/calendar/events/', {'since': since or self.cursor})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_full_response_carries_a_cursor(self):
+        response = self.client.get('/api/calendar/events/')
+        entries = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([entry['id'] for entry in entries], [f'event_{event.pk}' for event in self.events])
+        self.assertTrue(response['X-Calendar-Cursor'])
+
+    def test_range_longer_than_the_limit_is_refused(self):
+        start = timezone.localdate()
+        with self.settings(CALENDAR_MAX_RANGE_DAYS=30):
+            ok = self.client.get('/api/calendar/events/', {'start': start, 'end': start + timedelta(days=30)})
+            too_long = self.client.get('/api/calendar/events/', {'start': start, 'end': start + timedelta(days=31)})
+        self.assertEqual(ok.status_code, 200)
+        self.assertEqual(too_long.status_code, 400)
+        self.assertIn('30 days', too_long.data['error'])
+
+    def test_end_before_start_is_refused(self):
+        start = timezone.localdate()
+        response = self.client.get('/api/calendar/events/', {'start': start, 'end': start - timedelta(days=1)})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'End date is before start date')
+
+    def test_delta_separates_changed_moved_and_deleted_events(self):
+        changed, moved, unscheduled, deleted = self.events
+        changed.daily_order = 10
+        changed.save()
+        moved.date += timedelta(days=365)
+        moved.save()
+        unscheduled.date = None
+        unscheduled.save()
+        deleted_id = deleted.pk
+        deleted.delete()
+
+        delta = self.delta()
+        self.assertFalse(delta['reset'])
+        self.assertEqual([entry['id'] for entry in delta['events']], [f'event_{changed.pk}'])
+        self.assertEqual(delta['events'][0]['dailyOrder'], 10)
+        self.assertEqual(sorted(delta['moved']), sorted([f'event_{moved.pk}', f'event_{unscheduled.pk}']))
+        self.assertEqual(delta['deleted'], [f'event_{deleted_id}'])
+
+        # The returned cursor starts the next delta, which is empty.
+        later = self.delta(delta['cursor'])
+        self.assertEqual((later['events'], later['moved'], later['deleted']), ([], [], []))
+
+    def test_client_rename_resends_its_events(self):
+        client = self.work_order.client
+        client.name = 'Renamed Gallery'
+        client.save()
+
+        delta = self.delta()
+        self.assertEqual(len(delta['events']), 4)
+        self.assertTrue(all(entry['title'].endswith('Renamed Gallery') for entry in delta['events']))
+
+    def test_cursor_older_than_tombstone_retention_resets(self):
+        with self.settings(CALENDAR_TOMBSTONE_RETENTION_DAYS=1):
+            since = (timezone.now() - timedelta(days=2)).isoformat()
+            delta = self.delta(since)
+        self.assertTrue(delta['reset'])
+        self.assertEqual(len(delta['events']), 4)
+
+    def test_cursor_without_utc_offset_is_rejected(self):
+        response = self.client.get('/api/calendar/events/', {'since': '2026-01-01T00:00:00'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_prune_keeps_recent_tombstones(self):
+        _, recent = EventTombstone.objects.bulk_create([
+            EventTombstone(event_id=1, deleted_at=timezone.now() - timedelta(days=31)),
+            EventTombstone(event_id=2),
+        ])
+        with self.settings(CALENDAR_TOMBSTONE_RETENTION_DAYS=30):
+            call_command('prune_event_tombstones', stdout=StringIO())
+        self.assertEqual(list(EventTombstone.objects.values_list('pk', flat=True)), [recent.pk])
@@ -1,8 +1,17 @@
+import json
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from workorders.models import Event
+from clients.models import Client
+from workorders.models import Event, EventTombstone, WorkOrder
 
 COLORS = [
     "#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd",
@@ -10,44 +19,165 @@ COLORS = [
 ]
 COMPLETED_COLOR = "#6c757d"
 
+EVENT_TYPE_LABELS = dict(Event.EVENT_TYPES)
+
+# Only the columns the feed renders; no model instances are built.
+CALENDAR_COLUMNS = (
+    'id', 'date', 'scheduled_time', 'daily_order', 'completed', 'event_type',
+    'work_order_id', 'work_order__status', 'work_order__client__name',
+)
+
+STREAM_CHUNK_SIZE = 500
+
+
+class InvalidRange(ValueError):
+    pass
+
+
+def parse_range(start, end):
+    """The (start, end) dates to show. Missing bounds default around today.
+
+    A window given with both bounds may span at most CALENDAR_MAX_RANGE_DAYS;
+    a longer or backwards one raises InvalidRange rather than quietly showing
+    part of it, or nothing.
+    """
+    max_span = timedelta(days=settings.CALENDAR_MAX_RANGE_DAYS)
+    start = date.fromisoformat(start[:10]) if start else None
+    end = date.fromisoformat(end[:10]) if end else None
+    if start is None and end is None:
+        start = timezone.localdate() - timedelta(days=settings.CALENDAR_DEFAULT_PAST_DAYS)
+    if start is None:
+        start = end - max_span
+    if end is None:
+        end = start + max_span
+    if end < start:
+        raise InvalidRange("End date is before start date")
+    if end - start > max_span:
+        raise InvalidRange(f"Date range is limited to {settings.CALENDAR_MAX_RANGE_DAYS} days")
+    return start, end
+
+
+def calendar_entry(row):
+    label = EVENT_TYPE_LABELS.get(row['event_type'], row['event_type'])
+    work_order_id = row['work_order_id']
+    if row['scheduled_time']:
+        start = f"{row['date'].isoformat()}T{row['scheduled_time'].strftime('%H:%M:%S')}"
+    else:
+        start = row['date'].isoformat()
+    return {
+        'id': f"event_{row['id']}",
+        'title': f"{label} - {row['work_order__client__name']}",
+        'start': start,
+        'color': COMPLETED_COLOR if row['completed'] else COLORS[work_order_id % len(COLORS)],
+        'workOrderId': work_order_id,
+        'dailyOrder': row['daily_order'],
+        'isEventCompleted': row['completed'],
+        'isWorkOrderCompleted': row['work_order__status'] == 'completed',
+        'isCompleted': row['completed'],
+    }
+
+
+def stream_json_array(rows):
+    """Yield a JSON array one chunk of STREAM_CHUNK_SIZE entries at a time."""
+    yield '['
+    batch = []
+    first = True
+    for row in rows:
+        batch.append(json.dumps(calendar_entry(row)))
+        if len(batch) >= STREAM_CHUNK_SIZE:
+            yield ('' if first else ',') + ','.join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield ('' if first else ',') + ','.join(batch)
+    yield ']'
+
+
+def parse_cursor(value):
+    # An unencoded "+" in the UTC offset arrives as a space.
+    cursor = datetime.fromisoformat(value.replace(' ', '+'))
+    if timezone.is_naive(cursor):
+        raise ValueError("cursor must include a UTC offset")
+    return cursor
+
+
+def calendar_delta(start, end, since, cursor):
+    """Events created, changed or deleted after `since`.
+
+    An event counts as changed when it, its work order or its client was
+    saved, since all three feed the calendar entry. Changed events inside
+    the window are in 'events'. Changed events that now fall outside it
+    (rescheduled elsewhere or unscheduled) still exist and are listed in
+    'moved', so the client drops them from this view only. 'deleted' holds
+    events that no longer exist at all.
+    """
+    if cursor - since > timedelta(days=settings.CALENDAR_TOMBSTONE_RETENTION_DAYS):
+        # Tombstones this old may have been pruned; send the whole window instead.
+        rows = Event.objects.filter(date__gte=start, date__lte=end).order_by(
+            'date', 'daily_order', 'scheduled_time'
+        ).values(*CALENDAR_COLUMNS)
+        return {'reset': True, 'events': [calendar_entry(row) for row in rows], 'moved': [], 'deleted': []}
+
+    # Re-send a short overlap so rows committed just after the previous cursor aren't missed.
+    since -= timedelta(seconds=settings.CALENDAR_SYNC_OVERLAP_SECONDS)
+    changed = Event.objects.filter(
+        Q(updated_at__gt=since)
+        | Q(work_order__in=WorkOrder.objects.filter(updated_at__gt=since).values('id'))
+        | Q(work_order__client__in=Client.objects.filter(updated_at__gt=since).values('id'))
+    ).order_by('date', 'daily_order', 'scheduled_time').values(*CALENDAR_COLUMNS)
+
+    events = []
+    moved = []
+    for row in changed:
+        if row['date'] and start <= row['date'] <= end:
+            events.append(calendar_entry(row))
+        else:
+            moved.append(f"event_{row['id']}")
+    tombstones = EventTombstone.objects.filter(deleted_at__gt=since).values_list('event_id', flat=True)
+    deleted = [f"event_{event_id}" for event_id in tombstones]
+    return {'reset': False, 'events': events, 'moved': moved, 'deleted': deleted}
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def calendar_events(request):
-    """Return scheduled events as calendar-compatible JSON. Supports ?start=&end= date range filtering."""
-    events = Event.objects.filter(
-        date__isnull=False
-    ).select_related('work_order__client').order_by('date', 'daily_order', 'scheduled_time')
-
-    start = request.query_params.get('start')
-    end = request.query_params.get('end')
-    if start:
-        events = events.filter(date__gte=start[:10])
-    if end:
-        events = events.filter(date__lte=end[:10])
-
-    data = []
-    for event in events:
-        wo = event.work_order
-        title = f"{event.get_event_type_display()} - {wo.client.name}"
-
-        color = COMPLETED_COLOR if event.completed else COLORS[wo.id % len(COLORS)]
-
-        if event.scheduled_time:
-            start = f"{event.date.isoformat()}T{event.scheduled_time.strftime('%H:%M:%S')}"
-        else:
-            start = event.date.isoformat()
-
-        data.append({
-            'id': f"event_{event.id}",
-            'title': title,
-            'start': start,
-            'color': color,
-            'workOrderId': wo.id,
-            'dailyOrder': event.daily_order,
-            'isEventCompleted': event.completed,
-            'isWorkOrderCompleted': wo.status == 'completed',
-            'isCompleted': event.completed,
-        })
-
-    return Response(data)
+    """Return scheduled events as calendar-compatible JSON. Supports ?start=&end= date range filtering.
+
+    Ranges longer than CALENDAR_MAX_RANGE_DAYS are refused with a 400.
+
+    The full response carries a sync cursor in the X-Calendar-Cursor header.
+    Passing it back as ?since= returns only what changed in the window since
+    then: {"reset", "events", "moved", "deleted", "cursor"}.
+    """
+    try:
+        start, end = parse_range(
+            request.query_params.get('start'),
+            request.query_params.get('end'),
+        )
+    except InvalidRange as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError:
+        return Response({'error': 'Invalid start or end date'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Taken before querying so anything saved while we read is picked up next time.
+    cursor = timezone.now()
+
+    since = request.query_params.get('since')
+    if since:
+        try:
+            since = parse_cursor(since)
+        except ValueError:
+            return Response({'error': 'Invalid since cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        delta = calendar_delta(start, end, since, cursor)
+        return Response({**delta, 'cursor': cursor.isoformat()})
+
+    rows = Event.objects.filter(
+        date__gte=start, date__lte=end
+    ).order_by('date', 'daily_order', 'scheduled_time').values(*CALENDAR_COLUMNS)
+
+    response = StreamingHttpResponse(
+        stream_json_array(rows.iterator(chunk_size=STREAM_CHUNK_SIZE)),
+        content_type='application/json',
+    )
+    response['X-Calendar-Cursor'] = cursor.isoformat()
+    return response
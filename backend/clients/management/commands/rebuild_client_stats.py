@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from clients.stats import refresh_client_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute each client's last_activity and work_order_count from its work orders."
+
+    def handle(self, *args, **options):
+        updated = refresh_client_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {updated} clients."))
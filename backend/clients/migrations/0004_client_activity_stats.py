@@ -0,0 +1,54 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:59
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_stats(apps, schema_editor):
+    Client = apps.get_model('clients', 'Client')
+    WorkOrder = apps.get_model('workorders', 'WorkOrder')
+    per_client = WorkOrder.objects.filter(client=OuterRef('pk')).order_by().values('client')
+    Client.objects.update(
+        last_activity=Subquery(per_client.annotate(latest=Max('updated_at')).values('latest')),
+        work_order_count=Coalesce(Subquery(per_client.annotate(n=Count('id')).values('n')), 0),
+    )
+
+
+# SQLite rejects NULLS LAST in index definitions, so this one is PostgreSQL-only.
+def create_activity_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX client_activity_name_idx ON clients_client "
+        "(last_activity DESC NULLS LAST, name)"
+    )
+
+
+def drop_activity_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS client_activity_name_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0003_client_updated_at'),
+        ('workorders', '0009_workorder_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='client',
+            name='work_order_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(create_activity_index, drop_activity_index),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
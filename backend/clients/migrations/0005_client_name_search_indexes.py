@@ -0,0 +1,37 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:02
+
+from django.db import migrations
+
+
+# PostgreSQL-only, like the other search indexes: a pattern-ops btree on
+# UPPER(name) for typeahead prefix matches and a trigram GIN index for fuzzy ones.
+def create_name_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX client_name_upper_prefix_idx ON clients_client "
+        "(UPPER(name) text_pattern_ops)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX client_name_trgm_idx ON clients_client USING gin (name gin_trgm_ops)"
+    )
+
+
+def drop_name_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS client_name_upper_prefix_idx")
+    schema_editor.execute("DROP INDEX IF EXISTS client_name_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0004_client_activity_stats'),
+        # pg_trgm is installed there.
+        ('workorders', '0009_workorder_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_name_indexes, drop_name_indexes),
+    ]
@@ -7,6 +7,14 @@ class Client(models.Model):
     phone = models.CharField(max_length=50, blank=True, null=True)
     address = models.CharField(max_length=255, blank=True, null=True)
     billing_address = models.CharField(max_length=255, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Maintained from the client's work orders by clients.stats; rebuild with
+    # `manage.py rebuild_client_stats`. The list ordering (last_activity DESC
+    # NULLS LAST, name) is backed by client_activity_name_idx, created in
+    # migration 0004 on PostgreSQL only.
+    last_activity = models.DateTimeField(blank=True, null=True, editable=False)
+    work_order_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
@@ -3,11 +3,10 @@ from .models import Client
 
 
 class ClientSerializer(serializers.ModelSerializer):
-    work_order_count = serializers.IntegerField(read_only=True)
-
     class Meta:
         model = Client
         fields = ['id', 'name', 'email', 'phone', 'address', 'billing_address', 'work_order_count']
+        read_only_fields = ['work_order_count']
 
 
 class ClientListSerializer(serializers.ModelSerializer):
@@ -0,0 +1,27 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from django_project.transactions import on_commit_batch
+from workorders.models import WorkOrder
+
+from .models import Client
+from .stats import refresh_client_stats
+from .typeahead import invalidate_hot_clients
+
+
+def refresh_stats(client_id_sets):
+    refresh_client_stats(set().union(*client_id_sets))
+
+
+@receiver(post_save, sender=WorkOrder)
+@receiver(post_delete, sender=WorkOrder)
+def refresh_work_order_client_stats(sender, instance, **kwargs):
+    client_ids = {instance.client_id, getattr(instance, '_loaded_client_id', None)}
+    client_ids.discard(None)
+    on_commit_batch(refresh_stats, client_ids)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_client_typeahead(sender, **kwargs):
+    invalidate_hot_clients()
@@ -0,0 +1,21 @@
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Client
+
+
+def refresh_client_stats(client_ids=None):
+    """Recompute last_activity and work_order_count for the given clients, or for all of them.
+
+    Each client is recomputed from its own work orders through the
+    client_id index, so the cost tracks that client's history rather than
+    the whole work order table.
+    """
+    from workorders.models import WorkOrder
+
+    per_client = WorkOrder.objects.filter(client=OuterRef('pk')).order_by().values('client')
+    clients = Client.objects.all() if client_ids is None else Client.objects.filter(pk__in=client_ids)
+    return clients.update(
+        last_activity=Subquery(per_client.annotate(latest=Max('updated_at')).values('latest')),
+        work_order_count=Coalesce(Subquery(per_client.annotate(n=Count('id')).values('n')), 0),
+    )
@@ -1,3 +1,213 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import Count, Max
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from django_project.testing import (
+    SEARCH_REFRESH,
+    QueryBudgetTestCase,
+    make_client,
+    make_work_order,
+    without_throttling,
+)
+from invoices.models import Invoice
+from workorders.models import WorkOrder
+
+from .models import Client
+from .typeahead import invalidate_hot_clients
+from .views import TypeaheadRateThrottle
+
+
+class ClientQueryBudgetTests(QueryBudgetTestCase):
+    def add_clients(self, rows):
+        return Client.objects.bulk_create(Client(name=f"Gallery {i}", email=f"g{i}@example.com") for i in range(rows))
+
+    def make_client_with_history(self, rows):
+        """A client with `rows` work orders, each with an event, note, attachment and invoice."""
+        client = make_client()
+        for _ in range(rows):
+            work_order = make_work_order(client, events=1, notes=1, attachments=1)
+            Invoice.objects.create(
+                client=client, work_order=work_order, amount=Decimal('100.00'), date_created=date(2026, 1, 15),
+            )
+        return client
+
+    def test_list(self):
+        self.assertQueryBudget(2, self.add_clients, lambda _: self.client.get('/api/clients/'))
+
+    def test_search(self):
+        self.assertQueryBudget(2, self.add_clients, lambda _: self.client.get('/api/clients/', {'search': 'gallery'}))
+
+    def test_retrieve(self):
+        self.assertQueryBudget(
+            1, self.make_client_with_history, lambda client: self.client.get(f'/api/clients/{client.pk}/'),
+        )
+
+    def test_create(self):
+        self.assertQueryBudget(
+            1, self.add_clients,
+            lambda _: self.client.post('/api/clients/', {'name': 'New Gallery'}, format='json'),
+            status_code=201,
+        )
+
+    def test_update(self):
+        self.assertQueryBudget(
+            2 + 2 * SEARCH_REFRESH, self.make_client_with_history,
+            lambda client: self.client.patch(f'/api/clients/{client.pk}/', {'phone': '631-555-0100'}, format='json'),
+        )
+
+    def test_destroy(self):
+        self.assertQueryBudget(
+            22 + SEARCH_REFRESH, self.make_client_with_history,
+            lambda client: self.client.delete(f'/api/clients/{client.pk}/'), status_code=204,
+        )
+
+    def test_typeahead(self):
+        def make_rows(rows):
+            # bulk_create skips the signal that drops the cached hot list.
+            invalidate_hot_clients()
+            return self.add_clients(rows)
+
+        # No prefix matches, so both runs load the hot list and fall through to the fuzzy query.
+        self.assertQueryBudget(
+            2, make_rows, lambda _: self.client.get('/api/clients/typeahead/', {'q': 'allery'}),
+        )
+
+
+@without_throttling
+class ClientStatsTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('office', password='office-pass'))
+        self.galleries = [make_client(name='North Gallery'), make_client(name='South Gallery')]
+
+    def stored(self):
+        return {
+            client.pk: (client.last_activity, client.work_order_count)
+            for client in Client.objects.all()
+        }
+
+    def assertStatsFresh(self):
+        fresh = {
+            client.pk: (client.latest, client.n)
+            for client in Client.objects.annotate(latest=Max('work_orders__updated_at'), n=Count('work_orders'))
+        }
+        self.assertEqual(self.stored(), fresh)
+
+    def test_stats_follow_work_order_changes(self):
+        north, south = self.galleries
+        # Stats are refreshed when the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            work_orders = [make_work_order(north), make_work_order(north), make_work_order(south)]
+        stored = self.stored()
+        self.assertEqual((stored[north.pk][1], stored[south.pk][1]), (2, 1))
+        self.assertStatsFresh()
+
+        changes = {
+            'status change': lambda: self.client.post(
+                f'/api/workorders/{work_orders[0].pk}/change_status/', {'status': 'completed'}, format='json',
+            ),
+            'edited': lambda: self.client.patch(
+                f'/api/workorders/{work_orders[0].pk}/', {'job_description': 'Rehang'}, format='json',
+            ),
+            'moved to another client': lambda: self.client.patch(
+                f'/api/workorders/{work_orders[1].pk}/', {'client': south.pk}, format='json',
+            ),
+            'deleted': lambda: self.client.delete(f'/api/workorders/{work_orders[2].pk}/'),
+        }
+        for label, change in changes.items():
+            with self.subTest(label):
+                before = self.stored()
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.assertLess(change().status_code, 300)
+                self.assertNotEqual(self.stored(), before)
+                self.assertStatsFresh()
+        self.assertEqual(self.stored()[south.pk][1], 1)
+
+    def test_stats_follow_invoicing(self):
+        north, _ = self.galleries
+        with self.captureOnCommitCallbacks(execute=True):
+            work_order = make_work_order(north, status='completed', completed_at=timezone.now())
+        before = self.stored()[north.pk][0]
+
+        response = self.client.post('/api/invoices/invoice_completed/', {}, format='json')
+        self.assertEqual(response.data['created'], 1)
+        work_order.refresh_from_db()
+        self.assertTrue(work_order.invoiced)
+        self.assertGreater(self.stored()[north.pk][0], before)
+        self.assertStatsFresh()
+
+    def test_rebuild_command_repairs_corrupted_stats(self):
+        north, south = self.galleries
+        with self.captureOnCommitCallbacks(execute=True):
+            make_work_order(north)
+        Client.objects.update(last_activity=None, work_order_count=99)
+        WorkOrder.objects.filter(client=north).update(updated_at=timezone.now())
+
+        out = StringIO()
+        call_command('rebuild_client_stats', stdout=out)
+        self.assertIn('Rebuilt stats for 2 clients', out.getvalue())
+        self.assertStatsFresh()
+        self.assertEqual(self.stored()[south.pk], (None, 0))
+
+
+@without_throttling
+class TypeaheadTests(APITestCase):
+    def setUp(self):
+        invalidate_hot_clients()
+        self.addCleanup(invalidate_hot_clients)
+        self.client.force_authenticate(CustomUser.objects.create_user('office', password='office-pass'))
+        now = timezone.now()
+        for name, days_idle in [('Gallery North', 5), ('Gallery South', 1), ('Alpha Gallery', 0), ('Framers', 0)]:
+            Client.objects.create(name=name)
+            Client.objects.filter(name=name).update(last_activity=now - timedelta(days=days_idle))
+
+    def names(self, q, **params):
+        response = self.client.get('/api/clients/typeahead/', {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['name'] for row in response.data]
+
+    def test_prefix_matches_rank_before_fuzzy_matches(self):
+        for seconds in (60, 0):
+            with self.subTest(cache_seconds=seconds), self.settings(CLIENT_TYPEAHEAD_CACHE_SECONDS=seconds):
+                # Prefix matches by recent activity, then the name that only contains the term.
+                self.assertEqual(self.names('gallery'), ['Gallery South', 'Gallery North', 'Alpha Gallery'])
+                self.assertEqual(self.names('gallery', limit=1), ['Gallery South'])
+
+    def test_short_terms_only_match_prefixes(self):
+        self.assertEqual(self.names('al'), ['Alpha Gallery'])
+
+    def test_saving_or_deleting_a_client_clears_the_hot_list(self):
+        # Two letters only match prefixes, which come from the hot list.
+        self.assertEqual(self.names('ga'), ['Gallery South', 'Gallery North'])
+        # bulk_create sends no signal, so the cached list doesn't know about it yet.
+        Client.objects.bulk_create([Client(name='Gallery East')])
+        self.assertEqual(self.names('ga'), ['Gallery South', 'Gallery North'])
+
+        Client.objects.get(name='Framers').save()
+        self.assertEqual(self.names('ga'), ['Gallery South', 'Gallery North', 'Gallery East'])
+
+        Client.objects.get(name='Gallery South').delete()
+        self.assertEqual(self.names('ga'), ['Gallery North', 'Gallery East'])
+
+
+class TypeaheadThrottleTests(APITestCase):
+    def setUp(self):
+        # Throttle history lives in the default cache.
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_authenticate(CustomUser.objects.create_user('office', password='office-pass'))
+
+    @mock.patch('rest_framework.throttling.UserRateThrottle.rate', '2/minute', create=True)
+    @mock.patch.object(TypeaheadRateThrottle, 'rate', '3/minute', create=True)
+    def test_typeahead_has_its_own_budget(self):
+        statuses = [self.client.get('/api/clients/typeahead/', {'q': 'gal'}).status_code for _ in range(4)]
+        # More than the user rate gets through, up to the typeahead rate.
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        self.assertEqual(self.client.get('/api/clients/').status_code, 200)
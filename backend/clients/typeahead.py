@@ -0,0 +1,96 @@
+import time
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Upper
+
+from .models import Client
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Trigram matching needs a few characters before it says anything useful.
+FUZZY_MIN_LENGTH = 3
+
+ACTIVITY_ORDER = (F('last_activity').desc(nulls_last=True), 'name')
+
+# (loaded_at, rows, complete): the most active clients as (id, name, NAME)
+# tuples in list order. `complete` is True when every client fit.
+_hot = None
+
+
+def invalidate_hot_clients():
+    global _hot
+    _hot = None
+
+
+def hot_clients():
+    """The CLIENT_TYPEAHEAD_CACHE_SIZE most active clients, cached in-process.
+
+    Saving or deleting a client in this process drops the cache; other
+    processes pick the change up when CLIENT_TYPEAHEAD_CACHE_SECONDS runs out.
+    """
+    global _hot
+    if settings.CLIENT_TYPEAHEAD_CACHE_SECONDS <= 0:
+        return None
+    hot = _hot
+    if hot is None or time.monotonic() - hot[0] > settings.CLIENT_TYPEAHEAD_CACHE_SECONDS:
+        size = settings.CLIENT_TYPEAHEAD_CACHE_SIZE
+        rows = [
+            (pk, name, name.upper())
+            for pk, name in Client.objects.order_by(*ACTIVITY_ORDER).values_list('id', 'name')[:size + 1]
+        ]
+        hot = _hot = (time.monotonic(), rows[:size], len(rows) <= size)
+    return hot
+
+
+def _prefix_matches(term, limit):
+    hot = hot_clients()
+    if hot is not None:
+        _, rows, complete = hot
+        prefix = term.upper()
+        matches = [(pk, name) for pk, name, upper in rows if upper.startswith(prefix)][:limit]
+        # The cache holds the head of the same ordering the query uses, so a
+        # full page from it is exactly what the database would return.
+        if complete or len(matches) == limit:
+            return matches
+    return list(
+        Client.objects.annotate(name_upper=Upper('name'))
+        .filter(name_upper__startswith=term.upper())
+        .order_by(*ACTIVITY_ORDER)
+        .values_list('id', 'name')[:limit]
+    )
+
+
+def _fuzzy_matches(term, limit, exclude):
+    clients = Client.objects.exclude(pk__in=exclude)
+    if connection.vendor == 'postgresql':
+        clients = clients.filter(name__trigram_similar=term).annotate(
+            similarity=TrigramSimilarity('name', term),
+        ).order_by('-similarity', *ACTIVITY_ORDER)
+    else:
+        clients = clients.filter(name__icontains=term).order_by(*ACTIVITY_ORDER)
+    return list(clients.values_list('id', 'name')[:limit])
+
+
+def typeahead(term, limit=DEFAULT_LIMIT):
+    """Up to `limit` (id, name) pairs for `term`.
+
+    Names starting with the term come first, most recently active first.
+    Remaining slots go to fuzzy matches (pg_trgm similarity on PostgreSQL,
+    substring elsewhere), so typos and words later in the name still hit.
+    An empty term returns the most active clients.
+    """
+    term = term.strip()
+    if not term:
+        hot = hot_clients()
+        if hot is not None and (hot[2] or len(hot[1]) >= limit):
+            return [(pk, name) for pk, name, _ in hot[1][:limit]]
+        return list(Client.objects.order_by(*ACTIVITY_ORDER).values_list('id', 'name')[:limit])
+
+    matches = _prefix_matches(term, limit)
+    if len(matches) < limit and len(term) >= FUZZY_MIN_LENGTH:
+        matches += _fuzzy_matches(term, limit - len(matches), [pk for pk, _ in matches])
+    return matches
@@ -1,7 +1,16 @@
-from django.db.models import Count, F, Max
+from django.db.models import F
 from rest_framework import viewsets, filters
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.throttling import UserRateThrottle
 from .models import Client
-from .serializers import ClientSerializer
+from .serializers import ClientSerializer, ClientListSerializer
+from .typeahead import DEFAULT_LIMIT, MAX_LIMIT, typeahead
+
+
+class TypeaheadRateThrottle(UserRateThrottle):
+    # Typeahead fires on keystrokes, so it gets its own, larger budget.
+    scope = 'typeahead'
 
 
 class ClientViewSet(viewsets.ModelViewSet):
@@ -11,7 +20,16 @@ class ClientViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'email']
 
     def get_queryset(self):
-        return Client.objects.annotate(
-            last_activity=Max('work_orders__updated_at'),
-            work_order_count=Count('work_orders'),
-        ).order_by(F('last_activity').desc(nulls_last=True), 'name')
+        # last_activity and work_order_count are maintained columns (see clients.stats).
+        return Client.objects.order_by(F('last_activity').desc(nulls_last=True), 'name')
+
+    @action(detail=False, methods=['get'], throttle_classes=[TypeaheadRateThrottle])
+    def typeahead(self, request):
+        """Top matches for ?q= as [{id, name}]. Optional ?limit= (default 10, max 50)."""
+        try:
+            limit = min(max(int(request.query_params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        matches = typeahead(request.query_params.get('q', ''), limit)
+        clients = [Client(id=pk, name=name) for pk, name in matches]
+        return Response(ClientListSerializer(clients, many=True).data)
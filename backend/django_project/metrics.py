@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# Request metrics are kept in memory per process. Each gunicorn worker also
+# writes a snapshot to METRICS_DIR every METRICS_FLUSH_SECONDS, so whichever
+# worker answers /metrics can report the totals for all of them.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+HELP = {
+    'http_requests_total': ('counter', 'Requests by route, action, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Time spent producing the response.'),
+    'db_queries_per_request': ('histogram', 'SQL queries issued per request.'),
+    'db_query_duration_seconds_total': ('counter', 'Total time spent in SQL.'),
+    'db_repeated_query_requests_total': (
+        'counter', 'Requests that ran one query shape at least METRICS_REPEATED_QUERY_THRESHOLD times (likely N+1).',
+    ),
+    'pdf_render_queue_depth': ('gauge', 'PDF render jobs submitted and not yet finished.'),
+}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        # (name, labels) -> [per-bucket counts..., sum, count]
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[name, labels] += value
+
+    def observe(self, name, labels, value, buckets):
+        with self.lock:
+            series = self.histograms.get((name, labels))
+            if series is None:
+                series = self.histograms[name, labels] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(series)] for (name, labels), series in self.histograms.items()],
+            }
+
+
+registry = Registry()
+_last_flush = 0.0
+_warned = set()
+
+
+def _snapshot_dir():
+    return Path(settings.METRICS_DIR) if settings.METRICS_DIR else None
+
+
+def _started(pid):
+    """When process `pid` started (clock ticks after boot), or None where /proc can't say.
+
+    A snapshot records its writer's start time, so a later process that is
+    given the same pid isn't mistaken for the worker that wrote it.
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Fields after the parenthesised command name, which may itself hold spaces; starttime is field 22.
+    return int(stat[stat.rindex(')') + 2:].split()[19])
+
+
+def flush(force=False):
+    """Write this process's snapshot for other workers to merge, at most every METRICS_FLUSH_SECONDS."""
+    global _last_flush
+    directory = _snapshot_dir()
+    now = time.monotonic()
+    if directory is None or (not force and now - _last_flush < settings.METRICS_FLUSH_SECONDS):
+        return
+    _last_flush = now
+    directory.mkdir(parents=True, exist_ok=True)
+    pid = os.getpid()
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'started': _started(pid), **registry.snapshot()}, f)
+    os.replace(tmp, directory / f"{pid}.json")
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _load_snapshot(path):
+    """The snapshot at `path` if the worker that wrote it is still running, else None."""
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    pid = int(path.stem)
+    if not _alive(pid) or snapshot.get('started') != _started(pid):
+        # Its worker exited, or the pid now belongs to another process.
+        path.unlink(missing_ok=True)
+        return None
+    return snapshot
+
+
+def collect():
+    """Merge the snapshots of every live worker (or just this process without METRICS_DIR)."""
+    directory = _snapshot_dir()
+    snapshots = []
+    if directory is None:
+        snapshots.append(registry.snapshot())
+    else:
+        flush(force=True)
+        for path in directory.glob('*.json'):
+            if not path.stem.isdigit():
+                path.unlink(missing_ok=True)
+                continue
+            snapshot = _load_snapshot(path)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+
+    counters = Counter()
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, series in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(series))
+            for i, value in enumerate(series):
+                merged[i] += value
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def render():
+    """Prometheus text exposition of the merged metrics."""
+    from pdfs.jobs import queue_depth
+
+    counters, histograms = collect()
+    buckets_for = {
+        'http_request_duration_seconds': LATENCY_BUCKETS,
+        'db_queries_per_request': QUERY_COUNT_BUCKETS,
+    }
+    lines = []
+    for name, (kind, help_text) in HELP.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'gauge':
+            # Only this process's render queue is visible; it's the one a request here would join.
+            lines.append(f"{name} {queue_depth()}")
+        elif kind == 'counter':
+            for (series_name, labels), value in sorted(counters.items()):
+                if series_name == name:
+                    lines.append(f"{name}{_labels(labels)} {value:g}")
+        else:
+            for (series_name, labels), series in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets_for[name], series):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {series[-2]:g}")
+                lines.append(f"{name}_count{_labels(labels)} {series[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+class QueryRecorder:
+    """connection.execute_wrapper hook counting queries, SQL time and repeats of each statement shape."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            # Parameters are placeholders in `sql`, so one shape run per row
+            # shows up as one key with a high count.
+            self.shapes[sql] += 1
+
+
+class MetricsMiddleware:
+    """Record latency, status, SQL count and SQL time per resolved route and viewset action."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        if match is not None and match.url_name == 'metrics':
+            return response
+        if response.streaming:
+            # Streamed bodies (calendar feed, PDF exports) run their queries while
+            # being sent, so record once the stream is exhausted.
+            response.streaming_content = self._stream(response.streaming_content, request, response, recorder, start)
+        else:
+            self._record(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    def _stream(self, content, request, response, recorder, start):
+        try:
+            with connection.execute_wrapper(recorder):
+                yield from content
+        finally:
+            self._record(request, response, recorder, time.perf_counter() - start)
+
+    def _record(self, request, response, recorder, elapsed):
+        match = request.resolver_match
+        route = (match.view_name or match.route) if match else 'unmatched'
+        action = getattr(request, '_metrics_action', '') or ''
+        labels = (('route', route), ('action', action), ('method', request.method))
+
+        registry.inc('http_requests_total', labels + (('status', str(response.status_code)),))
+        registry.observe('http_request_duration_seconds', labels, elapsed, LATENCY_BUCKETS)
+        registry.observe('db_queries_per_request', labels, recorder.count, QUERY_COUNT_BUCKETS)
+        registry.inc('db_query_duration_seconds_total', labels, recorder.duration)
+
+        if recorder.shapes:
+            shape, repeats = recorder.shapes.most_common(1)[0]
+            if repeats >= settings.METRICS_REPEATED_QUERY_THRESHOLD:
+                registry.inc('db_repeated_query_requests_total', labels)
+                if (route, shape) not in _warned:
+                    _warned.add((route, shape))
+                    logger.warning("Likely N+1 on %s %s (%s): query ran %d times: %s",
+                                   request.method, route, action, repeats, shape[:500])
+
+        flush()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # DRF viewsets expose their method -> action mapping on the view function.
+        actions = getattr(view_func, 'actions', None)
+        if actions:
+            request._metrics_action = actions.get(request.method.lower(), '')
+        return None
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint. Requires `Authorization: Bearer <METRICS_TOKEN>` when a token is set."""
+    token = settings.METRICS_TOKEN
+    if token:
+        if request.headers.get('Authorization') != f"Bearer {token}":
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        raise Http404
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,115 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination on a composite key such as ('-created_at', 'id').
+
+    The cursor holds the key of the last row served and the next page is
+    fetched with a WHERE on that key, so every page costs the same no matter
+    how deep it is and no COUNT(*) is run. The key fields must be non-null
+    and, taken together, unique. Only forward ("next") links are provided.
+    """
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering, page_size):
+        self.ordering = ordering
+        self.page_size = page_size
+
+    def _fields(self, model):
+        return [
+            (model._meta.get_field(name.lstrip('-')), name.startswith('-'))
+            for name in self.ordering
+        ]
+
+    def encode_cursor(self, row):
+        values = [field.value_to_string(row) for field, _ in self._fields(type(row))]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, model, token):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(token.encode()))
+            fields = self._fields(model)
+            if len(values) != len(fields):
+                raise ValueError
+            return [field.to_python(value) for (field, _), value in zip(fields, values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def after(self, model, values):
+        """Rows strictly after `values` in key order: (a < x) OR (a = x AND b > y) OR ..."""
+        condition = Q()
+        equal = Q()
+        for (field, descending), value in zip(self._fields(model), values):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{field.attname}__{lookup}': value})
+            equal &= Q(**{field.attname: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        queryset = queryset.order_by(*self.ordering)
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            queryset = queryset.filter(self.after(queryset.model, self.decode_cursor(queryset.model, token)))
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, OptInKeysetPagination.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class OptInKeysetPagination(PageNumberPagination):
+    """Page-number pagination unless the client asks for keyset mode.
+
+    Views opt in by declaring `keyset_ordering`; clients then pass
+    ?pagination=cursor for the first page and follow the `next` link, which
+    carries a ?cursor= token. Keyset pages always come in keyset_ordering,
+    so asking for another ?ordering= as well is a 400 rather than being
+    silently ignored.
+    """
+
+    mode_query_param = 'pagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'keyset_ordering', None)
+        params = request.query_params
+        self.keyset = None
+        if ordering and (params.get(self.mode_query_param) == 'cursor' or KeysetPagination.cursor_query_param in params):
+            if params.get(api_settings.ORDERING_PARAM):
+                raise ValidationError({
+                    api_settings.ORDERING_PARAM: (
+                        f"Cursor pagination is ordered by {', '.join(ordering)}; "
+                        "drop ordering or use page numbers."
+                    ),
+                })
+            self.keyset = KeysetPagination(ordering, self.get_page_size(request))
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
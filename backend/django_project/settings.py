@@ -2,6 +2,7 @@ from environ import Env
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
@@ -40,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Third-party
     'rest_framework',
@@ -55,9 +57,11 @@ INSTALLED_APPS = [
     'clients',
     'invoices',
     'calendar_app',
+    'pdfs',
 ]
 
 MIDDLEWARE = [
+    'django_project.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -134,11 +138,28 @@ cloudinary.config(
     resource_type='auto'
 )
 
+# Set FILE_STORAGE_BACKEND=django.core.files.storage.FileSystemStorage to keep
+# uploads under MEDIA_ROOT instead of Cloudinary (local development, tests).
+FILE_STORAGE_BACKEND = env("FILE_STORAGE_BACKEND", default="workorders.storage.CustomCloudinaryStorage")
+
+# Job attachments are deduplicated by content on top of the same backend.
+ATTACHMENT_STORAGE = {
+    "BACKEND": "workorders.storage.DeduplicatingStorage",
+    "OPTIONS": {"backend": FILE_STORAGE_BACKEND},
+}
+# Django's default upload handlers, plus a SHA-256 of each file taken as it
+# streams in, so deduplication doesn't read the upload a second time.
+FILE_UPLOAD_HANDLERS = [
+    "workorders.storage.HashingMemoryFileUploadHandler",
+    "workorders.storage.HashingTemporaryFileUploadHandler",
+]
+
 if not DEBUG:
     STORAGES = {
         "default": {
-            "BACKEND": "workorders.storage.CustomCloudinaryStorage",
+            "BACKEND": FILE_STORAGE_BACKEND,
         },
+        "attachments": ATTACHMENT_STORAGE,
         "staticfiles": {
             "BACKEND": "whitenoise.storage.CompressedStaticFilesStorage",
         },
@@ -146,8 +167,9 @@ if not DEBUG:
 else:
     STORAGES = {
         "default": {
-            "BACKEND": "workorders.storage.CustomCloudinaryStorage",
+            "BACKEND": FILE_STORAGE_BACKEND,
         },
+        "attachments": ATTACHMENT_STORAGE,
         "staticfiles": {
             "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
         },
@@ -155,6 +177,94 @@ else:
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Rendered PDFs are cached on disk, keyed by the template and the rows it reads.
+# Set PDF_CACHE_MAX_BYTES=0 to disable the cache.
+PDF_CACHE_DIR = env("PDF_CACHE_DIR", default=str(BASE_DIR / "pdf_cache"))
+PDF_CACHE_MAX_BYTES = env.int("PDF_CACHE_MAX_BYTES", default=256 * 1024 * 1024)
+
+# Process pool for ?mode=async PDF renders. The pool size and the queue depth
+# both apply per gunicorn worker, not across the server.
+PDF_RENDER_WORKERS = env.int("PDF_RENDER_WORKERS", default=2)
+PDF_RENDER_QUEUE_DEPTH = env.int("PDF_RENDER_QUEUE_DEPTH", default=20)
+PDF_RENDER_JOB_TIMEOUT = env.int("PDF_RENDER_JOB_TIMEOUT", default=300)
+PDF_EXPORT_MAX_FILES = env.int("PDF_EXPORT_MAX_FILES", default=500)
+
+# Calendar feed window. Requests spanning more days are refused; requests with
+# no range get CALENDAR_DEFAULT_PAST_DAYS back from today onwards.
+CALENDAR_MAX_RANGE_DAYS = env.int("CALENDAR_MAX_RANGE_DAYS", default=100)
+CALENDAR_DEFAULT_PAST_DAYS = env.int("CALENDAR_DEFAULT_PAST_DAYS", default=31)
+# Delta sync: deleted-event tombstones are kept this long (prune_event_tombstones);
+# older cursors get a full reset. The overlap re-sends rows near the cursor boundary.
+CALENDAR_TOMBSTONE_RETENTION_DAYS = env.int("CALENDAR_TOMBSTONE_RETENTION_DAYS", default=30)
+CALENDAR_SYNC_OVERLAP_SECONDS = env.int("CALENDAR_SYNC_OVERLAP_SECONDS", default=5)
+
+# Route proposals (events/optimize_route/). ROUTE_DISTANCE_MATRIX is a dotted path
+# to a function taking [(lat, lon), ...] and returning a square cost matrix.
+# ROUTE_DEPOT is the "lat,lon" each day starts from; leave empty to start at any stop.
+ROUTE_DISTANCE_MATRIX = env("ROUTE_DISTANCE_MATRIX", default="workorders.routing.haversine_matrix")
+ROUTE_DEPOT = env("ROUTE_DEPOT", default="")
+
+# Backlog scheduler (events/schedule_backlog/). Each working day has
+# SCHEDULER_CREW_HOURS to fill and an event takes SCHEDULER_EVENT_HOURS for its
+# type, travel included. SCHEDULER_DAILY_LIMITS optionally caps a type per day.
+# Stops within SCHEDULER_CLUSTER_RADIUS (ROUTE_DISTANCE_MATRIX units) of a day's
+# other stops are batched onto that day, but never ahead of an earlier stage of
+# their own work order (pickup, then wrap, then delivery).
+SCHEDULER_HORIZON_DAYS = env.int("SCHEDULER_HORIZON_DAYS", default=14)
+SCHEDULER_WEEKDAYS = env.list("SCHEDULER_WEEKDAYS", cast=int, default=[0, 1, 2, 3, 4])
+SCHEDULER_CREW_HOURS = env.float("SCHEDULER_CREW_HOURS", default=8.0)
+SCHEDULER_EVENT_HOURS = {
+    'pickup': 1.5,
+    'pickup_wrap': 2.5,
+    'wrap': 1.5,
+    'install': 2.5,
+    'deliver_install': 3.0,
+    'dropoff': 1.0,
+}
+SCHEDULER_DAILY_LIMITS = {}
+SCHEDULER_CLUSTER_RADIUS = env.float("SCHEDULER_CLUSTER_RADIUS", default=15.0)
+
+# Client typeahead keeps the most active clients in memory per process. Set the
+# TTL to 0 to always query the database.
+CLIENT_TYPEAHEAD_CACHE_SECONDS = env.int("CLIENT_TYPEAHEAD_CACHE_SECONDS", default=60)
+CLIENT_TYPEAHEAD_CACHE_SIZE = env.int("CLIENT_TYPEAHEAD_CACHE_SIZE", default=2000)
+
+# Attachment thumbnails are rendered off the request path, one bounding box
+# per size name. The smallest also fills JobAttachment.thumbnail.
+THUMBNAIL_SIZES = {
+    "thumb": (200, 200),
+    "display": (800, 600),
+}
+THUMBNAIL_JPEG_QUALITY = env.int("THUMBNAIL_JPEG_QUALITY", default=85)
+THUMBNAIL_WORKERS = env.int("THUMBNAIL_WORKERS", default=2)
+THUMBNAIL_MAX_ATTEMPTS = env.int("THUMBNAIL_MAX_ATTEMPTS", default=3)
+
+# Attachment size cap, for both single-request and chunked uploads. Chunked
+# uploads are streamed to ATTACHMENT_UPLOAD_TEMP_DIR and never held in memory;
+# unfinished ones are pruned after ATTACHMENT_UPLOAD_SESSION_TTL_HOURS. Point it
+# at persistent storage if partial uploads must survive a reboot.
+ATTACHMENT_MAX_UPLOAD_SIZE = env.int("ATTACHMENT_MAX_UPLOAD_SIZE", default=10 * 1024 * 1024)
+ATTACHMENT_UPLOAD_CHUNK_SIZE = env.int("ATTACHMENT_UPLOAD_CHUNK_SIZE", default=5 * 1024 * 1024)
+ATTACHMENT_UPLOAD_TEMP_DIR = env(
+    "ATTACHMENT_UPLOAD_TEMP_DIR", default=os.path.join(tempfile.gettempdir(), "django_project_uploads"),
+)
+ATTACHMENT_UPLOAD_SESSION_TTL_HOURS = env.int("ATTACHMENT_UPLOAD_SESSION_TTL_HOURS", default=24)
+
+# Batch uploads send files to storage on this many threads per request.
+ATTACHMENT_UPLOAD_WORKERS = env.int("ATTACHMENT_UPLOAD_WORKERS", default=4)
+ATTACHMENT_BATCH_MAX_FILES = env.int("ATTACHMENT_BATCH_MAX_FILES", default=50)
+
+# Per-route latency and SQL metrics, served in Prometheus format at /metrics.
+# Workers share their counts through snapshot files in METRICS_DIR (empty to
+# keep them in-process); give each deployment on a host its own directory.
+# Outside DEBUG, /metrics needs METRICS_TOKEN as a bearer token and is
+# disabled when no token is set.
+METRICS_ENABLED = env.bool("METRICS_ENABLED", default=True)
+METRICS_DIR = env("METRICS_DIR", default=os.path.join(tempfile.gettempdir(), "django_project_metrics"))
+METRICS_FLUSH_SECONDS = env.int("METRICS_FLUSH_SECONDS", default=5)
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+METRICS_REPEATED_QUERY_THRESHOLD = env.int("METRICS_REPEATED_QUERY_THRESHOLD", default=10)
+
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = "/"
 
@@ -167,7 +277,7 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'django_project.pagination.OptInKeysetPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_THROTTLE_CLASSES': [
         'rest_framework.throttling.AnonRateThrottle',
@@ -176,6 +286,7 @@ REST_FRAMEWORK = {
     'DEFAULT_THROTTLE_RATES': {
         'anon': '5/minute',
         'user': '60/minute',
+        'typeahead': '600/minute',
     },
 }
 
@@ -192,6 +303,7 @@ CORS_ALLOWED_ORIGINS = env.list("CORS_ALLOWED_ORIGINS", default=[
     "http://localhost:3000",
 ])
 CORS_ALLOW_CREDENTIALS = True
+CORS_EXPOSE_HEADERS = ["X-Calendar-Cursor", "Upload-Offset"]
 
 # Security (production)
 if not DEBUG:
@@ -228,5 +340,10 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': False,
         },
+        'django_project.metrics': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
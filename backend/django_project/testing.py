@@ -0,0 +1,143 @@
+import shutil
+import tempfile
+from datetime import time
+from decimal import Decimal
+from unittest import mock
+
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from clients.models import Client
+from workorders.models import Event, JobAttachment, JobNote, WorkOrder, attachment_storage
+from workorders.search import search_enabled
+
+# Statements the search index adds after a work order, event, note or client
+# is written: the commit-time refresh, which only exists on PostgreSQL.
+SEARCH_REFRESH = 1 if search_enabled() else 0
+
+# Throttle history lives in the default cache; a dummy cache never fills up.
+# Test users share a handful of pks, so with the real cache every API test in
+# a run would count against the same per-minute rate.
+NO_THROTTLE_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+without_throttling = override_settings(CACHES=NO_THROTTLE_CACHES)
+
+
+@override_settings(
+    CACHES=NO_THROTTLE_CACHES,
+    PDF_CACHE_MAX_BYTES=0,
+    METRICS_DIR='',
+)
+class QueryBudgetTestCase(APITestCase):
+    """Pins the number of SQL queries each endpoint runs.
+
+    assertQueryBudget makes the request once against a single row and once
+    against ROWS rows, and both runs must issue exactly `budget` queries.
+    A change that adds a query per row (an N+1) fails straight away; one
+    that legitimately changes the fixed cost updates the budget.
+    """
+
+    ROWS = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('budget', password='budget-pass')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        use_local_attachment_storage(self)
+        use_temp_upload_dir(self)
+        # Fixtures' commit callbacks run now, as a real commit would, so none is left pending.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.setUpFixtures()
+
+    def setUpFixtures(self):
+        """Rows shared by every test in the class."""
+
+    def assertQueryBudget(self, budget, make_rows, request, status_code=200, rows=None):
+        """Call `make_rows(n)` for n = 1 and n = `rows` (default ROWS), then `request(fixture)` with its result.
+
+        Commit callbacks run inside the measurement, so work deferred to
+        commit (search refresh, client stats, rollups) counts as well.
+        """
+        runs = []
+        for rows in (1, rows or self.ROWS):
+            with self.captureOnCommitCallbacks(execute=True):
+                fixture = make_rows(rows)
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                response = request(fixture)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertEqual(
+                response.status_code, status_code,
+                f"With {rows} rows: {getattr(response, 'data', response.status_code)}",
+            )
+            runs.append((rows, queries.captured_queries))
+
+        counts = ', '.join(f"{len(queries)} with {rows} rows" for rows, queries in runs)
+        for rows, queries in runs:
+            if len(queries) != budget:
+                statements = '\n'.join(f"{i}. {query['sql']}" for i, query in enumerate(queries, start=1))
+                self.fail(f"Budget is {budget} queries, ran {counts}. Queries with {rows} rows:\n{statements}")
+
+
+def use_local_attachment_storage(test):
+    """Keep attachment files in a temp directory instead of the configured backend, for the rest of `test`.
+
+    Returns the FileSystemStorage that now sits under the deduplicating storage.
+    """
+    media = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media, ignore_errors=True)
+    inner = FileSystemStorage(location=media)
+    patcher = mock.patch.object(attachment_storage(), 'inner', inner)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    return inner
+
+
+def use_temp_upload_dir(test):
+    """Spool chunked uploads into a temp directory, removed after `test`."""
+    upload_dir = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, upload_dir, ignore_errors=True)
+    settings_override = override_settings(ATTACHMENT_UPLOAD_TEMP_DIR=upload_dir)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+
+
+def make_client(**fields):
+    return Client.objects.create(**{'name': 'Budget Client', **fields})
+
+
+def make_work_order(client=None, events=0, notes=0, attachments=0, **fields):
+    """A work order with the given number of events, notes and attachment rows (no stored files)."""
+    work_order = WorkOrder.objects.create(
+        client=client or make_client(),
+        **{'job_description': 'Hang painting', 'estimated_cost': Decimal('250.00'), **fields},
+    )
+    add_events(work_order, events)
+    JobNote.objects.bulk_create(JobNote(work_order=work_order, note=f"Note {i}") for i in range(notes))
+    JobAttachment.objects.bulk_create(
+        JobAttachment(work_order=work_order, file=f"job_attachments/budget/{work_order.pk}_{i}.pdf", file_type='pdf')
+        for i in range(attachments)
+    )
+    return work_order
+
+
+def add_events(work_order, count, day=None):
+    """`count` events on `day` (default today), in daily order."""
+    day = day or timezone.localdate()
+    return Event.objects.bulk_create(
+        Event(
+            work_order=work_order,
+            event_type='pickup',
+            address=f"{i} Main St",
+            date=day,
+            daily_order=i + 1,
+            scheduled_time=time(8 + i % 10),
+        )
+        for i in range(count)
+    )
@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock, skipIf
+
+from django.test import TestCase, override_settings
+
+from . import metrics
+
+
+class MetricsTestCase(TestCase):
+    """Records into a fresh registry, with snapshots in a temp directory."""
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        patcher = mock.patch.object(metrics, 'registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        settings_override = override_settings(METRICS_DIR=str(self.directory))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def start_process(self):
+        process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+        self.addCleanup(process.wait)
+        self.addCleanup(process.kill)
+        return process
+
+    def write_snapshot(self, pid, started, value):
+        with open(self.directory / f'{pid}.json', 'w') as f:
+            json.dump({
+                'started': started,
+                'counters': [['http_requests_total', [['route', 'clients']], value]],
+                'histograms': [['db_queries_per_request', [['route', 'clients']], [0, value, 0, value, value]]],
+            }, f)
+
+
+class HistogramTests(MetricsTestCase):
+    def test_values_land_in_the_first_bucket_that_holds_them(self):
+        buckets = (1, 5, 10)
+        for value in (0, 1, 3, 10, 50):
+            self.registry.observe('db_queries_per_request', (), value, buckets)
+        # Per-bucket counts, then sum and count; 50 is above every bound and only reaches +Inf.
+        self.assertEqual(self.registry.histograms['db_queries_per_request', ()], [2, 1, 1, 64, 5])
+
+    def test_render_reports_cumulative_buckets(self):
+        labels = (('route', 'clients'),)
+        for value in (0, 3, 3, 1000):
+            self.registry.observe('db_queries_per_request', labels, value, metrics.QUERY_COUNT_BUCKETS)
+        with self.settings(METRICS_DIR=''):
+            lines = metrics.render().splitlines()
+        self.assertIn('db_queries_per_request_bucket{route="clients",le="0"} 1', lines)
+        self.assertIn('db_queries_per_request_bucket{route="clients",le="2"} 1', lines)
+        self.assertIn('db_queries_per_request_bucket{route="clients",le="5"} 3', lines)
+        self.assertIn('db_queries_per_request_bucket{route="clients",le="500"} 3', lines)
+        self.assertIn('db_queries_per_request_bucket{route="clients",le="+Inf"} 4', lines)
+        self.assertIn('db_queries_per_request_sum{route="clients"} 1006', lines)
+        self.assertIn('db_queries_per_request_count{route="clients"} 4', lines)
+
+    def test_middleware_records_each_request(self):
+        with self.settings(METRICS_DIR=''):
+            for _ in range(2):
+                self.client.get('/api/clients/')
+            counters, histograms = metrics.collect()
+        labels = (('route', 'client-list'), ('action', 'list'), ('method', 'GET'))
+        self.assertEqual(counters['http_requests_total', labels + (('status', '401'),)], 2)
+        self.assertEqual(histograms['http_request_duration_seconds', labels][-1], 2)
+
+
+class SnapshotMergeTests(MetricsTestCase):
+    def test_live_workers_are_merged(self):
+        self.registry.inc('http_requests_total', (('route', 'clients'),), 1)
+        worker = self.start_process()
+        self.write_snapshot(worker.pid, metrics._started(worker.pid), 2)
+
+        counters, histograms = metrics.collect()
+        self.assertEqual(counters['http_requests_total', (('route', 'clients'),)], 3)
+        self.assertEqual(histograms['db_queries_per_request', (('route', 'clients'),)], [0, 2, 0, 2, 2])
+
+    def test_snapshots_of_exited_workers_are_pruned(self):
+        worker = self.start_process()
+        started = metrics._started(worker.pid)
+        worker.kill()
+        worker.wait()
+        self.write_snapshot(worker.pid, started, 2)
+
+        counters, _ = metrics.collect()
+        self.assertNotIn(('http_requests_total', (('route', 'clients'),)), counters)
+        self.assertFalse((self.directory / f'{worker.pid}.json').exists())
+
+    @skipIf(metrics._started(1) is None, "Process start times need /proc")
+    def test_snapshot_from_a_reused_pid_is_pruned(self):
+        worker = self.start_process()
+        # Written by an earlier process that had the same pid.
+        self.write_snapshot(worker.pid, metrics._started(worker.pid) - 1, 2)
+
+        counters, _ = metrics.collect()
+        self.assertNotIn(('http_requests_total', (('route', 'clients'),)), counters)
+        self.assertEqual([path.name for path in self.directory.glob('*.json')], [f'{os.getpid()}.json'])
@@ -0,0 +1,82 @@
+import weakref
+
+from django.db import transaction
+from django.db.models.signals import post_delete, pre_delete
+
+# Per connection, the pending on_commit_batch batch for each flush function.
+# Batches are held weakly: Django owns the one reference that matters, in its
+# list of commit callbacks, so a rollback that drops the callback drops the
+# batch (and its items) from here as well.
+_commit_batches = weakref.WeakKeyDictionary()
+
+# Items collected by on_delete_batch receivers, by (flush, id(origin)).
+_delete_batches = {}
+
+
+class _Batch:
+    def __init__(self, flush):
+        self.flush = flush
+        self.items = []
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        items, self.items = self.items, []
+        self.flush(items)
+
+
+def on_commit_batch(flush, item, using=None):
+    """Queue `item` for `flush(items)`, called once with everything queued when the transaction commits.
+
+    Signal receivers use this so that saving or deleting many rows costs
+    one query per transaction instead of one per row. It is meant for work
+    that is safe to repeat or lose, such as recomputing derived data: a
+    rolled-back transaction discards its batch, but items queued inside a
+    rolled-back savepoint still reach `flush` if the batch was started
+    before it. Outside a transaction `flush` runs straight away.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        flush([item])
+        return
+    batches = _commit_batches.setdefault(connection, weakref.WeakValueDictionary())
+    batch = batches.get(flush)
+    if batch is None or batch.done:
+        batch = batches[flush] = _Batch(flush)
+        transaction.on_commit(batch, using=using)
+    batch.items.append(item)
+
+
+def on_delete_batch(sender, flush, item):
+    """Call `flush(items)` once per delete() with `item(instance)` for every `sender` row it removes.
+
+    Django sends pre_delete for every row a delete() and its cascades will
+    remove before deleting any, then deletes each model's rows together and
+    sends their post_delete. The items are gathered in pre_delete and
+    flushed at the first post_delete, so the flush sees the whole set, runs
+    inside the delete's transaction and rolls back with it. `item` may
+    return None to skip a row.
+    """
+    def collect(sender, instance, origin=None, **kwargs):
+        value = item(instance)
+        if value is None or origin is None:
+            return
+        key = (flush, id(origin))
+        if key not in _delete_batches:
+            # Forget the items if the delete fails before they are flushed.
+            weakref.finalize(origin, _delete_batches.pop, key, None)
+        # Keyed by pk, so a retried delete doesn't count a row twice.
+        _delete_batches.setdefault(key, {})[instance.pk] = value
+
+    def release(sender, instance, origin=None, **kwargs):
+        if origin is None:
+            value = item(instance)
+            if value is not None:
+                flush([value])
+            return
+        items = _delete_batches.pop((flush, id(origin)), None)
+        if items:
+            flush(list(items.values()))
+
+    pre_delete.connect(collect, sender=sender, weak=False)
+    post_delete.connect(release, sender=sender, weak=False)
@@ -3,8 +3,11 @@ from django.urls import path, include
 from django.http import JsonResponse
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('health/', lambda r: JsonResponse({"status": "ok"})),
+    path('metrics', metrics_view, name='metrics'),
     path('admin/', admin.site.urls),
 
     # JWT Auth
@@ -16,4 +19,5 @@ urlpatterns = [
     path('api/workorders/', include('workorders.urls')),
     path('api/invoices/', include('invoices.urls')),
     path('api/calendar/', include('calendar_app.urls')),
+    path('api/pdfs/', include('pdfs.urls')),
 ]
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from invoices.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the invoice rollup table from the invoices."
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} invoice rollup rows."))
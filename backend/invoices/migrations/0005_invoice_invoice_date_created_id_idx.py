@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0003_client_updated_at'),
+        ('invoices', '0004_invoice_updated_at'),
+        ('workorders', '0007_event_tombstone_and_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-date_created', 'id'], name='invoice_date_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_rollups(apps, schema_editor):
+    Invoice = apps.get_model('invoices', 'Invoice')
+    InvoiceRollup = apps.get_model('invoices', 'InvoiceRollup')
+    rows = Invoice.objects.annotate(month=TruncMonth('date_created')).values(
+        'client_id', 'status', 'month'
+    ).annotate(total=Sum('amount'), count=Count('id')).order_by()
+    InvoiceRollup.objects.bulk_create(InvoiceRollup(**row) for row in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0005_client_name_search_indexes'),
+        ('invoices', '0005_invoice_invoice_date_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('unpaid', 'Not in QuickBooks'), ('in_quickbooks', 'In QuickBooks'), ('paid', 'Paid')], max_length=20)),
+                ('month', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='clients.client')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('client', 'status', 'month'), name='invoice_rollup_key')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
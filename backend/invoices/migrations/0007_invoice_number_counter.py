@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:10
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_counter(apps, schema_editor):
+    # Existing invoices are numbered by primary key; continue above both.
+    Invoice = apps.get_model('invoices', 'Invoice')
+    InvoiceNumberCounter = apps.get_model('invoices', 'InvoiceNumberCounter')
+    numbers = [int(n) for n in Invoice.objects.values_list('invoice_number', flat=True) if n.isdigit()]
+    last = max(numbers + [Invoice.objects.aggregate(m=Max('id'))['m'] or 0])
+    InvoiceNumberCounter.objects.create(name='invoice', value=last)
+
+
+def drop_counter(apps, schema_editor):
+    apps.get_model('invoices', 'InvoiceNumberCounter').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0006_invoicerollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceNumberCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_counter, drop_counter),
+    ]
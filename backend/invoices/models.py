@@ -1,9 +1,70 @@
+from datetime import date
 from decimal import Decimal
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Max
 from django.utils import timezone
 
 
+class InvoiceNumberCounter(models.Model):
+    """Last invoice number handed out. One row, named 'invoice'."""
+
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+def last_used_invoice_number():
+    """Highest number any invoice already carries. Invoices from before the counter are numbered by id."""
+    numbers = Invoice.objects.values_list('invoice_number', flat=True).iterator()
+    return max([int(n) for n in numbers if n.isdigit()] + [Invoice.objects.aggregate(m=Max('id'))['m'] or 0])
+
+
+def allocate_invoice_numbers(count=1):
+    """Reserve `count` consecutive invoice numbers and return the first.
+
+    Must run inside the transaction that inserts the invoices: the counter
+    row stays locked until it commits, and a rollback returns the numbers,
+    so the sequence has no gaps. A missing counter row (after flush, or a
+    truncated test database) is recreated above every number in use.
+    """
+    table = connection.ops.quote_name(InvoiceNumberCounter._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET value = value + %s WHERE name = %s RETURNING value",
+            [count, 'invoice'],
+        )
+        row = cursor.fetchone()
+        if row is None:
+            # Two requests may both find it missing; the loser of the insert increments the winner's row.
+            cursor.execute(
+                f"INSERT INTO {table} (name, value) VALUES (%s, %s) "
+                f"ON CONFLICT (name) DO UPDATE SET value = {table}.value + %s RETURNING value",
+                ['invoice', last_used_invoice_number() + count, count],
+            )
+            row = cursor.fetchone()
+    return row[0] - count + 1
+
+
+class InvoiceQuerySet(models.QuerySet):
+    def bulk_create_numbered(self, invoices, batch_size=None):
+        """bulk_create `invoices` with freshly allocated numbers, keeping the rollups in step."""
+        from .rollups import record_inserts
+
+        invoices = list(invoices)
+        if not invoices:
+            return []
+        with transaction.atomic(using=self.db):
+            first = allocate_invoice_numbers(len(invoices))
+            for number, invoice in enumerate(invoices, start=first):
+                invoice.invoice_number = str(number)
+            created = self.bulk_create(invoices, batch_size=batch_size)
+            record_inserts(created)
+        return created
+
+
 class Invoice(models.Model):
     STATUS_CHOICES = [
         ('unpaid', 'Not in QuickBooks'),
@@ -24,14 +85,70 @@ class Invoice(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='unpaid')
     notes = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination on (-date_created, id).
+            models.Index(fields=['-date_created', 'id'], name='invoice_date_created_id_idx'),
+        ]
+
+    objects = InvoiceQuerySet.as_manager()
 
     def save(self, *args, **kwargs):
-        if not self.invoice_number:
-            self.invoice_number = ""
-        super().save(*args, **kwargs)
-        if not self.invoice_number:
-            self.invoice_number = str(self.id)
-            super().save(update_fields=['invoice_number'])
+        if self.invoice_number:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            self.invoice_number = str(allocate_invoice_numbers())
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._rollup_key = instance.rollup_key()
+        return instance
+
+    def rollup_key(self):
+        """(client_id, status, month, amount) as this invoice counts towards InvoiceRollup."""
+        created = self.date_created
+        return (self.client_id, self.status, date(created.year, created.month, 1), Decimal(str(self.amount)))
+
+    @classmethod
+    def with_pdf_fingerprint(cls, queryset):
+        """Annotate `queryset` with what pdf_fingerprint reads, so it runs no queries per row (exports)."""
+        from workorders.models import Event, pdf_fingerprint_annotations
+
+        return queryset.select_related('client', 'work_order').annotate(
+            **pdf_fingerprint_annotations(Event, 'pdf_events', work_order='work_order'),
+        )
+
+    def pdf_fingerprint(self):
+        """Values that change whenever anything shown on the invoice PDF changes."""
+        from workorders.models import related_fingerprint
+
+        parts = [self.pk, self.updated_at, self.client.updated_at]
+        if self.work_order:
+            parts += [self.work_order.updated_at, *related_fingerprint(self, 'pdf_events', self.work_order.events)]
+        return parts
+
+    def __str__(self):
+        client = self.client.name if Invoice.client.is_cached(self) else f"client {self.client_id}"
+        return f"Invoice {self.invoice_number} - {client}"
+
+
+class InvoiceRollup(models.Model):
+    """Invoice totals per client, status and month, kept current by invoices.rollups."""
+
+    client = models.ForeignKey('clients.Client', on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=20, choices=Invoice.STATUS_CHOICES)
+    month = models.DateField()
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'status', 'month'], name='invoice_rollup_key'),
+        ]
 
     def __str__(self):
-        return f"Invoice {self.invoice_number} - {self.client.name}"
+        return f"{self.client_id} {self.status} {self.month:%Y-%m}: {self.count} / {self.total}"
@@ -0,0 +1,109 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import Invoice, InvoiceRollup
+
+
+def apply_delta(client_id, status, month, amount, count):
+    """Add `amount` and `count` (either may be negative) to one rollup row."""
+    row = InvoiceRollup.objects.filter(client_id=client_id, status=status, month=month)
+    if row.update(total=F('total') + amount, count=F('count') + count) or count < 0:
+        # Nothing to take away from a missing row (e.g. its client is being deleted).
+        return
+    try:
+        with transaction.atomic():
+            InvoiceRollup.objects.create(client_id=client_id, status=status, month=month, total=amount, count=count)
+    except IntegrityError:
+        # Created concurrently since our UPDATE; add to it instead.
+        row.update(total=F('total') + amount, count=F('count') + count)
+
+
+def record_changes(changes):
+    """Apply many invoices' (old_key, new_key) moves, netted to one update per rollup key.
+
+    Either key of a pair may be None (a new or deleted invoice).
+    """
+    deltas = defaultdict(lambda: [Decimal('0'), 0])
+    for old_key, new_key in changes:
+        if old_key == new_key:
+            continue
+        if old_key:
+            client_id, status, month, amount = old_key
+            deltas[client_id, status, month][0] -= amount
+            deltas[client_id, status, month][1] -= 1
+        if new_key:
+            client_id, status, month, amount = new_key
+            deltas[client_id, status, month][0] += amount
+            deltas[client_id, status, month][1] += 1
+    for (client_id, status, month), (amount, count) in deltas.items():
+        if amount or count:
+            apply_delta(client_id, status, month, amount, count)
+
+
+def record_inserts(invoices):
+    """Count invoices created without Invoice.save (bulk_create), one update per rollup key."""
+    for invoice in invoices:
+        invoice._rollup_key = invoice.rollup_key()
+    record_changes((None, invoice._rollup_key) for invoice in invoices)
+
+
+def rebuild_rollups(client_ids=None):
+    """Recompute rollup rows from the invoices table, for the given clients or all of them.
+
+    Paths that write invoices without Invoice.save (queryset.update,
+    bulk_create) call this for the clients they touched.
+    """
+    invoices = Invoice.objects.all()
+    rollups = InvoiceRollup.objects.all()
+    if client_ids is not None:
+        invoices = invoices.filter(client_id__in=client_ids)
+        rollups = rollups.filter(client_id__in=client_ids)
+    rows = invoices.annotate(month=TruncMonth('date_created')).values(
+        'client_id', 'status', 'month'
+    ).annotate(total=Sum('amount'), count=Count('id')).order_by()
+    with transaction.atomic():
+        rollups.delete()
+        created = InvoiceRollup.objects.bulk_create(InvoiceRollup(**row) for row in rows)
+    return len(created)
+
+
+def invoice_summary(client_id=None, status=None):
+    """Totals and counts overall and by status, client and month, read from the rollup table."""
+    rows = InvoiceRollup.objects.filter(count__gt=0)
+    if client_id:
+        rows = rows.filter(client_id=client_id)
+    if status:
+        rows = rows.filter(status=status)
+
+    overall = {'total': Decimal('0'), 'count': 0}
+    by_status = defaultdict(lambda: {'total': Decimal('0'), 'count': 0})
+    by_client = {}
+    by_month = defaultdict(lambda: {'total': Decimal('0'), 'count': 0})
+    for row in rows.values('client_id', 'client__name', 'status', 'month', 'total', 'count'):
+        client = by_client.setdefault(row['client_id'], {
+            'client': row['client_id'], 'client_name': row['client__name'],
+            'total': Decimal('0'), 'count': 0,
+        })
+        for bucket in (overall, by_status[row['status']], client, by_month[row['month']]):
+            bucket['total'] += row['total']
+            bucket['count'] += row['count']
+
+    return {
+        **_money(overall),
+        'by_status': [{'status': key, **_money(value)} for key, value in sorted(by_status.items())],
+        'by_client': [
+            _money(client) for client in sorted(by_client.values(), key=lambda c: (-c['total'], c['client_name']))
+        ],
+        'by_month': [
+            {'month': month.strftime('%Y-%m'), **_money(value)} for month, value in sorted(by_month.items())
+        ],
+    }
+
+
+def _money(bucket):
+    # Amounts are rendered as strings, matching InvoiceSerializer.amount.
+    return {**bucket, 'total': f"{bucket['total']:.2f}"}
@@ -0,0 +1,38 @@
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from django_project.transactions import on_delete_batch
+
+from .models import Invoice
+from .rollups import record_changes
+
+
+def stored_rollup_key(invoice):
+    """The rollup key `invoice` counts under in the database, or None if it isn't saved.
+
+    Instances loaded from the database carry it from from_db. One built by
+    hand with a pk of an existing row doesn't, so the row is read back.
+    """
+    if not hasattr(invoice, '_rollup_key'):
+        stored = Invoice.objects.filter(pk=invoice.pk).first() if invoice.pk is not None else None
+        invoice._rollup_key = stored._rollup_key if stored else None
+    return invoice._rollup_key
+
+
+@receiver(pre_save, sender=Invoice)
+def load_rollup_key(sender, instance, **kwargs):
+    stored_rollup_key(instance)
+
+
+@receiver(post_save, sender=Invoice)
+def update_rollup_on_save(sender, instance, **kwargs):
+    new_key = instance.rollup_key()
+    record_changes([(instance._rollup_key, new_key)])
+    instance._rollup_key = new_key
+
+
+def record_deletes(keys):
+    record_changes((key, None) for key in keys)
+
+
+on_delete_batch(Invoice, record_deletes, stored_rollup_key)
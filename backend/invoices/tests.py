@@ -1,3 +1,238 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from django_project.testing import (
+    SEARCH_REFRESH,
+    QueryBudgetTestCase,
+    make_client,
+    make_work_order,
+    without_throttling,
+)
+
+from .models import Invoice, InvoiceNumberCounter, InvoiceRollup
+from .rollups import rebuild_rollups
+
+
+class InvoiceQueryBudgetTests(QueryBudgetTestCase):
+    def setUpFixtures(self):
+        self.client_record = make_client()
+        # Give every rollup key the tests touch a row already, so each run updates
+        # rollups instead of the first one creating them.
+        Invoice.objects.bulk_create_numbered(
+            Invoice(client=self.client_record, amount=Decimal('10.00'), status=status, date_created=day)
+            for status, _ in Invoice.STATUS_CHOICES
+            for day in (date(2026, 3, 1), timezone.localdate())
+        )
+
+    def add_invoices(self, rows):
+        work_order = make_work_order(self.client_record, events=1)
+        return Invoice.objects.bulk_create_numbered(
+            Invoice(client=self.client_record, work_order=work_order, amount=Decimal('120.00'),
+                    date_created=date(2026, 3, 1))
+            for _ in range(rows)
+        )
+
+    def make_invoiced_work_order(self, rows):
+        """An invoice for a work order with `rows` events."""
+        work_order = make_work_order(self.client_record, events=rows)
+        return Invoice.objects.create(client=self.client_record, work_order=work_order, amount=Decimal('80.00'))
+
+    def test_list(self):
+        self.assertQueryBudget(2, self.add_invoices, lambda _: self.client.get('/api/invoices/'))
+
+    def test_list_cursor(self):
+        self.assertQueryBudget(1, self.add_invoices, lambda _: self.client.get('/api/invoices/?pagination=cursor'))
+
+    def test_retrieve(self):
+        self.assertQueryBudget(
+            1, self.add_invoices, lambda invoices: self.client.get(f'/api/invoices/{invoices[0].pk}/'),
+        )
+
+    def test_create(self):
+        def make_rows(rows):
+            self.add_invoices(rows)
+            return make_work_order(self.client_record)
+
+        self.assertQueryBudget(
+            9 + SEARCH_REFRESH, make_rows,
+            lambda work_order: self.client.post('/api/invoices/', {
+                'client': self.client_record.pk, 'work_order': work_order.pk,
+                'amount': '75.00', 'date_created': timezone.localdate().isoformat(),
+            }, format='json'),
+            status_code=201,
+        )
+
+    def test_partial_update(self):
+        self.assertQueryBudget(
+            3, self.add_invoices,
+            lambda invoices: self.client.patch(f'/api/invoices/{invoices[0].pk}/', {'amount': '99.00'}, format='json'),
+        )
+
+    def test_destroy(self):
+        self.assertQueryBudget(
+            3, self.add_invoices,
+            lambda invoices: self.client.delete(f'/api/invoices/{invoices[0].pk}/'), status_code=204,
+        )
+
+    def test_status_actions(self):
+        for name, data in [('advance_status', {}), ('change_status', {'status': 'paid'})]:
+            with self.subTest(name):
+                self.assertQueryBudget(
+                    4, self.add_invoices,
+                    lambda invoices: self.client.post(f'/api/invoices/{invoices[0].pk}/{name}/', data, format='json'),
+                )
+
+    def test_summary(self):
+        self.assertQueryBudget(1, self.add_invoices, lambda _: self.client.get('/api/invoices/summary/'))
+
+    def test_invoice_completed(self):
+        def complete_work_orders(rows):
+            for _ in range(rows):
+                make_work_order(self.client_record, status='completed', completed_at=timezone.now())
+
+        self.assertQueryBudget(
+            10, complete_work_orders,
+            lambda _: self.client.post('/api/invoices/invoice_completed/', {}, format='json'),
+            status_code=201,
+        )
+
+    def test_pdf(self):
+        self.assertQueryBudget(
+            3, self.make_invoiced_work_order, lambda invoice: self.client.get(f'/api/invoices/{invoice.pk}/pdf/'),
+        )
+
+
+class InvoiceNumberTests(TestCase):
+    def setUp(self):
+        self.client_record = make_client()
+
+    def create(self, **fields):
+        return Invoice.objects.create(client=self.client_record, amount=Decimal('50.00'), **fields)
+
+    def numbers(self, invoices):
+        return [int(invoice.invoice_number) for invoice in invoices]
+
+    def test_numbers_are_consecutive(self):
+        first = int(self.create().invoice_number)
+        bulk = Invoice.objects.bulk_create_numbered(
+            Invoice(client=self.client_record, amount=Decimal('50.00')) for _ in range(3)
+        )
+        self.assertEqual(self.numbers([*bulk, self.create()]), [first + 1, first + 2, first + 3, first + 4])
+
+    def test_rollback_returns_numbers(self):
+        first = int(self.create().invoice_number)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Invoice.objects.bulk_create_numbered(
+                Invoice(client=self.client_record, amount=Decimal('50.00')) for _ in range(2)
+            )
+            raise RuntimeError
+        self.assertEqual(int(self.create().invoice_number), first + 1)
+
+    def test_missing_counter_is_recreated_above_existing_numbers(self):
+        self.create(invoice_number='500')
+        self.create(invoice_number='INV-A')
+        InvoiceNumberCounter.objects.all().delete()
+
+        self.assertEqual(self.create().invoice_number, '501')
+        self.assertEqual(self.create().invoice_number, '502')
+        self.assertEqual(InvoiceNumberCounter.objects.get(name='invoice').value, 502)
+
+    def test_missing_counter_with_bulk_create(self):
+        InvoiceNumberCounter.objects.all().delete()
+        bulk = Invoice.objects.bulk_create_numbered(
+            Invoice(client=self.client_record, amount=Decimal('50.00')) for _ in range(3)
+        )
+        self.assertEqual(self.numbers(bulk), [1, 2, 3])
+
+
+@without_throttling
+class InvoiceRollupTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('rollups', password='rollups-pass'))
+        self.client_record = make_client()
+        self.march = date(2026, 3, 1)
+
+    def create(self, amount='50.00', **fields):
+        return Invoice.objects.create(
+            client=self.client_record, amount=Decimal(amount), **{'date_created': self.march, **fields},
+        )
+
+    def rollups(self):
+        return {
+            (row.status, row.month): (row.total, row.count)
+            for row in InvoiceRollup.objects.filter(client=self.client_record).exclude(count=0)
+        }
+
+    def assertMatchesRebuild(self):
+        counted = self.rollups()
+        rebuild_rollups([self.client_record.pk])
+        self.assertEqual(counted, self.rollups())
+
+    def test_create_update_and_delete(self):
+        first = self.create()
+        self.create(amount='25.00')
+        self.assertEqual(self.rollups(), {('unpaid', self.march): (Decimal('75.00'), 2)})
+
+        first.status = 'paid'
+        first.amount = Decimal('60.00')
+        first.save()
+        self.assertEqual(self.rollups(), {
+            ('unpaid', self.march): (Decimal('25.00'), 1),
+            ('paid', self.march): (Decimal('60.00'), 1),
+        })
+
+        first.delete()
+        self.assertEqual(self.rollups(), {('unpaid', self.march): (Decimal('25.00'), 1)})
+        self.assertMatchesRebuild()
+
+    def test_instance_built_with_an_existing_pk(self):
+        invoice = self.create()
+        # Not loaded from the database, so it carries no rollup key of its own.
+        Invoice(
+            pk=invoice.pk, invoice_number=invoice.invoice_number, client=self.client_record,
+            amount=Decimal('80.00'), date_created=self.march, status='paid',
+        ).save()
+        self.assertEqual(self.rollups(), {('paid', self.march): (Decimal('80.00'), 1)})
+
+        Invoice(pk=invoice.pk, client=self.client_record, amount=Decimal('1.00'), date_created=self.march).delete()
+        self.assertEqual(self.rollups(), {})
+        self.assertMatchesRebuild()
+
+    def test_bulk_create_and_queryset_delete(self):
+        Invoice.objects.bulk_create_numbered(
+            Invoice(client=self.client_record, amount=Decimal('10.00'), date_created=self.march) for _ in range(3)
+        )
+        self.create(amount='5.00', status='paid')
+        Invoice.objects.filter(pk__in=Invoice.objects.filter(status='unpaid').values('pk')[:2]).delete()
+        self.assertEqual(self.rollups(), {
+            ('unpaid', self.march): (Decimal('10.00'), 1),
+            ('paid', self.march): (Decimal('5.00'), 1),
+        })
+        self.assertMatchesRebuild()
+
+    def test_summary_endpoint(self):
+        other = make_client(name='Other Client')
+        self.create(amount='40.00')
+        self.create(amount='15.50', status='paid', date_created=date(2026, 4, 2))
+        Invoice.objects.create(client=other, amount=Decimal('100.00'), date_created=self.march)
+
+        summary = self.client.get('/api/invoices/summary/').data
+        self.assertEqual((summary['total'], summary['count']), ('155.50', 3))
+        self.assertEqual(summary['by_status'], [
+            {'status': 'paid', 'total': '15.50', 'count': 1},
+            {'status': 'unpaid', 'total': '140.00', 'count': 2},
+        ])
+        self.assertEqual(
+            [(row['client_name'], row['total']) for row in summary['by_client']],
+            [('Other Client', '100.00'), ('Budget Client', '55.50')],
+        )
+        self.assertEqual([row['month'] for row in summary['by_month']], ['2026-03', '2026-04'])
 
-# Create your tests here.
+        filtered = self.client.get('/api/invoices/summary/', {'client': self.client_record.pk, 'status': 'paid'}).data
+        self.assertEqual((filtered['total'], filtered['count']), ('15.50', 1))
@@ -1,13 +1,22 @@
+from datetime import date
+from functools import partial
+
 from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.http import HttpResponse
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from django.template.loader import render_to_string
-from weasyprint import HTML
+from django.utils import timezone
+
+from clients.stats import refresh_client_stats
+
+from pdfs.export import filter_export_queryset, pdf_zip_response
+from pdfs.render import serve_pdf
+from workorders.models import WorkOrder
 
 from .models import Invoice
+from .rollups import invoice_summary
 from .serializers import InvoiceSerializer
 
 
@@ -16,15 +25,22 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     serializer_class = InvoiceSerializer
     filter_backends = [filters.SearchFilter]
     search_fields = ['client__name', 'invoice_number']
+    keyset_ordering = ('-date_created', 'id')
 
     def get_queryset(self):
         qs = super().get_queryset()
         status_filter = self.request.query_params.get('status')
         client_id = self.request.query_params.get('client')
+        date_from = self.request.query_params.get('date_from')
+        date_to = self.request.query_params.get('date_to')
         if status_filter:
             qs = qs.filter(status=status_filter)
         if client_id:
             qs = qs.filter(client_id=client_id)
+        if date_from:
+            qs = qs.filter(date_created__gte=date_from)
+        if date_to:
+            qs = qs.filter(date_created__lte=date_to)
         return qs
 
     def perform_create(self, serializer):
@@ -33,6 +49,86 @@ class InvoiceViewSet(viewsets.ModelViewSet):
             invoice.work_order.invoiced = True
             invoice.work_order.save()
 
+    @action(detail=False, methods=['post'])
+    def invoice_completed(self, request):
+        """Invoice every completed, uninvoiced work order at its estimated cost, in one transaction.
+
+        Optional filters: client, date_from, date_to (YYYY-MM-DD, on the
+        work order's completion date). Work orders without a positive
+        estimated cost are skipped and listed.
+        """
+        work_orders = WorkOrder.objects.filter(status='completed', invoiced=False)
+        client_id = request.data.get('client')
+        if client_id:
+            work_orders = work_orders.filter(client_id=client_id)
+        try:
+            if request.data.get('date_from'):
+                work_orders = work_orders.filter(completed_at__date__gte=date.fromisoformat(request.data['date_from']))
+            if request.data.get('date_to'):
+                work_orders = work_orders.filter(completed_at__date__lte=date.fromisoformat(request.data['date_to']))
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid date_from or date_to'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            # Locked so a concurrent run can't invoice the same work orders twice.
+            rows = list(
+                work_orders.select_for_update().order_by('id').values_list('id', 'client_id', 'estimated_cost')
+            )
+            billable = [row for row in rows if row[2] and row[2] > 0]
+            skipped = [row[0] for row in rows if not (row[2] and row[2] > 0)]
+
+            today = timezone.localdate()
+            invoices = Invoice.objects.bulk_create_numbered(
+                Invoice(client_id=client_id, work_order_id=work_order_id, amount=cost, date_created=today)
+                for work_order_id, client_id, cost in billable
+            )
+            WorkOrder.objects.filter(pk__in=[row[0] for row in billable]).update(
+                invoiced=True, updated_at=timezone.now(),
+            )
+            # The update above skips WorkOrder signals; keep client activity current.
+            refresh_client_stats({row[1] for row in billable})
+
+        return Response({
+            'created': len(invoices),
+            'total': f"{sum((invoice.amount for invoice in invoices), 0):.2f}",
+            'invoices': [
+                {
+                    'id': invoice.id,
+                    'invoice_number': invoice.invoice_number,
+                    'client': invoice.client_id,
+                    'work_order': invoice.work_order_id,
+                    'amount': f"{invoice.amount:.2f}",
+                }
+                for invoice in invoices
+            ],
+            'skipped': [{'work_order': pk, 'reason': 'No estimated cost'} for pk in skipped],
+        }, status=status.HTTP_201_CREATED if invoices else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Totals and counts overall and by status, client and month. Accepts ?client= and ?status=."""
+        return Response(invoice_summary(
+            client_id=request.query_params.get('client'),
+            status=request.query_params.get('status'),
+        ))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream a ZIP of invoice PDFs. Accepts the list filters or ?ids=1,2,3."""
+        queryset = Invoice.with_pdf_fingerprint(
+            filter_export_queryset(request, self.filter_queryset(self.get_queryset()))
+        )
+        items = (
+            (
+                invoice_pdf_filename(invoice),
+                INVOICE_PDF_TEMPLATE,
+                invoice.pdf_fingerprint(),
+                partial(invoice_pdf_context, invoice),
+            )
+            for invoice in queryset.iterator(chunk_size=100)
+        )
+        return pdf_zip_response(items, "invoices.zip")
+
     @action(detail=True, methods=['post'])
     def advance_status(self, request, pk=None):
         """unpaid -> in_quickbooks -> paid"""
@@ -55,27 +151,34 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         return Response({'status': new_status})
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def invoice_pdf(request, pk):
-    invoice = get_object_or_404(
-        Invoice.objects.select_related('client', 'work_order'),
-        pk=pk
-    )
+INVOICE_PDF_TEMPLATE = "invoices/invoice_pdf.html"
+
 
+def invoice_pdf_context(invoice):
     events = []
     if invoice.work_order:
         events = invoice.work_order.events.all().order_by('date')
-
-    html_string = render_to_string("invoices/invoice_pdf.html", {
+    return {
         "invoice": invoice,
         "events": events,
-    })
-    html = HTML(string=html_string)
-    pdf = html.write_pdf()
+    }
+
+
+def invoice_pdf_filename(invoice):
+    return f"Invoice_{invoice.invoice_number}.pdf"
+
 
-    response = HttpResponse(pdf, content_type="application/pdf")
-    response["Content-Disposition"] = (
-        f'inline; filename="Invoice_{invoice.invoice_number}.pdf"'
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def invoice_pdf(request, pk):
+    invoice = get_object_or_404(
+        Invoice.objects.select_related('client', 'work_order'),
+        pk=pk
+    )
+    return serve_pdf(
+        request,
+        INVOICE_PDF_TEMPLATE,
+        invoice.pdf_fingerprint(),
+        lambda: invoice_pdf_context(invoice),
+        invoice_pdf_filename(invoice),
     )
-    return response
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template
+from django.template.loader_tags import ExtendsNode, IncludeNode
+
+
+_file_digests = {}
+
+
+def file_digest(path):
+    """SHA-256 of a file, recomputed only when it changes on disk."""
+    mtime = os.stat(path).st_mtime_ns
+    cached = _file_digests.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _file_digests[path] = (mtime, digest)
+    return digest
+
+
+def template_sources(template_name):
+    """Paths of `template_name` and of every template it extends or includes, directly or not.
+
+    Only names written as literals can be followed; a template picked by a
+    variable at render time isn't known here.
+    """
+    paths = set()
+    pending = [template_name]
+    while pending:
+        template = get_template(pending.pop()).template
+        if template.origin.name in paths:
+            continue
+        paths.add(template.origin.name)
+        for node in template.nodelist.get_nodes_by_type((ExtendsNode, IncludeNode)):
+            name = (node.parent_name if isinstance(node, ExtendsNode) else node.template).var
+            if isinstance(name, str):
+                pending.append(name)
+    return sorted(paths)
+
+
+def template_digest(template_name):
+    """SHA-256 over the source of the template and of everything it extends or includes."""
+    digest = hashlib.sha256()
+    for path in template_sources(template_name):
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+
+def pdf_cache_key(template_name, fingerprint):
+    """Content address for a rendered PDF: the template sources plus everything the template reads."""
+    parts = [template_name, template_digest(template_name)]
+    parts += [str(part) for part in fingerprint]
+    return hashlib.sha256('|'.join(parts).encode()).hexdigest()
+
+
+class PDFCache:
+    """Size-bounded on-disk PDF store. Reads refresh an entry's mtime; the oldest entries are evicted first."""
+
+    suffix = '.pdf'
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def path(self, key):
+        return self.directory / f"{key}{self.suffix}"
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key, data):
+        """Store `data` under `key`. Returns False, storing nothing, if the cache is off or `data` can't fit."""
+        if not self.enabled or len(data) > self.max_bytes:
+            return False
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename so a concurrent reader never sees a partial PDF.
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self.evict()
+        return True
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(self.suffix):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _mtime, size, path in entries:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+def get_pdf_cache():
+    return PDFCache(settings.PDF_CACHE_DIR, settings.PDF_CACHE_MAX_BYTES)
@@ -0,0 +1,122 @@
+import io
+import logging
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.template.loader import render_to_string
+from rest_framework.exceptions import ValidationError
+
+from . import jobs
+from .cache import get_pdf_cache, pdf_cache_key
+from .worker import write_pdf
+
+logger = logging.getLogger(__name__)
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable buffer.
+
+    Because it can't seek, zipfile writes each member with a trailing data
+    descriptor instead of patching its header, so every finished member can
+    be drained and sent before the next one starts.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def filter_export_queryset(request, queryset):
+    """Narrow to `?ids=1,2,3` when given and enforce PDF_EXPORT_MAX_FILES."""
+    ids = request.query_params.get('ids')
+    if ids:
+        try:
+            queryset = queryset.filter(id__in=[int(i) for i in ids.split(',') if i.strip()])
+        except ValueError:
+            raise ValidationError({'ids': 'Expected a comma-separated list of ids.'})
+    count = queryset.count()
+    if count == 0:
+        raise ValidationError({'error': 'Nothing to export.'})
+    if count > settings.PDF_EXPORT_MAX_FILES:
+        raise ValidationError({
+            'error': f'Export is limited to {settings.PDF_EXPORT_MAX_FILES} files; narrow the filter.'
+        })
+    return queryset
+
+
+def _stream_zip(items):
+    sink = _ZipSink()
+    cache = get_pdf_cache()
+    window = max(settings.PDF_RENDER_WORKERS * 2, 1)
+    in_flight = {}
+    failed = []
+
+    def collect(futures):
+        for future in futures:
+            filename, key = in_flight.pop(future)
+            try:
+                pdf = future.result()
+            except Exception as exc:
+                if isinstance(exc, BrokenProcessPool):
+                    jobs.discard_executor(executor)
+                logger.exception("PDF export render failed for %s", filename)
+                failed.append(f"{filename}: {exc}")
+                continue
+            cache.put(key, pdf)
+            archive.writestr(filename, pdf)
+
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        executor = jobs.get_executor()
+        for filename, template_name, fingerprint, get_context in items:
+            key = pdf_cache_key(template_name, fingerprint)
+            pdf = cache.get(key)
+            if pdf is not None:
+                archive.writestr(filename, pdf)
+                yield sink.drain()
+                continue
+            html_string = render_to_string(template_name, get_context())
+            try:
+                in_flight[executor.submit(write_pdf, html_string)] = (filename, key)
+            except BrokenProcessPool:
+                jobs.discard_executor(executor)
+                executor = jobs.get_executor()
+                in_flight[executor.submit(write_pdf, html_string)] = (filename, key)
+            if len(in_flight) >= window:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+                yield sink.drain()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(done)
+            yield sink.drain()
+        if failed:
+            archive.writestr('errors.txt', '\n'.join(failed) + '\n')
+    yield sink.drain()
+
+
+def pdf_zip_response(items, archive_name):
+    """Stream a ZIP of rendered PDFs, sending each member as soon as it is ready.
+
+    `items` yields `(filename, template_name, fingerprint, get_context)`.
+    Cached PDFs are written straight away; misses render in parallel on the
+    PDF process pool with a bounded number in flight. Renders that fail are
+    listed in errors.txt inside the archive, since the response status has
+    already been sent by then.
+    """
+    response = StreamingHttpResponse(_stream_zip(items), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{archive_name}"'
+    return response
@@ -0,0 +1,146 @@
+import json
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from django.conf import settings
+
+from .cache import get_pdf_cache
+from .worker import write_pdf
+
+logger = logging.getLogger(__name__)
+
+# Job ids are PDF cache keys, so a finished job is simply a cache entry and
+# resubmitting unchanged content never renders twice. Job state lives next
+# to the cache on disk so any gunicorn worker can answer a status poll. The
+# pool and the PDF_RENDER_QUEUE_DEPTH limit are per process, though: a server
+# with N gunicorn workers renders up to N * PDF_RENDER_WORKERS PDFs at once
+# and queues up to N * PDF_RENDER_QUEUE_DEPTH.
+
+_lock = threading.Lock()
+_executor = None
+_pending = set()
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.PDF_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def discard_executor(executor):
+    # A pool whose worker died (OOM, segfault in a native library) rejects all
+    # further work; drop it so the next submit starts a fresh one.
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def queue_depth():
+    """Jobs submitted from this process that have not finished yet. Other workers keep their own count."""
+    with _lock:
+        return len(_pending)
+
+
+def _jobs_dir():
+    return Path(settings.PDF_CACHE_DIR) / 'jobs'
+
+
+def _state_path(job_id):
+    return _jobs_dir() / f"{job_id}.json"
+
+
+def _write_state(job_id, **state):
+    directory = _jobs_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, _state_path(job_id))
+
+
+def _read_state(job_id):
+    try:
+        with open(_state_path(job_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def job_status(job_id):
+    """Return the job's state dict, or None if the job is unknown or its PDF was evicted."""
+    state = _read_state(job_id) or {}
+    if get_pdf_cache().path(job_id).exists():
+        return {**state, 'status': 'done'}
+    status = state.get('status')
+    if status == 'pending' and time.time() - state['submitted_at'] > settings.PDF_RENDER_JOB_TIMEOUT:
+        return {**state, 'status': 'failed', 'error': 'Render timed out'}
+    if status in ('pending', 'failed'):
+        return state
+    return None
+
+
+def submit(job_id, html_string, filename):
+    """Queue `html_string` for rendering under `job_id`. Raises RenderQueueFull when at capacity."""
+    state = job_status(job_id)
+    if state and state['status'] in ('pending', 'done'):
+        return state
+
+    with _lock:
+        if len(_pending) >= settings.PDF_RENDER_QUEUE_DEPTH:
+            raise RenderQueueFull
+        _pending.add(job_id)
+
+    state = {'status': 'pending', 'filename': filename, 'submitted_at': time.time()}
+    try:
+        _write_state(job_id, **state)
+        executor = get_executor()
+        try:
+            future = executor.submit(write_pdf, html_string)
+        except BrokenProcessPool:
+            discard_executor(executor)
+            executor = get_executor()
+            future = executor.submit(write_pdf, html_string)
+    except BaseException:
+        with _lock:
+            _pending.discard(job_id)
+        raise
+    future.add_done_callback(lambda f: _finish(executor, job_id, state, f))
+    return state
+
+
+def _finish(executor, job_id, state, future):
+    try:
+        if get_pdf_cache().put(job_id, future.result()):
+            _write_state(job_id, **{**state, 'status': 'done'})
+        else:
+            # Status and download read the PDF from the cache, so a job whose PDF wasn't stored can't succeed.
+            _write_state(job_id, **{
+                **state, 'status': 'failed', 'too_large': True,
+                'error': 'PDF is larger than the render cache allows; request it without mode=async',
+            })
+    except Exception as exc:
+        if isinstance(exc, BrokenProcessPool):
+            discard_executor(executor)
+        logger.exception("PDF render job %s failed", job_id)
+        _write_state(job_id, **{**state, 'status': 'failed', 'error': str(exc)})
+    finally:
+        with _lock:
+            _pending.discard(job_id)
@@ -0,0 +1,78 @@
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import jobs
+from .cache import get_pdf_cache, pdf_cache_key
+from .worker import write_pdf
+
+
+def render_pdf(template_name, context):
+    return write_pdf(render_to_string(template_name, context))
+
+
+def pdf_response(pdf, filename):
+    response = HttpResponse(pdf, content_type="application/pdf")
+    response["Content-Disposition"] = f'inline; filename="{filename}"'
+    return response
+
+
+def cached_pdf_response(template_name, fingerprint, get_context, filename):
+    """Serve a PDF from the render cache, rendering and storing it on a miss.
+
+    `get_context` is only called on a miss, so the caller can defer loading
+    related rows until a render is actually needed.
+    """
+    cache = get_pdf_cache()
+    key = pdf_cache_key(template_name, fingerprint)
+    pdf = cache.get(key)
+    hit = pdf is not None
+    if not hit:
+        pdf = render_pdf(template_name, get_context())
+        cache.put(key, pdf)
+    response = pdf_response(pdf, filename)
+    response["X-PDF-Cache"] = "hit" if hit else "miss"
+    return response
+
+
+def job_payload(job_id, state):
+    return {
+        'job_id': job_id,
+        'status': state['status'],
+        'error': state.get('error'),
+        'status_url': reverse('pdf-job-status', args=[job_id]),
+        'download_url': reverse('pdf-job-download', args=[job_id]),
+    }
+
+
+def render_job_response(template_name, fingerprint, get_context, filename):
+    """Queue the render on the process pool and return the job id straight away."""
+    if not get_pdf_cache().enabled:
+        return Response(
+            {'error': 'Async rendering requires the PDF cache to be enabled'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    job_id = pdf_cache_key(template_name, fingerprint)
+    state = jobs.job_status(job_id)
+    # Retry failed renders, except ones that will never fit in the cache.
+    if not state or (state['status'] == 'failed' and not state.get('too_large')):
+        html_string = render_to_string(template_name, get_context())
+        try:
+            state = jobs.submit(job_id, html_string, filename)
+        except jobs.RenderQueueFull:
+            return Response(
+                {'error': 'PDF render queue is full, try again shortly'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': '5'},
+            )
+    code = status.HTTP_200_OK if state['status'] == 'done' else status.HTTP_202_ACCEPTED
+    return Response(job_payload(job_id, state), status=code)
+
+
+def serve_pdf(request, template_name, fingerprint, get_context, filename):
+    """Render inline by default; `?mode=async` hands the render to the job pool instead."""
+    if request.query_params.get('mode') == 'async':
+        return render_job_response(template_name, fingerprint, get_context, filename)
+    return cached_pdf_response(template_name, fingerprint, get_context, filename)
@@ -0,0 +1,251 @@
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from django_project.testing import add_events, make_work_order, without_throttling
+from invoices.models import Invoice
+from workorders.models import Event, JobAttachment, WorkOrder
+from workorders.views import WORKORDER_PDF_TEMPLATE, workorder_pdf_context
+
+from . import jobs
+from .cache import template_digest
+
+FAKE_PDF = b'%PDF-1.7 fake'
+
+
+@without_throttling
+class PDFTestCase(APITestCase):
+    """Renders into a temp cache directory, with WeasyPrint replaced by a canned PDF."""
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        settings_override = override_settings(PDF_CACHE_DIR=cache_dir, PDF_CACHE_MAX_BYTES=1024 * 1024)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for target in ('pdfs.render.write_pdf', 'pdfs.jobs.write_pdf'):
+            patcher = mock.patch(target, return_value=FAKE_PDF)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client.force_authenticate(CustomUser.objects.create_user('pdfs', password='pdfs-pass'))
+        self.work_order = make_work_order(events=1)
+
+
+class TemplateDigestTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.write('base.html', '<h1>{% block body %}{% endblock %}</h1>')
+        self.write('page.html', '{% extends "base.html" %}{% block body %}{% include "part.html" %}{% endblock %}')
+        self.write('part.html', '{{ work_order.pk }}')
+        settings_override = override_settings(TEMPLATES=[{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates', 'DIRS': [self.directory],
+        }])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write(self, name, source):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(source)
+        # Step the mtime on, so a rewrite within the clock's resolution is still seen.
+        mtime = os.stat(path).st_mtime_ns + 1_000_000_000
+        os.utime(path, ns=(mtime, mtime))
+
+    def test_digest_covers_extended_and_included_templates(self):
+        digests = [template_digest('page.html')]
+        edits = [('part.html', 'Work order {{ work_order.pk }}'), ('base.html', '<h2>{% block body %}{% endblock %}</h2>')]
+        for name, source in edits:
+            self.write(name, source)
+            digests.append(template_digest('page.html'))
+        self.assertEqual(len(set(digests)), 3)
+        self.assertEqual(template_digest('page.html'), digests[-1])
+
+    def test_unrelated_template_does_not_change_the_digest(self):
+        digest = template_digest('part.html')
+        self.write('base.html', '<h2>{% block body %}{% endblock %}</h2>')
+        self.assertEqual(template_digest('part.html'), digest)
+
+
+class PDFCacheTests(PDFTestCase):
+    def download(self):
+        response = self.client.get(f'/api/workorders/{self.work_order.pk}/pdf/')
+        self.assertEqual(response.status_code, 200)
+        return response['X-PDF-Cache']
+
+    def test_repeat_download_is_served_from_the_cache(self):
+        self.assertEqual([self.download(), self.download()], ['miss', 'hit'])
+
+    def test_changes_to_what_the_pdf_shows_invalidate_it(self):
+        self.download()
+        changes = {
+            'work order': lambda: self.work_order.save(),
+            'client': lambda: self.work_order.client.save(),
+            'new event': lambda: add_events(self.work_order, 1),
+            'deleted event': lambda: self.work_order.events.earliest('id').delete(),
+        }
+        for label, change in changes.items():
+            with self.subTest(label):
+                change()
+                self.assertEqual([self.download(), self.download()], ['miss', 'hit'])
+
+    def test_template_change_invalidates_it(self):
+        self.download()
+        with mock.patch('pdfs.cache.template_digest', return_value='edited'):
+            self.assertEqual(self.download(), 'miss')
+
+
+class WorkOrderContextTests(PDFTestCase):
+    def test_lists_come_from_one_prefetch_per_table(self):
+        work_order = make_work_order(events=2, notes=2, attachments=2)
+        first, second = work_order.events.all()
+        first.date, second.date = None, first.date - timedelta(days=1)
+        Event.objects.bulk_update([first, second], ['date'])
+        JobAttachment.objects.create(work_order=work_order, file='', file_type='pdf')
+        work_order = WorkOrder.objects.select_related('client').get(pk=work_order.pk)
+
+        with self.assertNumQueries(3):
+            context = workorder_pdf_context(work_order)
+            render_to_string(WORKORDER_PDF_TEMPLATE, context)
+        self.assertEqual(context['events'], [second, first])
+        created = [note.created_at for note in context['notes']]
+        self.assertEqual((len(created), created), (2, sorted(created, reverse=True)))
+        self.assertEqual(len(context['attachments']), 2)
+
+
+class RenderJobTests(PDFTestCase):
+    def setUp(self):
+        super().setUp()
+        # Run renders on a thread so the patched write_pdf is used; shutdown() waits for _finish.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        patcher = mock.patch.object(jobs, 'get_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self):
+        response = self.client.get(f'/api/workorders/{self.work_order.pk}/pdf/', {'mode': 'async'})
+        self.executor.shutdown(wait=True)
+        return response
+
+    def test_submit_then_status_and_download(self):
+        response = self.submit()
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['job_id']
+
+        status = self.client.get(response.data['status_url'])
+        self.assertEqual((status.status_code, status.data['status']), (200, 'done'))
+        download = self.client.get(response.data['download_url'])
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(download.content, FAKE_PDF)
+
+        # Unchanged content is the same job, already done.
+        again = self.client.get(f'/api/workorders/{self.work_order.pk}/pdf/', {'mode': 'async'})
+        self.assertEqual((again.status_code, again.data['job_id']), (200, job_id))
+
+    def test_pdf_too_large_for_the_cache_fails_the_job(self):
+        with self.settings(PDF_CACHE_MAX_BYTES=len(FAKE_PDF) - 1):
+            response = self.submit()
+            status = self.client.get(response.data['status_url'])
+            self.assertEqual(status.data['status'], 'failed')
+            self.assertIn('without mode=async', status.data['error'])
+            self.assertEqual(self.client.get(response.data['download_url']).status_code, 409)
+
+            # Not resubmitted: it would fail the same way.
+            with mock.patch.object(jobs, 'submit') as submit:
+                again = self.client.get(f'/api/workorders/{self.work_order.pk}/pdf/', {'mode': 'async'})
+            submit.assert_not_called()
+            self.assertEqual(again.data['status'], 'failed')
+
+    def test_render_error_fails_the_job(self):
+        with mock.patch('pdfs.jobs.write_pdf', side_effect=RuntimeError('bad font')), \
+                self.assertLogs('pdfs.jobs', 'ERROR'):
+            response = self.submit()
+        status = self.client.get(response.data['status_url'])
+        self.assertEqual((status.data['status'], status.data['error']), ('failed', 'bad font'))
+
+    def test_full_queue_is_rejected(self):
+        with self.settings(PDF_RENDER_QUEUE_DEPTH=0):
+            response = self.submit()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+    def test_unknown_job(self):
+        response = self.client.get(f'/api/pdfs/jobs/{"0" * 64}/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ExportTests(PDFTestCase):
+    def setUp(self):
+        super().setUp()
+        # Exports render on the process pool; a thread pool can use the patched write_pdf.
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        self.write_pdf = mock.Mock(return_value=FAKE_PDF)
+        for patcher in (
+            mock.patch.object(jobs, 'get_executor', return_value=executor),
+            mock.patch('pdfs.export.write_pdf', self.write_pdf),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.work_orders = [self.work_order] + [
+            make_work_order(events=2, notes=1, attachments=1) for _ in range(2)
+        ]
+
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_export_zips_a_pdf_per_work_order(self):
+        archive = self.export('/api/workorders/export/')
+        self.assertEqual(
+            sorted(archive.namelist()), sorted(f'WorkOrder_{work_order.pk}.pdf' for work_order in self.work_orders),
+        )
+        self.assertEqual(archive.read(f'WorkOrder_{self.work_order.pk}.pdf'), FAKE_PDF)
+
+    def test_export_reuses_pdfs_cached_by_single_downloads(self):
+        self.client.get(f'/api/workorders/{self.work_order.pk}/pdf/')
+
+        archive = self.export('/api/workorders/export/', ids=str(self.work_order.pk))
+        self.assertEqual(archive.namelist(), [f'WorkOrder_{self.work_order.pk}.pdf'])
+        self.write_pdf.assert_not_called()
+
+    def test_failed_renders_are_listed_in_the_archive(self):
+        self.write_pdf.side_effect = RuntimeError('bad font')
+        with self.assertLogs('pdfs.export', 'ERROR'):
+            archive = self.export('/api/workorders/export/', ids=str(self.work_order.pk))
+        self.assertEqual(archive.namelist(), ['errors.txt'])
+        self.assertIn('bad font', archive.read('errors.txt').decode())
+
+    def test_invoice_export(self):
+        invoice = Invoice.objects.create(
+            client=self.work_order.client, work_order=self.work_order, amount=Decimal('120.00'),
+        )
+        archive = self.export('/api/invoices/export/')
+        self.assertEqual(archive.namelist(), [f'Invoice_{invoice.invoice_number}.pdf'])
+
+    def test_too_many_files_are_refused(self):
+        with self.settings(PDF_EXPORT_MAX_FILES=2):
+            response = self.client.get('/api/workorders/export/')
+        self.assertEqual(response.status_code, 400)
+
+    def test_annotated_fingerprints_match_and_run_no_queries(self):
+        invoice = Invoice.objects.create(
+            client=self.work_order.client, work_order=self.work_order, amount=Decimal('120.00'),
+        )
+        for model, pk in ((WorkOrder, self.work_orders[1].pk), (Invoice, invoice.pk)):
+            annotated = model.with_pdf_fingerprint(model.objects.all()).get(pk=pk)
+            with self.assertNumQueries(0):
+                fingerprint = annotated.pdf_fingerprint()
+            self.assertEqual(fingerprint, model.objects.get(pk=pk).pdf_fingerprint())
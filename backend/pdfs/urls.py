@@ -0,0 +1,8 @@
+from django.urls import path, re_path
+from .views import job_status, job_download, job_stats
+
+urlpatterns = [
+    path('jobs/stats/', job_stats, name='pdf-job-stats'),
+    re_path(r'^jobs/(?P<job_id>[0-9a-f]{64})/$', job_status, name='pdf-job-status'),
+    re_path(r'^jobs/(?P<job_id>[0-9a-f]{64})/download/$', job_download, name='pdf-job-download'),
+]
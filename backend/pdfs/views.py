@@ -0,0 +1,40 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from django.conf import settings
+
+from . import jobs
+from .cache import get_pdf_cache
+from .render import job_payload, pdf_response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_status(request, job_id):
+    state = jobs.job_status(job_id)
+    if state is None:
+        return Response({'error': 'Unknown or expired job'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(job_payload(job_id, state))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_download(request, job_id):
+    state = jobs.job_status(job_id)
+    if state is None:
+        return Response({'error': 'Unknown or expired job'}, status=status.HTTP_404_NOT_FOUND)
+    pdf = get_pdf_cache().get(job_id) if state['status'] == 'done' else None
+    if pdf is None:
+        return Response(job_payload(job_id, state), status=status.HTTP_409_CONFLICT)
+    return pdf_response(pdf, state.get('filename', f"{job_id}.pdf"))
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_stats(request):
+    return Response({
+        'queue_depth': jobs.queue_depth(),
+        'max_queue_depth': settings.PDF_RENDER_QUEUE_DEPTH,
+        'workers': settings.PDF_RENDER_WORKERS,
+    })
@@ -0,0 +1,10 @@
+"""Entry point for the PDF render pool.
+
+Kept free of Django imports so spawned pool processes start quickly and
+never touch the database; callers render the HTML and pass it in.
+"""
+from weasyprint import HTML
+
+
+def write_pdf(html_string):
+    return HTML(string=html_string).write_pdf()
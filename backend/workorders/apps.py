@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class WorkordersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'workorders'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,216 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from clients.models import Client
+from workorders.models import Event, WorkOrder
+
+# Times the main API endpoints in-process through the full middleware and
+# DRF stack, against whatever database DATABASE_URL points at (SQLite or
+# PostgreSQL). Throttling is switched off by pointing the throttle cache at
+# a dummy backend, and the PDF cache is disabled so every PDF sample is a
+# real render.
+
+ENDPOINTS = [
+    'workorder-list', 'workorder-list-cursor', 'workorder-detail', 'workorder-search',
+    'client-list', 'invoice-list', 'calendar', 'reorder', 'workorder-pdf',
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Time the list, detail, search, calendar, reorder and PDF endpoints and report p50/p95 latency and query counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', default='',
+            help="Comma-separated work order counts, e.g. 10000,100000. Before each run, seed_data tops the "
+                 "database up to that many work orders. Default: benchmark the data already present.",
+        )
+        parser.add_argument('--iterations', type=int, default=20, help="Timed requests per endpoint (default 20).")
+        parser.add_argument('--warmup', type=int, default=2, help="Untimed requests per endpoint first (default 2).")
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help="Comma-separated subset to run.")
+        parser.add_argument('--output', help="Write the results as JSON to this file.")
+        parser.add_argument('--baseline', help="Earlier --output file to compare against.")
+        parser.add_argument(
+            '--max-regression', type=float, default=0.25,
+            help="Fail when p95 exceeds the baseline by more than this fraction (default 0.25).",
+        )
+        parser.add_argument('--max-p95-ms', type=float, help="Fail when any endpoint's p95 exceeds this many ms.")
+        parser.add_argument('--max-queries', type=int, help="Fail when any endpoint runs more queries than this.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for picking rows and seeding data.")
+        parser.add_argument('--force', action='store_true', help="Run even when DEBUG is off (seeding writes data).")
+
+    def handle(self, *args, **options):
+        unknown = set(options['endpoints'].split(',')) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}. Choose from {', '.join(ENDPOINTS)}.")
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1.")
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',') if scale.strip()]
+        except ValueError:
+            raise CommandError("--scales must be a comma-separated list of integers.")
+        if scales and not settings.DEBUG and not options['force']:
+            raise CommandError("Refusing to seed synthetic data with DEBUG off; pass --force if you mean it.")
+
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        endpoints = [name for name in ENDPOINTS if name in options['endpoints'].split(',')]
+        user, _ = CustomUser.objects.get_or_create(username='benchmark')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+        results = {}
+        for scale in scales or [None]:
+            if scale is not None:
+                missing = scale - WorkOrder.objects.count()
+                if missing > 0:
+                    call_command('seed_data', work_orders=missing, seed=options['seed'] + scale, force=True,
+                                 stdout=self.stdout)
+            label = str(scale if scale is not None else WorkOrder.objects.count())
+            self.stdout.write(f"\n{connection.vendor}, {label} work orders")
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+                PDF_CACHE_MAX_BYTES=0,
+            ):
+                results[label] = self.run_scale(endpoints)
+            self.report(results[label])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'vendor': connection.vendor, 'results': results}, f, indent=2)
+        failures = self.check_thresholds(results)
+        if failures:
+            raise CommandError("Benchmark thresholds exceeded:\n  " + "\n  ".join(failures))
+
+    def run_scale(self, endpoints):
+        ids = list(WorkOrder.objects.order_by('-id').values_list('id', flat=True)[:max(50, self.options['iterations'])])
+        if not ids:
+            raise CommandError("No work orders to benchmark; run seed_data or pass --scales.")
+        requests = self.build_requests(ids)
+
+        results = {}
+        for name in endpoints:
+            make_request = requests[name]
+            if make_request is None:
+                self.stdout.write(f"  {name}: skipped, no data for it")
+                continue
+            for _ in range(self.options['warmup']):
+                self.send(make_request())
+            timings = []
+            queries = []
+            statuses = set()
+            for _ in range(self.options['iterations']):
+                elapsed, count, status_code = self.send(make_request())
+                timings.append(elapsed)
+                queries.append(count)
+                statuses.add(status_code)
+            results[name] = {
+                'p50_ms': round(percentile(timings, 50), 2),
+                'p95_ms': round(percentile(timings, 95), 2),
+                'queries': max(queries),
+                'statuses': sorted(statuses),
+            }
+        return results
+
+    def build_requests(self, ids):
+        rng = self.rng
+        today = timezone.localdate()
+        start, end = today - timedelta(days=14), today + timedelta(days=14)
+
+        client_name = Client.objects.filter(work_order_count__gt=0).values_list('name', flat=True).first()
+        term = client_name.split()[1] if client_name and len(client_name.split()) > 1 else client_name
+
+        busiest = (
+            Event.objects.filter(date__gte=start, date__lte=end)
+            .values('date').annotate(n=Count('id')).order_by('-n').first()
+        )
+        day_events = []
+        if busiest:
+            day_events = list(Event.objects.filter(date=busiest['date']).values_list('id', flat=True)[:20])
+
+        def reorder():
+            order = day_events[:]
+            rng.shuffle(order)
+            payload = {'events': [{'id': event_id, 'daily_order': i} for i, event_id in enumerate(order, start=1)]}
+            return ('post', '/api/workorders/events/update_daily_order/', payload)
+
+        return {
+            'workorder-list': lambda: ('get', '/api/workorders/', None),
+            'workorder-list-cursor': lambda: ('get', '/api/workorders/?pagination=cursor', None),
+            'workorder-detail': lambda: ('get', f'/api/workorders/{rng.choice(ids)}/', None),
+            'workorder-search': (lambda: ('get', '/api/workorders/', {'search': term})) if term else None,
+            'client-list': lambda: ('get', '/api/clients/', None),
+            'invoice-list': lambda: ('get', '/api/invoices/', None),
+            'calendar': lambda: ('get', '/api/calendar/events/', {'start': start.isoformat(), 'end': end.isoformat()}),
+            'reorder': reorder if day_events else None,
+            'workorder-pdf': lambda: ('get', f'/api/workorders/{rng.choice(ids)}/pdf/', None),
+        }
+
+    def send(self, request):
+        method, path, data = request
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if method == 'post':
+                response = self.client.post(path, data, format='json')
+            else:
+                response = self.client.get(path, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - started) * 1000
+        return elapsed, len(queries), response.status_code
+
+    def report(self, results):
+        self.stdout.write(f"  {'endpoint':<24}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}  status")
+        for name, row in results.items():
+            statuses = ','.join(map(str, row['statuses']))
+            line = f"  {name:<24}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['queries']:>9}  {statuses}"
+            self.stdout.write(line if all(code < 400 for code in row['statuses']) else self.style.ERROR(line))
+
+    def check_thresholds(self, results):
+        options = self.options
+        baseline = {}
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)['results']
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Could not read baseline {options['baseline']}: {exc}")
+
+        failures = []
+        for scale, rows in results.items():
+            for name, row in rows.items():
+                where = f"{name} at {scale}"
+                if any(code >= 400 for code in row['statuses']):
+                    failures.append(f"{where}: responded {row['statuses']}")
+                if options['max_p95_ms'] is not None and row['p95_ms'] > options['max_p95_ms']:
+                    failures.append(f"{where}: p95 {row['p95_ms']}ms > {options['max_p95_ms']}ms")
+                if options['max_queries'] is not None and row['queries'] > options['max_queries']:
+                    failures.append(f"{where}: {row['queries']} queries > {options['max_queries']}")
+                before = baseline.get(scale, {}).get(name)
+                if before:
+                    limit = before['p95_ms'] * (1 + options['max_regression'])
+                    if row['p95_ms'] > limit:
+                        failures.append(f"{where}: p95 {row['p95_ms']}ms > {limit:.1f}ms (baseline {before['p95_ms']}ms)")
+                    if row['queries'] > before['queries']:
+                        failures.append(f"{where}: {row['queries']} queries, baseline ran {before['queries']}")
+        return failures
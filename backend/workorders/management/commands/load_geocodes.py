@@ -0,0 +1,73 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from workorders.models import Event, GeocodedAddress, normalize_address
+
+# The geocode cache is filled from CSV (address, latitude, longitude) so route
+# proposals never depend on a geocoding service. --missing writes the event
+# addresses that have no coordinates yet in the same format, ready to be
+# geocoded elsewhere and loaded back.
+
+COLUMNS = ['address', 'latitude', 'longitude']
+
+
+class Command(BaseCommand):
+    help = "Load address coordinates into the geocode cache from CSV, or list event addresses missing from it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', nargs='?', help="CSV with address, latitude and longitude columns.")
+        parser.add_argument('--missing', action='store_true',
+                            help="Write event addresses with no cached coordinates to stdout as CSV.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['missing']:
+            self.write_missing()
+        elif options['csv_path']:
+            self.load(options['csv_path'], options['batch_size'])
+        else:
+            raise CommandError("Give a CSV path to load, or --missing.")
+
+    def load(self, path, batch_size):
+        rows = {}
+        skipped = 0
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.DictReader(f)
+                if not set(COLUMNS) <= set(reader.fieldnames or []):
+                    raise CommandError(f"{path} needs the columns: {', '.join(COLUMNS)}")
+                for row in reader:
+                    address = normalize_address(row['address'] or '')
+                    try:
+                        latitude, longitude = float(row['latitude']), float(row['longitude'])
+                    except (TypeError, ValueError):
+                        latitude = longitude = None
+                    if not address or latitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                        skipped += 1
+                        continue
+                    # Later rows for the same address win; one upsert can't touch a row twice.
+                    rows[address] = (latitude, longitude)
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        GeocodedAddress.objects.bulk_create(
+            (GeocodedAddress(address=address, latitude=lat, longitude=lon) for address, (lat, lon) in rows.items()),
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['address'],
+            update_fields=['latitude', 'longitude', 'updated_at'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Loaded {len(rows)} addresses, skipped {skipped} invalid rows."))
+
+    def write_missing(self):
+        addresses = {
+            normalize_address(address)
+            for address in Event.objects.exclude(address='').values_list('address', flat=True).distinct().iterator()
+        }
+        cached = set(GeocodedAddress.objects.values_list('address', flat=True).iterator())
+        writer = csv.writer(self.stdout)
+        writer.writerow(COLUMNS)
+        for address in sorted(addresses - cached):
+            writer.writerow([address, '', ''])
+        self.stderr.write(f"{len(addresses - cached)} of {len(addresses)} event addresses have no coordinates.")
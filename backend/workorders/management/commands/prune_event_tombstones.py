@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from workorders.models import EventTombstone
+
+
+class Command(BaseCommand):
+    help = "Delete event tombstones older than CALENDAR_TOMBSTONE_RETENTION_DAYS."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=settings.CALENDAR_TOMBSTONE_RETENTION_DAYS)
+        deleted, _ = EventTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} event tombstones."))
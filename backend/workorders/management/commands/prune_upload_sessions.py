@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from workorders.models import UploadSession
+from workorders.uploads import discard_part, temp_dir
+
+
+class Command(BaseCommand):
+    help = "Delete upload sessions idle for ATTACHMENT_UPLOAD_SESSION_TTL_HOURS and their temp files."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(hours=settings.ATTACHMENT_UPLOAD_SESSION_TTL_HOURS)
+        stale = UploadSession.objects.filter(updated_at__lt=cutoff)
+        for session_id in stale.values_list('id', flat=True):
+            discard_part(session_id)
+        deleted, _ = stale.delete()
+
+        # Temp files whose session is gone, e.g. removed with its work order.
+        orphans = 0
+        directory = temp_dir()
+        if directory.exists():
+            live = {str(pk) for pk in UploadSession.objects.values_list('id', flat=True)}
+            for path in directory.glob('*.part'):
+                if path.stem not in live and path.stat().st_mtime < cutoff.timestamp():
+                    path.unlink(missing_ok=True)
+                    orphans += 1
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} upload sessions and {orphans} orphaned temp files."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from workorders.models import AttachmentBlob, JobAttachment, attachment_storage
+
+
+class Command(BaseCommand):
+    help = "Recount JobAttachment references to each attachment blob."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prune', action='store_true',
+            help="Delete blobs that no attachment references any more.",
+        )
+
+    def handle(self, *args, **options):
+        refs = JobAttachment.objects.filter(file=OuterRef('name')).order_by().values('file').annotate(
+            n=Count('id')
+        ).values('n')
+        updated = AttachmentBlob.objects.update(ref_count=Coalesce(Subquery(refs), 0))
+        self.stdout.write(self.style.SUCCESS(f"Recounted references for {updated} blobs."))
+
+        if options['prune']:
+            inner = attachment_storage().inner
+            pruned = 0
+            for blob in AttachmentBlob.objects.filter(ref_count=0):
+                inner.delete(blob.name)
+                blob.delete()
+                pruned += 1
+            self.stdout.write(self.style.SUCCESS(f"Pruned {pruned} unreferenced blobs."))
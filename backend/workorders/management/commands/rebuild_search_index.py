@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from workorders.search import refresh_search_index, search_enabled
+
+
+class Command(BaseCommand):
+    help = "Recompute the full-text search columns for every work order (PostgreSQL only)."
+
+    def handle(self, *args, **options):
+        if not search_enabled():
+            self.stdout.write("Search index is only maintained on PostgreSQL; nothing to do.")
+            return
+        refresh_search_index()
+        self.stdout.write(self.style.SUCCESS("Rebuilt work order search index."))
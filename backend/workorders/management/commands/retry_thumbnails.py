@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from workorders.models import JobAttachment
+from workorders.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Re-render thumbnails for image attachments whose thumbnail job failed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--include-pending', action='store_true',
+            help="Also render attachments still marked pending (e.g. jobs lost to a restart).",
+        )
+        parser.add_argument(
+            '--ignore-attempts', action='store_true',
+            help="Retry even attachments that have used up THUMBNAIL_MAX_ATTEMPTS.",
+        )
+
+    def handle(self, *args, **options):
+        statuses = ['failed', 'pending'] if options['include_pending'] else ['failed']
+        attachments = JobAttachment.objects.filter(file_type='image', thumbnail_status__in=statuses)
+        # Images uploaded before the pipeline existed have no status and no thumbnail.
+        attachments |= JobAttachment.objects.filter(file_type='image', thumbnail_status='', thumbnail='')
+        if not options['ignore_attempts']:
+            attachments = attachments.filter(thumbnail_attempts__lt=settings.THUMBNAIL_MAX_ATTEMPTS)
+
+        done = failed = 0
+        for attachment_id in attachments.values_list('id', flat=True).iterator():
+            if generate_thumbnails(attachment_id):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(f"Rendered thumbnails for {done} attachments, {failed} failed."))
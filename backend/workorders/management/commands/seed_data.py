@@ -0,0 +1,196 @@
+import random
+from datetime import time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from clients.models import Client
+from clients.stats import refresh_client_stats
+from clients.typeahead import invalidate_hot_clients
+from invoices.models import Invoice, allocate_invoice_numbers
+from invoices.rollups import rebuild_rollups
+from workorders.models import Event, JobAttachment, JobNote, WorkOrder, attachment_file_type
+from workorders.search import refresh_search_index
+
+# Synthetic data for load testing. Rows are written with bulk_create in
+# chunks of work orders, so memory stays flat at any scale. bulk_create skips
+# save() and signals, so the derived data (client stats, invoice rollups, the
+# search index) is rebuilt once at the end instead of row by row.
+
+FIRST_NAMES = [
+    'Ada', 'Bea', 'Carl', 'Dora', 'Eli', 'Fay', 'Gus', 'Hana', 'Ivo', 'June',
+    'Kurt', 'Lena', 'Milo', 'Nina', 'Otto', 'Pia', 'Rosa', 'Saul', 'Tess', 'Vera',
+]
+LAST_NAMES = [
+    'Abbott', 'Becker', 'Castillo', 'Dunn', 'Ellison', 'Fischer', 'Gallo', 'Hartley',
+    'Ivers', 'Jansen', 'Kowalski', 'Lindqvist', 'Moreau', 'Novak', 'Okafor', 'Park',
+    'Quinn', 'Rossi', 'Sato', 'Thorne', 'Ueda', 'Vance', 'Weber', 'Young',
+]
+ORGANIZATIONS = ['', '', '', ' Gallery', ' Collection', ' Studio', ' Foundation', ' & Co']
+STREETS = [
+    'Main St', 'Ocean Rd', 'Elm St', 'Dune Rd', 'Mill Ln', 'Harbor Dr', 'Pine Ave',
+    'Bay St', 'Meadow Ln', 'Hill Rd', 'Station Rd', 'Church St',
+]
+TOWNS = ['Southampton', 'East Hampton', 'Sag Harbor', 'Bridgehampton', 'Amagansett', 'Montauk', 'Water Mill']
+PIECES = ['painting', 'sculpture', 'triptych', 'mirror', 'tapestry', 'photograph set', 'mobile', 'print series']
+TASKS = ['Pick up and wrap', 'Deliver and hang', 'Move to storage', 'Crate for shipping', 'Install', 'Rotate']
+NOTES = [
+    'Client will be on site after 10am.', 'Use the side entrance, gate code on file.',
+    'Fragile frame, double wrap.', 'Needs two people and the padded dolly.',
+    'Confirm wall measurements before install.', 'Insurance paperwork sent.',
+]
+ATTACHMENT_EXTENSIONS = ['.pdf', '.docx', '.txt']
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic clients, work orders, events, notes, attachments and invoices for load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--work-orders', type=int, default=10_000, help="Work orders to create (default 10000).")
+        parser.add_argument(
+            '--orders-per-client', type=int, default=10,
+            help="Average work orders per client; sets how many clients are created (default 10).",
+        )
+        parser.add_argument('--events-per-order', type=int, default=2, help="Events per work order (default 2).")
+        parser.add_argument('--notes-per-order', type=int, default=1, help="Notes per work order (default 1).")
+        parser.add_argument(
+            '--attachments-per-order', type=int, default=1,
+            help="Attachment rows per work order (default 1). Rows point at placeholder names; no files are stored.",
+        )
+        parser.add_argument(
+            '--invoice-ratio', type=float, default=0.8,
+            help="Share of completed work orders that get an invoice (default 0.8).",
+        )
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Work orders written per batch (default 5000).")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed, for repeatable data sets.")
+        parser.add_argument('--force', action='store_true', help="Run even when DEBUG is off.")
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError("Refusing to seed synthetic data with DEBUG off; pass --force if you mean it.")
+        total = options['work_orders']
+        if total < 1 or options['orders_per_client'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--work-orders, --orders-per-client and --chunk-size must be positive.")
+
+        self.rng = random.Random(options['seed'])
+        self.today = timezone.localdate()
+        self.options = options
+        client_ids = self.create_clients(max(1, total // options['orders_per_client']))
+
+        counts = {'work orders': 0, 'events': 0, 'notes': 0, 'attachments': 0, 'invoices': 0}
+        for start in range(0, total, options['chunk_size']):
+            size = min(options['chunk_size'], total - start)
+            with transaction.atomic():
+                for name, count in self.create_chunk(client_ids, size).items():
+                    counts[name] += count
+            self.stdout.write(f"  {start + size}/{total} work orders")
+
+        self.stdout.write("Rebuilding client stats, invoice rollups and search index...")
+        # Whole-table rebuilds: an id list this long would exceed SQLite's parameter limit.
+        refresh_client_stats()
+        rebuild_rollups()
+        refresh_search_index()
+        invalidate_hot_clients()
+
+        summary = ', '.join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Created {len(client_ids)} clients, {summary}."))
+
+    def create_clients(self, count):
+        rng = self.rng
+        ids = []
+        for start in range(0, count, self.options['chunk_size']):
+            clients = []
+            for _ in range(min(self.options['chunk_size'], count - start)):
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}{rng.choice(ORGANIZATIONS)}"
+                address = self.address()
+                clients.append(Client(
+                    name=name,
+                    email=f"{name.split()[0].lower()}.{rng.randrange(100000)}@example.com",
+                    phone=f"631-555-{rng.randrange(10000):04d}",
+                    address=address,
+                    billing_address=address,
+                ))
+            ids += [client.pk for client in Client.objects.bulk_create(clients)]
+        return ids
+
+    def address(self):
+        return f"{self.rng.randrange(1, 999)} {self.rng.choice(STREETS)}, {self.rng.choice(TOWNS)}"
+
+    def create_chunk(self, client_ids, size):
+        rng = self.rng
+        options = self.options
+        now = timezone.now()
+
+        work_orders = []
+        created = []
+        for _ in range(size):
+            status = rng.choices(['pending', 'in_progress', 'completed'], weights=[3, 2, 5])[0]
+            age = timedelta(days=rng.randrange(730), minutes=rng.randrange(1440))
+            work_orders.append(WorkOrder(
+                client_id=rng.choice(client_ids),
+                job_description=f"{rng.choice(TASKS)} {rng.choice(PIECES)}",
+                estimated_cost=Decimal(rng.randrange(5000, 500000)) / 100,
+                status=status,
+                completed_at=min(now, now - age + timedelta(days=rng.randrange(1, 30))) if status == 'completed' else None,
+            ))
+            created.append(now - age)
+        WorkOrder.objects.bulk_create(work_orders)
+        # created_at is auto_now_add, which bulk_create fills with "now"; spread it out afterwards.
+        for work_order, created_at in zip(work_orders, created):
+            work_order.created_at = created_at
+        WorkOrder.objects.bulk_update(work_orders, ['created_at'], batch_size=500)
+
+        events = []
+        notes = []
+        attachments = []
+        invoices = []
+        for work_order, created_at in zip(work_orders, created):
+            first_day = min(created_at.date() + timedelta(days=rng.randrange(1, 14)), self.today + timedelta(days=90))
+            for i in range(options['events_per_order']):
+                events.append(Event(
+                    work_order=work_order,
+                    event_type=rng.choice(Event.EVENT_TYPES)[0],
+                    address=self.address(),
+                    date=first_day + timedelta(days=i * rng.randrange(1, 8)),
+                    daily_order=rng.randrange(1, 9),
+                    scheduled_time=time(rng.randrange(7, 18), rng.choice([0, 15, 30, 45])),
+                    completed=work_order.status == 'completed',
+                ))
+            for _ in range(options['notes_per_order']):
+                notes.append(JobNote(work_order=work_order, note=rng.choice(NOTES)))
+            for _ in range(options['attachments_per_order']):
+                name = f"job_attachments/seed/{work_order.pk}_{rng.randrange(10 ** 8)}{rng.choice(ATTACHMENT_EXTENSIONS)}"
+                attachments.append(JobAttachment(
+                    work_order=work_order,
+                    file=name,
+                    file_type=attachment_file_type(name),
+                    file_size=rng.randrange(10_000, 2_000_000),
+                ))
+            if work_order.status == 'completed' and rng.random() < options['invoice_ratio']:
+                invoices.append(Invoice(
+                    client_id=work_order.client_id,
+                    work_order=work_order,
+                    date_created=work_order.completed_at.date(),
+                    amount=work_order.estimated_cost,
+                    status=rng.choice(['unpaid', 'in_quickbooks', 'paid', 'paid']),
+                ))
+
+        Event.objects.bulk_create(events)
+        JobNote.objects.bulk_create(notes)
+        JobAttachment.objects.bulk_create(attachments)
+        if invoices:
+            first = allocate_invoice_numbers(len(invoices))
+            for number, invoice in enumerate(invoices, start=first):
+                invoice.invoice_number = str(number)
+            Invoice.objects.bulk_create(invoices)
+            WorkOrder.objects.filter(pk__in=[invoice.work_order_id for invoice in invoices]).update(invoiced=True)
+        return {
+            'work orders': len(work_orders),
+            'events': len(events),
+            'notes': len(notes),
+            'attachments': len(attachments),
+            'invoices': len(invoices),
+        }
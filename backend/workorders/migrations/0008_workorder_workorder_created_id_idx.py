@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0003_client_updated_at'),
+        ('workorders', '0007_event_tombstone_and_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workorder',
+            index=models.Index(fields=['-created_at', 'id'], name='workorder_created_id_idx'),
+        ),
+    ]
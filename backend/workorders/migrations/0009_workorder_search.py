@@ -0,0 +1,73 @@
+# Generated by Django 5.1.6 on 2026-10-18 07:58
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+# Frozen copy of workorders.search.REFRESH_SQL, used for the initial backfill.
+BACKFILL_SQL = """
+    WITH docs AS (
+        SELECT wo.id,
+               c.name AS client_name,
+               wo.job_description,
+               (SELECT string_agg(n.note, ' ') FROM workorders_jobnote n
+                WHERE n.work_order_id = wo.id) AS notes,
+               (SELECT string_agg(e.address, ' ') FROM workorders_event e
+                WHERE e.work_order_id = wo.id) AS addresses
+        FROM workorders_workorder wo
+        JOIN clients_client c ON c.id = wo.client_id
+    )
+    UPDATE workorders_workorder AS wo SET
+        search_document = concat_ws(' ', docs.client_name, docs.job_description, docs.notes, docs.addresses),
+        search_vector =
+            setweight(to_tsvector('english', coalesce(docs.client_name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(docs.job_description, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(docs.notes, '')), 'C') ||
+            setweight(to_tsvector('simple', coalesce(docs.addresses, '')), 'C')
+    FROM docs
+    WHERE docs.id = wo.id
+"""
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX workorder_search_vector_idx ON workorders_workorder USING gin (search_vector)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX workorder_search_trgm_idx ON workorders_workorder "
+        "USING gin (search_document gin_trgm_ops)"
+    )
+    schema_editor.execute(BACKFILL_SQL)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS workorder_search_vector_idx")
+    schema_editor.execute("DROP INDEX IF EXISTS workorder_search_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workorders', '0008_workorder_workorder_created_id_idx'),
+        ('clients', '0003_client_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workorder',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='workorder',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workorders', '0009_workorder_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobattachment',
+            name='thumbnail_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='jobattachment',
+            name='thumbnail_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='jobattachment',
+            name='thumbnail_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], max_length=10),
+        ),
+        migrations.AddField(
+            model_name='jobattachment',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
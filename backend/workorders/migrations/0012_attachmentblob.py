@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 08:06
+
+import workorders.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workorders', '0011_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='jobattachment',
+            name='file',
+            field=models.FileField(storage=workorders.models.attachment_storage, upload_to=workorders.models.job_attachment_upload_path, validators=[workorders.models.validate_file_type, workorders.models.validate_file_size]),
+        ),
+    ]
@@ -1,12 +1,17 @@
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
-from PIL import Image
+from django.core.files.storage import storages
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 import os
 import uuid
-from io import BytesIO
+from functools import lru_cache
 import cloudinary
 from cloudinary.models import CloudinaryField
+from cloudinary_storage.storage import MediaCloudinaryStorage
 
 
 def validate_file_type(file):
@@ -17,9 +22,55 @@ def validate_file_type(file):
 
 
 def validate_file_size(file):
-    max_size = 10 * 1024 * 1024  # 10MB
+    max_size = settings.ATTACHMENT_MAX_UPLOAD_SIZE
     if file.size > max_size:
-        raise ValidationError(f'File too large. Max size: 10MB.')
+        raise ValidationError(f'File too large. Max size: {max_size // (1024 * 1024)}MB.')
+
+
+def attachment_storage():
+    return storages['attachments']
+
+
+def attachment_file_type(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ['.jpg', '.jpeg', '.png', '.gif']:
+        return 'image'
+    elif ext == '.pdf':
+        return 'pdf'
+    elif ext in ['.doc', '.docx']:
+        return 'document'
+    return 'text'
+
+
+# Cloudinary delivery transformations per URL variant.
+DELIVERY_VARIANTS = {
+    'image': {},
+    'raw': {'resource_type': 'raw'},
+    'thumbnail': {'width': 200, 'height': 200, 'crop': 'fill', 'quality': 'auto', 'fetch_format': 'auto'},
+    'display': {'width': 800, 'height': 600, 'crop': 'limit', 'quality': 'auto', 'fetch_format': 'auto'},
+}
+
+
+@lru_cache(maxsize=4096)
+def _build_delivery_url(name, variant):
+    return cloudinary.CloudinaryImage(name).build_url(**DELIVERY_VARIANTS[variant])
+
+
+def delivery_url(name, variant):
+    """URL for a stored attachment in the given DELIVERY_VARIANTS variant.
+
+    On Cloudinary the variant is a delivery transformation, and the URL
+    depends only on (name, variant), so it is memoized. Other backends
+    (FileSystemStorage in development and tests) can't transform files, so
+    every variant is the stored file's own URL.
+    """
+    storage = attachment_storage()
+    if not isinstance(getattr(storage, 'inner', storage), MediaCloudinaryStorage):
+        return storage.url(name)
+    try:
+        return _build_delivery_url(name, variant)
+    except Exception:
+        return None
 
 
 def job_attachment_upload_path(instance, filename):
@@ -28,6 +79,23 @@ def job_attachment_upload_path(instance, filename):
     return f'job_attachments/{unique_filename}'
 
 
+def pdf_fingerprint_annotations(model, prefix, work_order='pk'):
+    """Correlated row count and latest updated_at of `model` per work order, as `<prefix>_count` and `<prefix>_latest`."""
+    rows = model.objects.filter(work_order=OuterRef(work_order)).order_by().values('work_order')
+    return {
+        f'{prefix}_count': Coalesce(Subquery(rows.annotate(n=Count('id')).values('n')), 0),
+        f'{prefix}_latest': Subquery(rows.annotate(latest=Max('updated_at')).values('latest')),
+    }
+
+
+def related_fingerprint(instance, prefix, related):
+    """[count, latest updated_at] of a related manager, from pdf_fingerprint_annotations when present."""
+    if hasattr(instance, f'{prefix}_count'):
+        return [getattr(instance, f'{prefix}_count'), getattr(instance, f'{prefix}_latest')]
+    agg = related.aggregate(count=Count('id'), latest=Max('updated_at'))
+    return [agg['count'], agg['latest']]
+
+
 class WorkOrder(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -50,19 +118,58 @@ class WorkOrder(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True)
     completed_at = models.DateTimeField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     invoiced = models.BooleanField(default=False)
 
+    # Maintained by workorders.search from the client name, description, notes
+    # and event addresses. Their GIN indexes (tsvector and pg_trgm) are created
+    # in migration 0009 on PostgreSQL only, so they are not declared in Meta.
+    search_document = models.TextField(blank=True, default='', editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination on (-created_at, id).
+            models.Index(fields=['-created_at', 'id'], name='workorder_created_id_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets signal handlers see the previous client when a work order is reassigned.
+        instance._loaded_client_id = instance.__dict__.get('client_id')
+        return instance
+
     def __str__(self):
-        return f"WorkOrder #{self.id} for {self.client.name}"
+        # Name the client only if it was loaded with us; listing work orders must not cost a query each.
+        client = self.client.name if WorkOrder.client.is_cached(self) else f"client {self.client_id}"
+        return f"WorkOrder #{self.id} for {client}"
 
-    def update_status(self):
+    def update_status(self, events=None):
+        """Derive pending/in_progress from the events. Pass `events` to decide without a query."""
         if self.status == 'completed':
             return
-        if self.events.filter(date__isnull=False).exists():
-            self.status = 'in_progress'
+        if events is None:
+            scheduled = self.events.filter(date__isnull=False).exists()
         else:
-            self.status = 'pending'
+            scheduled = any(event.date for event in events)
+        self.status = 'in_progress' if scheduled else 'pending'
+
+    @classmethod
+    def with_pdf_fingerprint(cls, queryset):
+        """Annotate `queryset` with what pdf_fingerprint reads, so it runs no queries per row (exports)."""
+        annotations = {}
+        for related in ('events', 'notes', 'attachments'):
+            model = cls._meta.get_field(related).related_model
+            annotations.update(pdf_fingerprint_annotations(model, f'pdf_{related}'))
+        return queryset.select_related('client').annotate(**annotations)
+
+    def pdf_fingerprint(self):
+        """Values that change whenever anything shown on the work order PDF changes."""
+        parts = [self.pk, self.updated_at, self.client.updated_at]
+        for related in ('events', 'notes', 'attachments'):
+            parts += related_fingerprint(self, f'pdf_{related}', getattr(self, related))
+        return parts
 
 
 class Event(models.Model):
@@ -84,12 +191,41 @@ class Event(models.Model):
     completed = models.BooleanField(default=False, help_text='Mark if this specific event was completed')
     completed_at = models.DateTimeField(blank=True, null=True, help_text='When this event was marked complete')
     completed_by = models.CharField(max_length=100, blank=True, help_text='Who marked this event complete')
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['date', 'daily_order', 'scheduled_time', 'id']
 
     def __str__(self):
-        return f"{self.get_event_type_display()} for WorkOrder #{self.work_order.id}"
+        return f"{self.get_event_type_display()} for WorkOrder #{self.work_order_id}"
+
+
+def normalize_address(address):
+    """Lookup key for GeocodedAddress: lower case, single spaces, no trailing punctuation."""
+    return ' '.join(address.lower().replace(',', ' , ').split()).replace(' ,', ',').strip(' ,.')
+
+
+class GeocodedAddress(models.Model):
+    """Coordinates for an event address, cached locally so routing never calls a geocoder.
+
+    Keyed by normalize_address(), and filled in with load_geocodes.
+    """
+    address = models.CharField(max_length=255, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.address} ({self.latitude}, {self.longitude})"
+
+
+class EventTombstone(models.Model):
+    """Record of a deleted event, so calendar delta syncs can tell clients to drop it."""
+    event_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Deleted event {self.event_id}"
 
 
 class JobAttachment(models.Model):
@@ -99,66 +235,66 @@ class JobAttachment(models.Model):
         ('document', 'Document'),
         ('text', 'Text'),
     ]
+    THUMBNAIL_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
 
     work_order = models.ForeignKey(WorkOrder, on_delete=models.CASCADE, related_name='attachments')
     file = models.FileField(
         upload_to=job_attachment_upload_path,
+        storage=attachment_storage,
         validators=[validate_file_type, validate_file_size]
     )
     file_type = models.CharField(max_length=20, choices=FILE_TYPE_CHOICES, blank=True)
     file_size = models.PositiveIntegerField(blank=True, null=True)
     thumbnail = models.ImageField(upload_to='job_attachments/thumbnails/', blank=True, null=True)
+    # Written by workorders.thumbnails: size name -> storage name for each of
+    # settings.THUMBNAIL_SIZES. `thumbnail` holds the smallest one.
+    thumbnails = models.JSONField(default=dict, blank=True)
+    thumbnail_status = models.CharField(max_length=10, choices=THUMBNAIL_STATUS_CHOICES, blank=True)
+    thumbnail_error = models.TextField(blank=True)
+    thumbnail_attempts = models.PositiveSmallIntegerField(default=0)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Attachment {self.id} for WorkOrder {self.work_order.id}"
+        return f"Attachment {self.id} for WorkOrder {self.work_order_id}"
 
     def save(self, *args, **kwargs):
+        new_upload = bool(self.file) and not self.file._committed
         if self.file:
             if not hasattr(self.file, 'size') or self.file.size == 0:
                 raise ValidationError("Empty file cannot be uploaded")
 
             self.file_size = self.file.size
 
-            ext = os.path.splitext(self.file.name)[1].lower()
-            if ext in ['.jpg', '.jpeg', '.png', '.gif']:
-                self.file_type = 'image'
-            elif ext == '.pdf':
-                self.file_type = 'pdf'
-            elif ext in ['.doc', '.docx']:
-                self.file_type = 'document'
-            else:
-                self.file_type = 'text'
+            self.file_type = attachment_file_type(self.file.name)
 
-            if self.file_type == 'image' and not self.thumbnail:
-                self._create_thumbnail_after_save = True
+        queue_thumbnails = new_upload and self.file_type == 'image'
+        if queue_thumbnails:
+            self.thumbnail_status = 'pending'
+            self.thumbnail_error = ''
+            self.thumbnail_attempts = 0
 
         super().save(*args, **kwargs)
 
-        if hasattr(self, '_create_thumbnail_after_save') and self._create_thumbnail_after_save:
-            try:
-                self.create_thumbnail()
-                del self._create_thumbnail_after_save
-            except Exception:
-                pass
+        replaced = getattr(self, '_loaded_file_name', None)
+        if new_upload and replaced and replaced != self.file.name:
+            # Releases our reference to the previous blob.
+            self.file.storage.delete(replaced)
+        self._loaded_file_name = self.file.name
 
-    def create_thumbnail(self):
-        if not self.file:
-            return
-        try:
-            self.file.seek(0)
-            image = Image.open(self.file)
-            image.thumbnail((200, 200), Image.Resampling.LANCZOS)
+        if queue_thumbnails:
+            from .thumbnails import enqueue_thumbnails
+            enqueue_thumbnails(self.pk)
 
-            thumb_name = f"thumb_{uuid.uuid4().hex}.jpg"
-            thumb_io = BytesIO()
-            image.save(thumb_io, 'JPEG', quality=85)
-            thumb_io.seek(0)
-
-            from django.core.files.base import ContentFile
-            self.thumbnail.save(thumb_name, ContentFile(thumb_io.read()), save=False)
-        except Exception:
-            pass
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_file_name = instance.__dict__.get('file')
+        return instance
 
     def get_file_icon(self):
         icons = {
@@ -176,47 +312,68 @@ class JobAttachment(models.Model):
             return False
 
     def get_file_url(self):
-        try:
-            if not self.file or not self.file.name:
-                return None
-            name = self.file.name
-            if self.file_type == 'image':
-                return cloudinary.CloudinaryImage(name).build_url()
-            else:
-                return cloudinary.CloudinaryImage(name).build_url(resource_type="raw")
-        except Exception:
-            pass
-        return None
+        if not self.file or not self.file.name:
+            return None
+        return delivery_url(self.file.name, 'image' if self.file_type == 'image' else 'raw')
+
+    def get_thumbnail_urls(self):
+        """{size name: URL} of the stored thumbnails, empty until they have been generated."""
+        if self.thumbnail_status != 'done':
+            return {}
+        storage = self._meta.get_field('thumbnail').storage
+        return {size: storage.url(name) for size, name in self.thumbnails.items()}
 
     def get_thumbnail_url(self):
-        if self.file_type == 'image':
-            try:
-                if not self.file or not self.file.name:
-                    return None
-                return cloudinary.CloudinaryImage(self.file.name).build_url(
-                    width=200, height=200, crop="fill", quality="auto", fetch_format="auto"
-                )
-            except Exception:
-                pass
-        return None
+        if self.file_type != 'image' or not self.file or not self.file.name:
+            return None
+        if self.thumbnail_status == 'done' and self.thumbnail:
+            return self.thumbnail.url
+        return delivery_url(self.file.name, 'thumbnail')
 
     def get_display_url(self):
-        if self.file_type == 'image':
-            try:
-                if not self.file or not self.file.name:
-                    return None
-                return cloudinary.CloudinaryImage(self.file.name).build_url(
-                    width=800, height=600, crop="limit", quality="auto", fetch_format="auto"
-                )
-            except Exception:
-                pass
-        return self.get_file_url()
+        if self.file_type != 'image':
+            return self.get_file_url()
+        if not self.file or not self.file.name:
+            return None
+        return self.get_thumbnail_urls().get('display') or delivery_url(self.file.name, 'display')
+
+
+class AttachmentBlob(models.Model):
+    """One stored copy of a distinct attachment file, shared by every JobAttachment with the same content."""
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class UploadSession(models.Model):
+    """A resumable attachment upload. Chunks are appended to a temp file until it is finalized."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    work_order = models.ForeignKey(WorkOrder, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    attachment = models.OneToOneField(
+        JobAttachment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.offset}/{self.size}) for WorkOrder {self.work_order_id}"
 
 
 class JobNote(models.Model):
     work_order = models.ForeignKey(WorkOrder, on_delete=models.CASCADE, related_name='notes')
     note = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Note {self.id} for WorkOrder {self.work_order.id}"
+        return f"Note {self.id} for WorkOrder {self.work_order_id}"
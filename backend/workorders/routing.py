@@ -0,0 +1,177 @@
+import math
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import GeocodedAddress, normalize_address
+
+# Route proposals for one day's events. Coordinates come from the local
+# GeocodedAddress cache, so nothing here calls out to a geocoder. Costs come
+# from the ROUTE_DISTANCE_MATRIX function, which takes [(lat, lon), ...] and
+# returns a square matrix; it may be asymmetric (drive times, one-way
+# streets). The order is built by nearest neighbour and then improved with
+# 2-opt. Events with a scheduled_time keep their time order: both steps treat
+# them as fixed in sequence, and untimed stops move freely around them.
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_matrix(points):
+    """Great-circle distances in km between every pair of (lat, lon) points."""
+    radians = [(math.radians(lat), math.radians(lon)) for lat, lon in points]
+    matrix = []
+    for lat1, lon1 in radians:
+        row = []
+        for lat2, lon2 in radians:
+            a = (math.sin((lat2 - lat1) / 2) ** 2
+                 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+            row.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a)))
+        matrix.append(row)
+    return matrix
+
+
+def depot():
+    """The (lat, lon) every route starts from, from ROUTE_DEPOT, or None to start at any stop."""
+    if not settings.ROUTE_DEPOT:
+        return None
+    lat, lon = settings.ROUTE_DEPOT.split(',')
+    return float(lat), float(lon)
+
+
+def distance_matrix(points):
+    """ROUTE_DISTANCE_MATRIX costs between every pair of (lat, lon) points."""
+    return import_string(settings.ROUTE_DISTANCE_MATRIX)(points) if points else []
+
+
+def cost_matrix(points):
+    """Costs between a start point and `points`, with the start at index 0.
+
+    Without a depot the start is a virtual point that costs nothing to leave,
+    so the route may begin at whichever stop suits it best.
+    """
+    start = depot()
+    if start is not None:
+        return distance_matrix([start, *points])
+    return [[0.0] * (len(points) + 1)] + [[0.0, *row] for row in distance_matrix(points)]
+
+
+def route_cost(dist, route):
+    return sum(dist[a][b] for a, b in zip(route, route[1:]))
+
+
+def nearest_neighbour(dist, times):
+    """Route from stop 0 that always moves to the closest stop it may visit next.
+
+    Untimed stops may come at any point; timed ones only once every earlier
+    timed stop has been visited.
+    """
+    free = {i for i in range(1, len(dist)) if times[i] is None}
+    timed = sorted((i for i in range(1, len(dist)) if times[i] is not None), key=lambda i: (times[i], i))
+    route = [0]
+    next_timed = 0
+    while free or next_timed < len(timed):
+        candidates = list(free)
+        if next_timed < len(timed):
+            candidates.append(timed[next_timed])
+        here = route[-1]
+        stop = min(candidates, key=lambda i: (dist[here][i], i))
+        if stop in free:
+            free.remove(stop)
+        else:
+            next_timed += 1
+        route.append(stop)
+    return route
+
+
+def two_opt(dist, route, times):
+    """Reverse segments of `route` in place while that makes it cheaper.
+
+    The route is open (it doesn't return to stop 0), and a segment may hold
+    at most one timed stop, so reversing it never swaps two fixed times.
+    Internal edges are re-costed in the reverse direction, which keeps the
+    result right for asymmetric matrices.
+    """
+    n = len(route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            before, first = route[i - 1], route[i]
+            forward = backward = 0.0
+            timed = times[first] is not None
+            for j in range(i + 1, n):
+                last = route[j]
+                forward += dist[route[j - 1]][last]
+                backward += dist[last][route[j - 1]]
+                if times[last] is not None:
+                    if timed:
+                        break
+                    timed = True
+                after = route[j + 1] if j + 1 < n else None
+                old = dist[before][first] + forward + (dist[last][after] if after is not None else 0.0)
+                new = dist[before][last] + backward + (dist[first][after] if after is not None else 0.0)
+                if new < old - 1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+                    break
+            if improved:
+                break
+    return route
+
+
+def in_time_order(route, times):
+    timed = [times[i] for i in route if times[i] is not None]
+    return timed == sorted(timed)
+
+
+def coordinates(events):
+    """{event id: (lat, lon)} for events whose address is in the geocode cache."""
+    keys = {event.pk: normalize_address(event.address) for event in events if event.address}
+    cached = {
+        address: (lat, lon)
+        for address, lat, lon in GeocodedAddress.objects.filter(
+            address__in=set(keys.values())
+        ).values_list('address', 'latitude', 'longitude')
+    }
+    return {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+
+def plan_route(events):
+    """Propose a stop order for one day's `events`, given in their current order.
+
+    Returns {'events', 'unlocated', 'current_cost', 'proposed_cost'}. Events
+    with no cached coordinates can't be routed: they are listed in
+    'unlocated' and placed after the routed stops, or, if timed, just before
+    the first routed stop scheduled later. Costs cover the routed stops only,
+    in the units of ROUTE_DISTANCE_MATRIX.
+    """
+    located = coordinates(events)
+    routed = [event for event in events if event.pk in located]
+    unlocated = [event for event in events if event.pk not in located]
+
+    dist = cost_matrix([located[event.pk] for event in routed])
+    times = [None] + [event.scheduled_time for event in routed]
+    current = list(range(len(routed) + 1))
+    routes = [two_opt(dist, nearest_neighbour(dist, times), times)]
+    if in_time_order(current, times):
+        # Dispatchers' own order is sometimes the better start; improve it as well and keep the cheaper.
+        routes.append(two_opt(dist, list(current), times))
+    route = min(routes, key=lambda r: route_cost(dist, r))
+
+    ordered = [routed[i - 1] for i in route[1:]]
+    for event in unlocated:
+        position = len(ordered)
+        if event.scheduled_time is not None:
+            position = next(
+                (i for i, other in enumerate(ordered)
+                 if other.scheduled_time is not None and other.scheduled_time > event.scheduled_time),
+                position,
+            )
+        ordered.insert(position, event)
+
+    return {
+        'events': ordered,
+        'unlocated': unlocated,
+        'current_cost': route_cost(dist, current),
+        'proposed_cost': route_cost(dist, route),
+    }
@@ -0,0 +1,180 @@
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from clients.stats import refresh_client_stats
+
+from . import routing
+from .models import Event, WorkOrder
+
+# Backlog scheduling: events with no date are spread over the working days of
+# a horizon. Each day has SCHEDULER_CREW_HOURS to fill, an event takes
+# SCHEDULER_EVENT_HOURS for its type, and SCHEDULER_DAILY_LIMITS can cap a
+# type per day. Days are filled one at a time, greedily: the nearest waiting
+# event within SCHEDULER_CLUSTER_RADIUS of a stop already on the day goes
+# next, and when none is close the oldest waiting event that fits starts a
+# new cluster. Events already booked on a day use up its hours and count as
+# stops to cluster around. Coordinates come from the geocode cache; events
+# without them can still start a cluster, but never join one for being close.
+# Whatever the distances, a work order's events keep their EVENT_STAGES order:
+# an event only becomes eligible on a day once every event of an earlier stage
+# in its work order is dated on or before that day.
+
+# Pickups come first, then wrapping, then whatever takes the work to the client.
+EVENT_STAGES = {
+    'pickup': 0,
+    'pickup_wrap': 0,
+    'wrap': 1,
+    'install': 2,
+    'deliver_install': 2,
+    'dropoff': 2,
+}
+
+
+def event_hours(event_type):
+    return settings.SCHEDULER_EVENT_HOURS.get(event_type, 1.0)
+
+
+def working_days(start, days):
+    """Dates on SCHEDULER_WEEKDAYS within the `days` calendar days from `start`."""
+    dates = (start + timedelta(days=n) for n in range(days))
+    return [day for day in dates if day.weekday() in settings.SCHEDULER_WEEKDAYS]
+
+
+def event_stage(event):
+    return EVENT_STAGES.get(event.event_type, 0)
+
+
+def plan_backlog(backlog, booked, dates, dated=()):
+    """Pick a date for each `backlog` event (oldest first) among `dates`.
+
+    `booked` are the events already on those dates, and `dated` any other
+    dated events of the backlog's work orders, which later stages must not
+    precede. Returns ([(event, date), ...] in the order they were placed,
+    [events that didn't fit]).
+    """
+    located = routing.coordinates([*backlog, *booked])
+    points = sorted(set(located.values()))
+    index = {point: i for i, point in enumerate(points)}
+    dist = routing.distance_matrix(points)
+    position = {event.pk: index[located[event.pk]] for event in [*backlog, *booked] if event.pk in located}
+
+    on_day = defaultdict(list)
+    for event in booked:
+        on_day[event.date].append(event)
+
+    def add_stop(nearest, stop):
+        # Keep `nearest` as each waiting event's distance to the closest stop on the day.
+        if stop.pk not in position:
+            return
+        row = dist[position[stop.pk]]
+        for event in waiting:
+            if event.pk in position:
+                nearest[event.pk] = min(nearest.get(event.pk, math.inf), row[position[event.pk]])
+
+    # Per (work order, stage): backlog events still without a date, and the latest date already given.
+    undated = Counter((event.work_order_id, event_stage(event)) for event in backlog)
+    latest = {}
+    for event in [*booked, *dated]:
+        key = (event.work_order_id, event_stage(event))
+        latest[key] = max(latest.get(key, event.date), event.date)
+
+    def ready(event, day):
+        return all(
+            not undated[event.work_order_id, stage] and latest.get((event.work_order_id, stage), day) <= day
+            for stage in range(event_stage(event))
+        )
+
+    waiting = list(backlog)
+    planned = []
+    for day in dates:
+        hours = settings.SCHEDULER_CREW_HOURS - sum(event_hours(event.event_type) for event in on_day[day])
+        counts = Counter(event.event_type for event in on_day[day])
+        nearest = {}
+        for stop in on_day[day]:
+            add_stop(nearest, stop)
+        while True:
+            fits = [
+                event for event in waiting
+                if event_hours(event.event_type) <= hours
+                and counts[event.event_type] < settings.SCHEDULER_DAILY_LIMITS.get(event.event_type, math.inf)
+                and ready(event, day)
+            ]
+            if not fits:
+                break
+            close = [event for event in fits if nearest.get(event.pk, math.inf) <= settings.SCHEDULER_CLUSTER_RADIUS]
+            # min() keeps the first of equals, so ties go to the older event.
+            event = min(close, key=lambda e: nearest[e.pk]) if close else fits[0]
+            waiting.remove(event)
+            hours -= event_hours(event.event_type)
+            counts[event.event_type] += 1
+            planned.append((event, day))
+            key = (event.work_order_id, event_stage(event))
+            undated[key] -= 1
+            latest[key] = max(latest.get(key, day), day)
+            add_stop(nearest, event)
+    return planned, waiting
+
+
+def schedule_backlog(start=None, days=None, dry_run=False):
+    """Date the undated, open events of unfinished work orders over the coming working days.
+
+    The horizon is `days` (default SCHEDULER_HORIZON_DAYS) calendar days from
+    `start` (default tomorrow). New events go after the day's existing
+    daily_order. Dates are written with one bulk UPDATE, and pending work
+    orders that now have a scheduled event move to in_progress with another.
+    An event is never dated before an earlier stage of its work order (see
+    EVENT_STAGES). With `dry_run` nothing is saved.
+
+    Returns ([(event, date, daily_order), ...], [events that didn't fit]).
+    """
+    start = start or timezone.localdate() + timedelta(days=1)
+    dates = working_days(start, days or settings.SCHEDULER_HORIZON_DAYS)
+
+    with transaction.atomic():
+        backlog = Event.objects.filter(date__isnull=True, completed=False).exclude(
+            work_order__status='completed'
+        ).order_by('work_order__created_at', 'work_order_id', 'id')
+        if not dry_run:
+            # A second run waits here instead of booking the same events again.
+            backlog = backlog.select_for_update(of=('self',))
+        backlog = list(backlog)
+        booked, dated = [], []
+        if backlog and dates:
+            # The horizon's bookings, plus the backlog's work orders' events dated outside it.
+            horizon = set(dates)
+            for event in Event.objects.filter(
+                Q(date__in=dates) | Q(work_order__in={event.work_order_id for event in backlog}, date__isnull=False)
+            ):
+                (booked if event.date in horizon else dated).append(event)
+        planned, unscheduled = plan_backlog(backlog, booked, dates, dated)
+
+        last_order = defaultdict(int)
+        for event in booked:
+            last_order[event.date] = max(last_order[event.date], event.daily_order or 0)
+        now = timezone.now()
+        assignments = []
+        for event, day in planned:
+            last_order[day] += 1
+            event.date, event.daily_order, event.updated_at = day, last_order[day], now
+            assignments.append((event, day, last_order[day]))
+
+        if planned and not dry_run:
+            Event.objects.bulk_update(
+                [event for event, _ in planned], ['date', 'daily_order', 'updated_at'], batch_size=500,
+            )
+            # Same rule as WorkOrder.update_status, applied to every affected work order at once.
+            work_orders = WorkOrder.objects.filter(
+                pk__in={event.work_order_id for event, _ in planned}, status='pending',
+            )
+            client_ids = set(work_orders.values_list('client_id', flat=True))
+            work_orders.update(status='in_progress', updated_at=now)
+            # update() skips the signals that keep client activity current.
+            refresh_client_stats(client_ids)
+
+    return assignments, unscheduled
@@ -0,0 +1,102 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, Q
+from rest_framework import filters
+
+from django_project.transactions import on_commit_batch
+
+# Rebuilds search_document and search_vector for the selected work orders in
+# one statement. Client name ranks highest, then the description, then notes
+# and event addresses (addresses use the 'simple' config so street names and
+# numbers aren't stemmed).
+REFRESH_SQL = """
+    WITH docs AS (
+        SELECT wo.id,
+               c.name AS client_name,
+               wo.job_description,
+               (SELECT string_agg(n.note, ' ') FROM workorders_jobnote n
+                WHERE n.work_order_id = wo.id) AS notes,
+               (SELECT string_agg(e.address, ' ') FROM workorders_event e
+                WHERE e.work_order_id = wo.id) AS addresses
+        FROM workorders_workorder wo
+        JOIN clients_client c ON c.id = wo.client_id
+        WHERE {where}
+    )
+    UPDATE workorders_workorder AS wo SET
+        search_document = concat_ws(' ', docs.client_name, docs.job_description, docs.notes, docs.addresses),
+        search_vector =
+            setweight(to_tsvector('english', coalesce(docs.client_name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(docs.job_description, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(docs.notes, '')), 'C') ||
+            setweight(to_tsvector('simple', coalesce(docs.addresses, '')), 'C')
+    FROM docs
+    WHERE docs.id = wo.id
+"""
+
+
+def search_enabled():
+    return connection.vendor == 'postgresql'
+
+
+def refresh_search_index(work_order_ids=None):
+    """Recompute the search columns for the given work orders, or for all of them."""
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        if work_order_ids is None:
+            cursor.execute(REFRESH_SQL.format(where='TRUE'))
+        elif work_order_ids:
+            cursor.execute(REFRESH_SQL.format(where='wo.id = ANY(%s)'), [list(work_order_ids)])
+
+
+def refresh_search(work_order_id_sets):
+    refresh_search_index(set().union(*work_order_id_sets))
+
+
+def schedule_search_refresh(work_order_ids):
+    """Refresh the search columns once the current transaction commits.
+
+    Ids are batched per transaction, so a request that touches many events
+    or notes of one work order refreshes it once. Deferring to commit also
+    lets rows written after the work order (bulk event inserts) make it
+    into the document.
+    """
+    if search_enabled():
+        on_commit_batch(refresh_search, set(work_order_ids))
+
+
+def search_work_orders(queryset, term):
+    """Filter by `term`. `#123` or `123` also matches that work order id.
+
+    On PostgreSQL this uses the maintained tsvector for ranked full-text
+    matches plus pg_trgm word similarity for typos, annotating `search_rank`.
+    Elsewhere it falls back to substring matching on client name and
+    description.
+    """
+    numeric = term.lstrip('#').strip()
+    id_match = Q(id=int(numeric)) if numeric.isdigit() else Q()
+
+    if not search_enabled():
+        q = Q(client__name__icontains=term) | Q(job_description__icontains=term)
+        return queryset.filter(q | id_match)
+
+    # Match stemmed words in the English-config fields and exact tokens in addresses.
+    query = (
+        SearchQuery(term, search_type='websearch', config='english')
+        | SearchQuery(term, search_type='websearch', config='simple')
+    )
+    return queryset.filter(
+        Q(search_vector=query) | Q(search_document__trigram_word_similar=term) | id_match
+    ).annotate(
+        search_rank=SearchRank(F('search_vector'), query)
+        + TrigramWordSimilarity(term, 'search_document'),
+    )
+
+
+class SearchRankOrderingFilter(filters.OrderingFilter):
+    """Order search results by relevance unless the client asked for an explicit ordering."""
+
+    def get_ordering(self, request, queryset, view):
+        if self.ordering_param not in request.query_params and 'search_rank' in queryset.query.annotations:
+            return ['-search_rank', '-created_at']
+        return super().get_ordering(request, queryset, view)
@@ -1,5 +1,10 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
-from .models import WorkOrder, Event, JobAttachment, JobNote
+from .models import WorkOrder, Event, JobAttachment, JobNote, UploadSession, validate_file_type
 
 
 class EventSerializer(serializers.ModelSerializer):
@@ -19,15 +24,16 @@ class EventSerializer(serializers.ModelSerializer):
 class JobAttachmentSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
     thumbnail_url = serializers.SerializerMethodField()
+    thumbnails = serializers.SerializerMethodField()
     file_icon = serializers.CharField(source='get_file_icon', read_only=True)
 
     class Meta:
         model = JobAttachment
         fields = [
             'id', 'work_order', 'file', 'file_type', 'file_size',
-            'file_url', 'thumbnail_url', 'file_icon', 'uploaded_at',
+            'file_url', 'thumbnail_url', 'thumbnails', 'file_icon', 'thumbnail_status', 'uploaded_at',
         ]
-        read_only_fields = ['file_type', 'file_size', 'uploaded_at']
+        read_only_fields = ['file_type', 'file_size', 'thumbnail_status', 'uploaded_at']
 
     def get_file_url(self, obj):
         return obj.get_file_url()
@@ -35,6 +41,9 @@ class JobAttachmentSerializer(serializers.ModelSerializer):
     def get_thumbnail_url(self, obj):
         return obj.get_thumbnail_url()
 
+    def get_thumbnails(self, obj):
+        return obj.get_thumbnail_urls()
+
 
 class JobNoteSerializer(serializers.ModelSerializer):
     class Meta:
@@ -43,10 +52,38 @@ class JobNoteSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at']
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'work_order', 'filename', 'size', 'offset', 'chunk_size', 'attachment', 'created_at']
+        read_only_fields = ['offset', 'attachment', 'created_at']
+
+    def get_chunk_size(self, obj):
+        return settings.ATTACHMENT_UPLOAD_CHUNK_SIZE
+
+    def validate_filename(self, value):
+        try:
+            validate_file_type(File(None, name=value))
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError(exc.messages)
+        return value
+
+    def validate_size(self, value):
+        max_size = settings.ATTACHMENT_MAX_UPLOAD_SIZE
+        if value == 0:
+            raise serializers.ValidationError("Empty file cannot be uploaded")
+        if value > max_size:
+            raise serializers.ValidationError(f"File too large. Max size: {max_size // (1024 * 1024)}MB.")
+        return value
+
+
 class WorkOrderListSerializer(serializers.ModelSerializer):
     client_name = serializers.CharField(source='client.name', read_only=True)
-    event_count = serializers.SerializerMethodField()
-    attachment_count = serializers.SerializerMethodField()
+    # Annotated by WorkOrderViewSet.get_queryset for the list action.
+    event_count = serializers.IntegerField(read_only=True)
+    attachment_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = WorkOrder
@@ -57,12 +94,6 @@ class WorkOrderListSerializer(serializers.ModelSerializer):
             'attachment_count',
         ]
 
-    def get_event_count(self, obj):
-        return len(obj.events.all())
-
-    def get_attachment_count(self, obj):
-        return len(obj.attachments.all())
-
 
 class WorkOrderDetailSerializer(serializers.ModelSerializer):
     client_name = serializers.CharField(source='client.name', read_only=True)
@@ -103,33 +134,68 @@ class WorkOrderCreateUpdateSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['status', 'invoiced']
 
+    EVENT_WRITE_FIELDS = ['event_type', 'address', 'date', 'daily_order', 'scheduled_time']
+
+    @transaction.atomic
     def create(self, validated_data):
         events_data = validated_data.pop('events', [])
-        work_order = WorkOrder.objects.create(**validated_data)
-        for event_data in events_data:
-            event_data.pop('work_order', None)
-            Event.objects.create(work_order=work_order, **event_data)
-        work_order.update_status()
+        work_order = WorkOrder(**validated_data)
+        events = [Event(**self._event_fields(data)) for data in events_data]
+        work_order.update_status(events)
         work_order.save()
+        for event in events:
+            event.work_order = work_order
+        Event.objects.bulk_create(events)
         return work_order
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         events_data = validated_data.pop('events', None)
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
-        instance.save()
 
-        if events_data is not None:
-            event_ids = [e.get('id') for e in events_data if e.get('id')]
-            instance.events.exclude(id__in=event_ids).delete()
-            for event_data in events_data:
-                event_data.pop('work_order', None)
-                event_id = event_data.pop('id', None)
-                if event_id:
-                    Event.objects.filter(id=event_id, work_order=instance).update(**event_data)
-                else:
-                    Event.objects.create(work_order=instance, **event_data)
-
-        instance.update_status()
+        if events_data is None:
+            instance.update_status()
+        else:
+            instance.update_status(self._sync_events(instance, events_data))
         instance.save()
         return instance
+
+    @staticmethod
+    def _event_fields(event_data):
+        return {k: v for k, v in event_data.items() if k not in ('id', 'work_order')}
+
+    def _sync_events(self, instance, events_data):
+        """Diff incoming events against the stored ones and write the difference in bulk.
+
+        Events with an id are updated only if a field changed, events without
+        one are inserted, and stored events missing from the payload are
+        deleted. Ids that don't belong to this work order are ignored.
+        Returns the resulting event list.
+        """
+        existing = {e.id: e for e in Event.objects.filter(work_order=instance).select_for_update()}
+        kept, to_create, to_update = [], [], []
+        now = timezone.now()
+        for event_data in events_data:
+            event_id = event_data.get('id')
+            fields = self._event_fields(event_data)
+            if not event_id:
+                to_create.append(Event(work_order=instance, **fields))
+                continue
+            event = existing.pop(event_id, None)
+            if event is None:
+                continue
+            kept.append(event)
+            if any(getattr(event, name) != value for name, value in fields.items()):
+                for name, value in fields.items():
+                    setattr(event, name, value)
+                event.updated_at = now
+                to_update.append(event)
+
+        if existing:
+            Event.objects.filter(id__in=existing.keys()).delete()
+        if to_update:
+            Event.objects.bulk_update(to_update, self.EVENT_WRITE_FIELDS + ['updated_at'])
+        if to_create:
+            Event.objects.bulk_create(to_create)
+        return kept + to_create
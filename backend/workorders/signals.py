@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from clients.models import Client
+from django_project.transactions import on_delete_batch
+
+from .models import Event, EventTombstone, JobAttachment, JobNote, WorkOrder
+from .search import schedule_search_refresh
+
+
+def write_tombstones(event_ids):
+    EventTombstone.objects.bulk_create([EventTombstone(event_id=event_id) for event_id in event_ids])
+
+
+on_delete_batch(Event, write_tombstones, lambda event: event.pk)
+
+
+@receiver(post_save, sender=WorkOrder)
+def refresh_work_order_search(sender, instance, **kwargs):
+    schedule_search_refresh([instance.pk])
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=JobNote)
+@receiver(post_delete, sender=JobNote)
+def refresh_parent_search(sender, instance, **kwargs):
+    schedule_search_refresh([instance.work_order_id])
+
+
+@receiver(post_save, sender=Client)
+def refresh_client_work_orders_search(sender, instance, created, **kwargs):
+    if not created:
+        schedule_search_refresh(instance.work_orders.values_list('id', flat=True))
+
+
+def release_files(names):
+    JobAttachment._meta.get_field('file').storage.delete_many(names)
+
+
+# Each deleted row drops its reference; a blob is removed with its last reference.
+on_delete_batch(JobAttachment, release_files, lambda attachment: attachment.file.name or None)
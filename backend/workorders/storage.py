@@ -1,6 +1,16 @@
+import hashlib
 import os
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from cloudinary_storage.storage import MediaCloudinaryStorage
 import cloudinary.uploader
+from django.core.files.storage import Storage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+BLOB_PREFIX = 'job_attachments/sha256/'
 
 
 class CustomCloudinaryStorage(MediaCloudinaryStorage):
@@ -33,3 +43,209 @@ class CustomCloudinaryStorage(MediaCloudinaryStorage):
                 return cloudinary.CloudinaryImage(name).build_url(resource_type="raw")
         except Exception:
             return None
+
+
+class HashingUploadMixin:
+    """Computes each uploaded file's SHA-256 as its chunks arrive and sets it as `file.sha256`.
+
+    DeduplicatingStorage uses the digest instead of reading the file a
+    second time before deciding whether to upload it.
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def keeps_data(self):
+        return True
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.keeps_data():
+            self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.digest.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    def keeps_data(self):
+        # Larger files are passed through to the temporary file handler, which hashes them.
+        return self.activated
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+class DeduplicatingStorage(Storage):
+    """Content-addressed storage that keeps one copy of each distinct file.
+
+    Files are stored in the wrapped backend under their SHA-256, which the
+    hashing upload handlers compute while the request streams in. Saving
+    content that is already stored only bumps the blob's reference count;
+    nothing is uploaded. Deleting drops a reference and removes the file
+    once the last one is gone. Names not tracked as blobs (files stored
+    before deduplication) are never deleted; only reads pass through to the
+    wrapped backend.
+    """
+
+    def __init__(self, backend='workorders.storage.CustomCloudinaryStorage', options=None):
+        self.inner = import_string(backend)(**(options or {}))
+
+    def get_available_name(self, name, max_length=None):
+        # The stored name comes from the content hash, not from this one.
+        return name
+
+    @staticmethod
+    def _digest(content):
+        sha256 = getattr(content, 'sha256', None)
+        if sha256 is None:
+            # Not a request upload (a finalized chunked upload, a management command):
+            # the content is local, so reading it once more is cheap.
+            digest = hashlib.sha256()
+            content.seek(0)
+            for chunk in content.chunks():
+                digest.update(chunk)
+            sha256 = digest.hexdigest()
+        return sha256
+
+    def _upload(self, sha256, name, content):
+        ext = os.path.splitext(name)[1].lower()
+        content.seek(0)
+        return self.inner.save(f"{BLOB_PREFIX}{sha256}{ext}", content)
+
+    def _save(self, name, content):
+        from .models import AttachmentBlob
+
+        sha256 = self._digest(content)
+        size = content.size
+
+        with transaction.atomic():
+            # Concurrent saves of the same new content serialize on the unique sha256.
+            blob, created = AttachmentBlob.objects.get_or_create(
+                sha256=sha256, defaults={'name': sha256, 'size': size},
+            )
+            if created:
+                blob.name = self._upload(sha256, name, content)
+                blob.save(update_fields=['name'])
+            AttachmentBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+        return blob.name
+
+    def save_many(self, files, max_workers=1):
+        """Store (name, content) pairs together; return the stored name, or the exception raised, for each.
+
+        The database work runs on the calling thread in a fixed number of
+        queries. Only uploads of content not stored yet go to the wrapped
+        backend in parallel, on up to `max_workers` threads that never touch
+        the database.
+        """
+        from .models import AttachmentBlob
+
+        if not files:
+            return []
+        digests = [self._digest(content) for _, content in files]
+        stored = set(AttachmentBlob.objects.filter(sha256__in=digests).values_list('sha256', flat=True))
+        new = {}
+        for (name, content), sha256 in zip(files, digests):
+            if sha256 not in stored:
+                new.setdefault(sha256, (name, content))
+
+        uploaded, errors = {}, {}
+        if new:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(new))) as pool:
+                futures = {sha256: pool.submit(self._upload, sha256, *new[sha256]) for sha256 in new}
+            for sha256, future in futures.items():
+                try:
+                    uploaded[sha256] = future.result()
+                except Exception as exc:
+                    errors[sha256] = exc
+
+        try:
+            with transaction.atomic():
+                AttachmentBlob.objects.bulk_create(
+                    [AttachmentBlob(sha256=sha256, name=name, size=new[sha256][1].size)
+                     for sha256, name in uploaded.items()],
+                    ignore_conflicts=True,
+                )
+                refs = Counter(sha256 for sha256 in digests if sha256 not in errors)
+                blobs = dict(
+                    AttachmentBlob.objects.select_for_update().filter(sha256__in=refs).values_list('sha256', 'name')
+                )
+                increments = defaultdict(list)
+                for sha256, count in refs.items():
+                    if sha256 in blobs:
+                        increments[count].append(sha256)
+                    else:
+                        errors[sha256] = RuntimeError("The stored copy was deleted while saving")
+                for amount, sha256s in increments.items():
+                    AttachmentBlob.objects.filter(sha256__in=sha256s).update(ref_count=F('ref_count') + amount)
+        except Exception:
+            for name in uploaded.values():
+                self.inner.delete(name)
+            raise
+
+        # The same content saved concurrently elsewhere won the blob row; drop our copy.
+        duplicates = [name for sha256, name in uploaded.items() if blobs.get(sha256, name) != name]
+        if duplicates:
+            def remove_duplicates():
+                for name in duplicates:
+                    self.inner.delete(name)
+            transaction.on_commit(remove_duplicates)
+        return [errors[sha256] if sha256 in errors else blobs[sha256] for sha256 in digests]
+
+    def _open(self, name, mode='rb'):
+        return self.inner.open(name, mode)
+
+    def delete(self, name):
+        self.delete_many([name])
+
+    def delete_many(self, names):
+        """Drop one reference per entry in `names` (repeats count), in a fixed number of queries.
+
+        Blobs left without references are removed, and their files are
+        deleted from the wrapped backend once the transaction commits.
+        Names without a blob were stored before deduplication and may still
+        be shared, so their files are left alone.
+        """
+        from .models import AttachmentBlob
+
+        refs = Counter(name for name in names if name)
+        if not refs:
+            return
+        with transaction.atomic():
+            blobs = {
+                blob.name: blob
+                for blob in AttachmentBlob.objects.select_for_update().filter(name__in=refs)
+            }
+            released = []
+            decrements = defaultdict(list)
+            for name, blob in blobs.items():
+                if blob.ref_count > refs[name]:
+                    decrements[refs[name]].append(blob.pk)
+                else:
+                    released.append(name)
+            for amount, pks in decrements.items():
+                AttachmentBlob.objects.filter(pk__in=pks).update(ref_count=F('ref_count') - amount)
+            if released:
+                AttachmentBlob.objects.filter(name__in=released).delete()
+
+                def remove_files():
+                    for name in released:
+                        self.inner.delete(name)
+                transaction.on_commit(remove_files)
+
+    def exists(self, name):
+        return self.inner.exists(name)
+
+    def size(self, name):
+        return self.inner.size(name)
+
+    def url(self, name):
+        return self.inner.url(name)
+
+    def path(self, name):
+        return self.inner.path(name)
@@ -1,3 +1,1185 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import time, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import cloudinary
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from accounts.models import CustomUser
+from clients.models import Client
+from invoices.models import Invoice, InvoiceRollup
+
+from django_project.testing import (
+    SEARCH_REFRESH,
+    QueryBudgetTestCase,
+    add_events,
+    make_client,
+    make_work_order,
+    use_local_attachment_storage,
+    use_temp_upload_dir,
+    without_throttling,
+)
+from django_project.transactions import on_commit_batch
+
+from . import uploads
+from .models import (
+    AttachmentBlob,
+    Event,
+    EventTombstone,
+    GeocodedAddress,
+    JobAttachment,
+    JobNote,
+    UploadSession,
+    WorkOrder,
+    _build_delivery_url,
+    attachment_storage,
+    delivery_url,
+    normalize_address,
+)
+from .search import refresh_search_index, search_enabled
+from .storage import DeduplicatingStorage
+from .thumbnails import generate_thumbnails
+
+
+class WorkOrderQueryBudgetTests(QueryBudgetTestCase):
+    def make_work_orders(self, rows):
+        client = make_client()
+        for _ in range(rows):
+            make_work_order(client, events=2, notes=1, attachments=1)
+
+    def make_full_work_order(self, rows):
+        return make_work_order(events=rows, notes=rows, attachments=rows)
+
+    def test_list(self):
+        self.assertQueryBudget(2, self.make_work_orders, lambda _: self.client.get('/api/workorders/'))
+
+    def test_list_cursor(self):
+        self.assertQueryBudget(
+            1, self.make_work_orders, lambda _: self.client.get('/api/workorders/?pagination=cursor'),
+        )
+
+    def test_search(self):
+        self.assertQueryBudget(
+            2, self.make_work_orders, lambda _: self.client.get('/api/workorders/', {'search': 'painting'}),
+        )
+
+    def test_retrieve(self):
+        self.assertQueryBudget(
+            4, self.make_full_work_order, lambda wo: self.client.get(f'/api/workorders/{wo.pk}/'),
+        )
+
+    def test_create_with_events(self):
+        client = make_client()
+
+        def create(rows):
+            events = [{'event_type': 'pickup', 'date': timezone.localdate().isoformat()} for _ in range(rows)]
+            return self.client.post(
+                '/api/workorders/', {'client': client.pk, 'job_description': 'Crate', 'events': events},
+                format='json',
+            )
+
+        # SQLite caps a statement at 999 parameters, so stay within one bulk INSERT of events.
+        self.assertQueryBudget(9 + SEARCH_REFRESH, lambda rows: rows, create, status_code=201, rows=90)
+
+    def test_update_events(self):
+        def update(wo):
+            events = [
+                {'id': event.pk, 'event_type': 'install', 'date': event.date.isoformat()}
+                for event in wo.events.all()
+            ]
+            return self.client.put(
+                f'/api/workorders/{wo.pk}/',
+                {'client': wo.client_id, 'job_description': 'Install', 'events': events},
+                format='json',
+            )
+
+        self.assertQueryBudget(12 + SEARCH_REFRESH, self.make_full_work_order, update)
+
+    def test_partial_update(self):
+        self.assertQueryBudget(
+            9 + SEARCH_REFRESH, self.make_full_work_order,
+            lambda wo: self.client.patch(f'/api/workorders/{wo.pk}/', {'job_description': 'Wrap'}, format='json'),
+        )
+
+    def test_destroy(self):
+        self.assertQueryBudget(
+            16 + SEARCH_REFRESH, self.make_full_work_order,
+            lambda wo: self.client.delete(f'/api/workorders/{wo.pk}/'), status_code=204,
+        )
+
+    def test_status_actions(self):
+        for name, data in [
+            ('mark_completed', {}),
+            ('mark_paid', {}),
+            ('complete_and_invoice', {}),
+            ('change_status', {'status': 'in_progress'}),
+            ('reset_invoiced', {}),
+        ]:
+            with self.subTest(name):
+                self.assertQueryBudget(
+                    3 + SEARCH_REFRESH, self.make_full_work_order,
+                    lambda wo: self.client.post(f'/api/workorders/{wo.pk}/{name}/', data, format='json'),
+                )
+
+    def test_pdf(self):
+        self.assertQueryBudget(
+            7, self.make_full_work_order, lambda wo: self.client.get(f'/api/workorders/{wo.pk}/pdf/'),
+        )
+
+
+class EventQueryBudgetTests(QueryBudgetTestCase):
+    def setUpFixtures(self):
+        self.work_order = make_work_order()
+
+    def add_events(self, rows):
+        return add_events(self.work_order, rows)
+
+    def test_list(self):
+        self.assertQueryBudget(2, self.add_events, lambda _: self.client.get('/api/workorders/events/'))
+
+    def test_list_for_date(self):
+        day = timezone.localdate().isoformat()
+        self.assertQueryBudget(
+            2, self.add_events, lambda _: self.client.get('/api/workorders/events/', {'date': day}),
+        )
+
+    def test_retrieve(self):
+        self.assertQueryBudget(
+            1, self.add_events, lambda events: self.client.get(f'/api/workorders/events/{events[0].pk}/'),
+        )
+
+    def test_create(self):
+        self.assertQueryBudget(
+            3 + SEARCH_REFRESH, self.add_events,
+            lambda _: self.client.post('/api/workorders/events/', {
+                'work_order': self.work_order.pk, 'event_type': 'wrap', 'address': '1 Dune Rd',
+            }, format='json'),
+            status_code=201,
+        )
+
+    def test_partial_update(self):
+        self.assertQueryBudget(
+            2 + SEARCH_REFRESH, self.add_events,
+            lambda events: self.client.patch(
+                f'/api/workorders/events/{events[0].pk}/', {'address': '2 Dune Rd'}, format='json',
+            ),
+        )
+
+    def test_destroy(self):
+        self.assertQueryBudget(
+            3 + SEARCH_REFRESH, self.add_events,
+            lambda events: self.client.delete(f'/api/workorders/events/{events[0].pk}/'), status_code=204,
+        )
+
+    def test_toggle_complete(self):
+        # One extra event stays open, so the work order is left as it is.
+        self.assertQueryBudget(
+            3 + SEARCH_REFRESH, lambda rows: self.add_events(rows + 1),
+            lambda events: self.client.post(f'/api/workorders/events/{events[0].pk}/toggle_complete/'),
+        )
+
+    def test_toggle_last_open_event_completes_work_order(self):
+        def make_rows(rows):
+            events = self.add_events(rows)
+            self.work_order.events.exclude(pk=events[0].pk).update(completed=True)
+            return events
+
+        self.assertQueryBudget(
+            5 + SEARCH_REFRESH, make_rows,
+            lambda events: self.client.post(f'/api/workorders/events/{events[0].pk}/toggle_complete/'),
+        )
+        self.work_order.refresh_from_db()
+        self.assertEqual(self.work_order.status, 'completed')
+
+    def test_update_daily_order(self):
+        def reorder(events):
+            payload = [{'id': event.pk, 'daily_order': i} for i, event in enumerate(reversed(events), start=1)]
+            return self.client.post(
+                '/api/workorders/events/update_daily_order/', {'events': payload}, format='json',
+            )
+
+        self.assertQueryBudget(4, self.add_events, reorder)
+
+    def test_optimize_route(self):
+        def make_rows(rows):
+            events = self.add_events(rows)
+            GeocodedAddress.objects.bulk_create(
+                (GeocodedAddress(address=normalize_address(event.address), latitude=40.9 + i / 1000, longitude=-72.3)
+                 for i, event in enumerate(events)),
+                ignore_conflicts=True,
+            )
+            return events
+
+        day = timezone.localdate().isoformat()
+        self.assertQueryBudget(
+            2, make_rows, lambda _: self.client.get('/api/workorders/events/optimize_route/', {'date': day}),
+        )
+
+    def test_schedule_backlog(self):
+        def make_rows(rows):
+            work_order = make_work_order()
+            Event.objects.bulk_create(Event(work_order=work_order, event_type='pickup') for _ in range(rows))
+
+        self.assertQueryBudget(
+            8, make_rows, lambda _: self.client.post('/api/workorders/events/schedule_backlog/', {}, format='json'),
+        )
+
+
+@without_throttling
+class SyncEventsTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('office', password='office-pass'))
+        self.work_order = make_work_order(events=3)
+        self.other_event = add_events(make_work_order(), 1)[0]
+
+    def event_payload(self, event, **changes):
+        return {
+            'id': event.pk, 'event_type': event.event_type, 'address': event.address, 'date': event.date.isoformat(),
+            'daily_order': event.daily_order, 'scheduled_time': event.scheduled_time.isoformat(), **changes,
+        }
+
+    def test_update_keeps_changes_removes_and_adds_events(self):
+        untouched, changed, removed = self.work_order.events.all()
+        response = self.client.patch(f'/api/workorders/{self.work_order.pk}/', {'events': [
+            self.event_payload(untouched),
+            self.event_payload(changed, address='9 Harbor Rd', daily_order=5),
+            {'event_type': 'install', 'address': '1 New St', 'date': changed.date.isoformat(), 'daily_order': 6},
+            # Belongs to another work order, so it is ignored.
+            self.event_payload(self.other_event, address='Moved'),
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        rows = list(self.work_order.events.order_by('daily_order').values_list('id', 'event_type', 'address'))
+        self.assertEqual(rows[:2], [
+            (untouched.pk, 'pickup', untouched.address), (changed.pk, 'pickup', '9 Harbor Rd'),
+        ])
+        self.assertEqual(rows[2][1:], ('install', '1 New St'))
+        self.assertNotIn(rows[2][0], {untouched.pk, changed.pk, removed.pk})
+        self.assertFalse(Event.objects.filter(pk=removed.pk).exists())
+        self.assertEqual(sorted(event['id'] for event in response.data['events']), sorted(row[0] for row in rows))
+
+        # Kept as the same row, and not written at all.
+        self.assertEqual(Event.objects.get(pk=untouched.pk).updated_at, untouched.updated_at)
+        self.assertGreater(Event.objects.get(pk=changed.pk).updated_at, changed.updated_at)
+        self.other_event.refresh_from_db()
+        self.assertNotEqual(self.other_event.address, 'Moved')
+
+
+@without_throttling
+class DailyOrderTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('dispatch', password='dispatch-pass'))
+        self.events = add_events(make_work_order(), 3)
+
+    def reorder(self, payload):
+        return self.client.post('/api/workorders/events/update_daily_order/', {'events': payload}, format='json')
+
+    def orders(self):
+        return list(Event.objects.order_by('id').values_list('id', 'daily_order'))
+
+    def test_reorders_the_day(self):
+        first, second, third = self.events
+        response = self.reorder([
+            {'id': event.pk, 'daily_order': position} for position, event in enumerate([third, first, second], start=1)
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['id'] for event in response.data['events']], [third.pk, first.pk, second.pk])
+        self.assertEqual(self.orders(), [(first.pk, 2), (second.pk, 3), (third.pk, 1)])
+
+    def test_invalid_requests_change_nothing(self):
+        first = self.events[0]
+        elsewhere = add_events(make_work_order(), 1, day=timezone.localdate() + timedelta(days=1))[0]
+        unknown = max(event.pk for event in [*self.events, elsewhere]) + 1
+        cases = {
+            'duplicate ids': (
+                [{'id': first.pk, 'daily_order': 2}, {'id': first.pk, 'daily_order': 1}], 'Duplicate event ids',
+            ),
+            'unknown id': (
+                [{'id': first.pk, 'daily_order': 2}, {'id': unknown, 'daily_order': 1}], 'Events not found',
+            ),
+            'missing id': ([{'id': first.pk, 'daily_order': 2}, {'daily_order': 1}], None),
+            'several dates': (
+                [{'id': first.pk, 'daily_order': 2}, {'id': elsewhere.pk, 'daily_order': 1}],
+                'All events must be scheduled on the same date',
+            ),
+        }
+        before = self.orders()
+        for label, (payload, error) in cases.items():
+            with self.subTest(label):
+                response = self.reorder(payload)
+                self.assertEqual(response.status_code, 400)
+                if error:
+                    self.assertEqual(response.data['error'], error)
+                else:
+                    self.assertIn('id', response.data[1])
+                self.assertEqual(self.orders(), before)
+
+        response = self.reorder([{'id': unknown, 'daily_order': 1}])
+        self.assertEqual(response.data['ids'], [unknown])
+
+
+@without_throttling
+@override_settings(ROUTE_DEPOT='40.90,-72.40')
+class OptimizeRouteTests(APITestCase):
+    # Stops due east of the depot, one km or so apart.
+    STOPS = {f"{n} Ocean Rd": (40.90, -72.40 + n / 100) for n in range(1, 7)}
+
+    def setUp(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('dispatch', password='dispatch-pass'))
+        self.work_order = make_work_order()
+        GeocodedAddress.objects.bulk_create(
+            GeocodedAddress(address=normalize_address(address), latitude=lat, longitude=lon)
+            for address, (lat, lon) in self.STOPS.items()
+        )
+        self.day = timezone.localdate()
+
+    def add_stops(self, numbers, times=None):
+        times = times or {}
+        return {
+            n: Event.objects.create(
+                work_order=self.work_order, event_type='pickup', address=f"{n} Ocean Rd",
+                date=self.day, daily_order=position, scheduled_time=times.get(n),
+            )
+            for position, n in enumerate(numbers, start=1)
+        }
+
+    def propose(self):
+        response = self.client.get('/api/workorders/events/optimize_route/', {'date': self.day.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_orders_stops_outward_from_depot_and_applies(self):
+        events = self.add_stops([4, 1, 6, 2, 5, 3])
+        Event.objects.create(work_order=self.work_order, event_type='wrap', address='Unknown Ln', date=self.day)
+        proposal = self.propose()
+
+        by_id = {event.pk: n for n, event in events.items()}
+        self.assertEqual([by_id.get(item['id']) for item in proposal['events']], [1, 2, 3, 4, 5, 6, None])
+        self.assertEqual(len(proposal['unlocated']), 1)
+        self.assertLess(proposal['proposed_cost'], proposal['current_cost'])
+
+        response = self.client.post(
+            '/api/workorders/events/update_daily_order/', {'events': proposal['events']}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['address'] for event in response.data['events'][:2]], ['1 Ocean Rd', '2 Ocean Rd'])
+
+    def test_scheduled_times_stay_in_order(self):
+        events = self.add_stops([1, 2, 3, 4, 5, 6], times={6: time(9), 1: time(13)})
+        proposal = self.propose()
+
+        order = [item['id'] for item in proposal['events']]
+        self.assertLess(order.index(events[6].pk), order.index(events[1].pk))
+
+    def test_requires_date(self):
+        response = self.client.get('/api/workorders/events/optimize_route/', {'date': 'tomorrow'})
+        self.assertEqual(response.status_code, 400)
+
+
+@without_throttling
+@override_settings(
+    SCHEDULER_WEEKDAYS=[0, 1, 2, 3, 4, 5, 6], SCHEDULER_CREW_HOURS=4.0, SCHEDULER_CLUSTER_RADIUS=5.0,
+    SCHEDULER_EVENT_HOURS={'pickup': 1.0}, SCHEDULER_DAILY_LIMITS={},
+)
+class ScheduleBacklogTests(APITestCase):
+    # Two towns about 30 km apart, four addresses in each.
+    TOWNS = {'Montauk': (41.03, -71.95), 'Southampton': (40.88, -72.39)}
+
+    def setUp(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('dispatch', password='dispatch-pass'))
+        self.start = timezone.localdate()
+        GeocodedAddress.objects.bulk_create(
+            GeocodedAddress(address=normalize_address(f"{n} Main St, {town}"), latitude=lat + n / 1000, longitude=lon)
+            for town, (lat, lon) in self.TOWNS.items()
+            for n in range(4)
+        )
+
+    def add_backlog(self, work_order, towns):
+        """An undated pickup per entry of `towns`, each at the town's next address."""
+        return Event.objects.bulk_create(
+            Event(work_order=work_order, event_type='pickup', address=f"{towns[:i].count(town)} Main St, {town}")
+            for i, town in enumerate(towns)
+        )
+
+    def schedule(self, **data):
+        response = self.client.post(
+            '/api/workorders/events/schedule_backlog/', {'start': self.start.isoformat(), **data}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_batches_nearby_stops_within_capacity(self):
+        work_order = make_work_order()
+        # Alternating towns, oldest first; each day holds four one-hour stops.
+        events = self.add_backlog(work_order, ['Montauk', 'Southampton'] * 4)
+        Event.objects.create(work_order=work_order, event_type='pickup', address='Unknown Ln')
+        result = self.schedule(days=2)
+
+        days = {item['id']: item['date'] for item in result['scheduled']}
+        montauk, southampton = events[0::2], events[1::2]
+        self.assertEqual({days[event.pk] for event in montauk}, {self.start})
+        self.assertEqual({days[event.pk] for event in southampton}, {self.start + timedelta(days=1)})
+        self.assertEqual(len(result['unscheduled']), 1)
+
+        work_order.refresh_from_db()
+        self.assertEqual(work_order.status, 'in_progress')
+        self.assertEqual(
+            list(Event.objects.filter(date=self.start).values_list('daily_order', flat=True)), [1, 2, 3, 4],
+        )
+
+    def test_existing_bookings_use_capacity(self):
+        work_order = make_work_order()
+        add_events(work_order, 3, day=self.start)
+        events = self.add_backlog(work_order, ['Montauk', 'Montauk'])
+        result = self.schedule(days=2)
+
+        self.assertEqual(
+            [(item['id'], item['date'], item['daily_order']) for item in result['scheduled']],
+            [(events[0].pk, self.start, 4), (events[1].pk, self.start + timedelta(days=1), 1)],
+        )
+
+    def test_later_stages_wait_for_the_pickup(self):
+        self.add_backlog(make_work_order(), ['Southampton'] * 3)
+        work_order = make_work_order()
+        # The pickup is far from everything else; the install sits beside the other job's stops.
+        pickup, install, dropoff = Event.objects.bulk_create([
+            Event(work_order=work_order, event_type='pickup', address='0 Main St, Montauk'),
+            Event(work_order=work_order, event_type='install', address='3 Main St, Southampton'),
+            Event(work_order=work_order, event_type='dropoff', address='3 Main St, Southampton'),
+        ])
+        result = self.schedule(days=3)
+
+        days = {item['id']: item['date'] for item in result['scheduled']}
+        self.assertLessEqual({pickup.pk, install.pk, dropoff.pk}, set(days))
+        self.assertLessEqual(days[pickup.pk], days[install.pk])
+        self.assertLessEqual(days[install.pk], days[dropoff.pk])
+
+    def test_later_stages_wait_for_a_pickup_dated_past_the_horizon(self):
+        work_order = make_work_order()
+        Event.objects.create(work_order=work_order, event_type='pickup', date=self.start + timedelta(days=30))
+        install = Event.objects.create(work_order=work_order, event_type='install', address='0 Main St, Montauk')
+        result = self.schedule(days=3)
+
+        self.assertEqual((result['scheduled'], result['unscheduled']), ([], [install.pk]))
+
+    def test_dry_run_saves_nothing(self):
+        work_order = make_work_order()
+        self.add_backlog(work_order, ['Montauk'])
+        result = self.schedule(dry_run=True)
+
+        self.assertEqual(len(result['scheduled']), 1)
+        self.assertFalse(Event.objects.filter(date__isnull=False).exists())
+        work_order.refresh_from_db()
+        self.assertEqual(work_order.status, 'pending')
+
+
+@without_throttling
+class DeduplicatingStorageTests(APITestCase):
+    def setUp(self):
+        self.inner = use_local_attachment_storage(self)
+        self.work_order = make_work_order()
+
+    def attach(self, content, name='plan.pdf'):
+        return JobAttachment.objects.create(work_order=self.work_order, file=SimpleUploadedFile(name, content))
+
+    def test_duplicate_content_is_stored_once(self):
+        with mock.patch.object(self.inner, 'save', wraps=self.inner.save) as save:
+            first = self.attach(b'floor plan')
+            second = self.attach(b'floor plan', name='copy.pdf')
+            self.attach(b'another plan')
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(save.call_count, 2)
+        blob = AttachmentBlob.objects.get(name=first.file.name)
+        self.assertEqual((blob.sha256, blob.ref_count), (hashlib.sha256(b'floor plan').hexdigest(), 2))
+
+    def test_file_is_removed_with_its_last_reference(self):
+        first, second = self.attach(b'floor plan'), self.attach(b'floor plan')
+        name = first.file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(AttachmentBlob.objects.get(name=name).ref_count, 1)
+        self.assertTrue(self.inner.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(AttachmentBlob.objects.filter(name=name).exists())
+        self.assertFalse(self.inner.exists(name))
+
+    def test_replacing_a_file_releases_the_previous_blob(self):
+        attachment = self.attach(b'draft')
+        old_name = attachment.file.name
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment = JobAttachment.objects.get(pk=attachment.pk)
+            attachment.file = SimpleUploadedFile('final.pdf', b'final')
+            attachment.save()
+        self.assertFalse(AttachmentBlob.objects.filter(name=old_name).exists())
+        self.assertFalse(self.inner.exists(old_name))
+
+    def test_files_stored_before_deduplication_are_never_deleted(self):
+        name = self.inner.save('job_attachments/legacy.pdf', ContentFile(b'legacy'))
+        first, second = JobAttachment.objects.bulk_create(
+            JobAttachment(work_order=self.work_order, file=name, file_type='pdf') for _ in range(2)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+            attachment_storage().delete_many([name])
+        self.assertTrue(self.inner.exists(name))
+
+    def test_uploads_are_hashed_as_they_stream_in(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('uploader', password='uploader-pass'))
+        content = b'scan ' * 100
+        # Below and above the in-memory limit, so both upload handlers are covered.
+        for max_memory in (10 * 1024, 100):
+            with self.subTest(max_memory=max_memory), self.settings(FILE_UPLOAD_MAX_MEMORY_SIZE=max_memory), \
+                    mock.patch.object(DeduplicatingStorage, '_save', autospec=True,
+                                      side_effect=DeduplicatingStorage._save) as save:
+                response = self.client.post('/api/workorders/attachments/', {
+                    'work_order': self.work_order.pk, 'file': SimpleUploadedFile('scan.txt', content),
+                })
+                self.assertEqual(response.status_code, 201)
+                stored = save.call_args.args[2]
+                self.assertEqual(stored.sha256, hashlib.sha256(content).hexdigest())
+
+
+@without_throttling
+class BatchUploadTests(APITestCase):
+    def setUp(self):
+        self.inner = use_local_attachment_storage(self)
+        self.client.force_authenticate(CustomUser.objects.create_user('uploader', password='uploader-pass'))
+        self.work_order = make_work_order()
+
+    def upload(self, *files):
+        return self.client.post('/api/workorders/attachments/batch/', {
+            'work_order': self.work_order.pk,
+            'files': [SimpleUploadedFile(name, content) for name, content in files],
+        })
+
+    def test_valid_files_are_stored_and_the_rest_reported(self):
+        with mock.patch.object(self.inner, 'save', wraps=self.inner.save) as save:
+            response = self.upload(
+                ('a.txt', b'alpha'), ('empty.txt', b''), ('b.txt', b'alpha'), ('tool.exe', b'binary'), ('c.txt', b'beta'),
+            )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['created'], response.data['failed']), (3, 2))
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'failed', 'created', 'failed', 'created'],
+        )
+        # One upload per distinct content.
+        self.assertEqual(save.call_count, 2)
+        self.assertEqual(AttachmentBlob.objects.get(sha256=hashlib.sha256(b'alpha').hexdigest()).ref_count, 2)
+        self.assertEqual(self.work_order.attachments.count(), 3)
+
+    def test_stored_content_is_not_uploaded_again(self):
+        JobAttachment.objects.create(work_order=self.work_order, file=SimpleUploadedFile('a.txt', b'alpha'))
+        with mock.patch.object(self.inner, 'save', wraps=self.inner.save) as save:
+            response = self.upload(('again.txt', b'alpha'))
+
+        self.assertEqual(response.status_code, 201)
+        save.assert_not_called()
+        self.assertEqual(AttachmentBlob.objects.get().ref_count, 2)
+
+    def test_storage_errors_fail_only_their_files(self):
+        def save(name, content):
+            if content.read() == b'beta':
+                raise OSError('network down')
+            return FileSystemStorage.save(self.inner, name, content)
+
+        with mock.patch.object(self.inner, 'save', side_effect=save):
+            response = self.upload(('a.txt', b'alpha'), ('b.txt', b'beta'))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [(result['status'], result['error']) for result in response.data['results']],
+            [('created', None), ('failed', 'Upload failed: network down')],
+        )
+        self.assertEqual(AttachmentBlob.objects.count(), 1)
+
+
+@without_throttling
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('pager', password='pager-pass'))
+        client = make_client()
+        self.ids = [make_work_order(client).pk for _ in range(25)]
+
+    def test_next_links_walk_every_row_once(self):
+        response = self.client.get('/api/workorders/', {'pagination': 'cursor'})
+        seen = [row['id'] for row in response.data['results']]
+        self.assertEqual(len(seen), 20)
+        response = self.client.get(response.data['next'])
+        seen += [row['id'] for row in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        # Newest first, ties broken by id.
+        expected = WorkOrder.objects.order_by('-created_at', 'id').values_list('id', flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_ordering_cannot_be_combined_with_a_cursor(self):
+        response = self.client.get('/api/workorders/', {'pagination': 'cursor', 'ordering': 'client__name'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.data)
+        # Page numbers still honour it.
+        response = self.client.get('/api/workorders/', {'ordering': '-id'})
+        self.assertEqual(response.data['results'][0]['id'], max(self.ids))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/workorders/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class DeliveryUrlTests(SimpleTestCase):
+    NAME = 'job_attachments/sha256/abc.png'
+
+    def setUp(self):
+        _build_delivery_url.cache_clear()
+        self.addCleanup(_build_delivery_url.cache_clear)
+
+    def test_cloudinary_urls_carry_the_variant_transformation(self):
+        with mock.patch.object(cloudinary.config(), 'cloud_name', 'demo'):
+            thumbnail = delivery_url(self.NAME, 'thumbnail')
+            raw = delivery_url('job_attachments/sha256/abc.pdf', 'raw')
+        self.assertEqual(
+            thumbnail, f'https://res.cloudinary.com/demo/image/upload/c_fill,f_auto,h_200,q_auto,w_200/v1/{self.NAME}',
+        )
+        self.assertIn('/demo/raw/upload/', raw)
+
+    def test_cloudinary_urls_are_memoized(self):
+        with mock.patch.object(cloudinary.config(), 'cloud_name', 'demo'):
+            urls = {delivery_url(self.NAME, 'display') for _ in range(3)}
+            delivery_url(self.NAME, 'thumbnail')
+        self.assertEqual(len(urls), 1)
+        info = _build_delivery_url.cache_info()
+        self.assertEqual((info.misses, info.hits), (2, 2))
+
+    def test_other_storage_serves_the_stored_file(self):
+        inner = use_local_attachment_storage(self)
+        for variant in ('image', 'thumbnail', 'display'):
+            self.assertEqual(delivery_url(self.NAME, variant), inner.url(self.NAME))
+        self.assertEqual(_build_delivery_url.cache_info().currsize, 0)
+
+
+@without_throttling
+class ThumbnailTests(APITestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        thumbnail_storage = FileSystemStorage(location=media, base_url='/media/')
+        for patcher in (
+            mock.patch.object(JobAttachment._meta.get_field('thumbnail'), 'storage', thumbnail_storage),
+            mock.patch('workorders.models.delivery_url', side_effect=lambda name, variant: f'cdn/{variant}/{name}'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        use_local_attachment_storage(self)
+        self.client.force_authenticate(CustomUser.objects.create_user('photos', password='photos-pass'))
+
+        image = BytesIO()
+        Image.new('RGB', (1200, 900), 'teal').save(image, 'PNG')
+        # Commit callbacks aren't run, so no background job is queued; tests render directly.
+        self.attachment = JobAttachment.objects.create(
+            work_order=make_work_order(), file=SimpleUploadedFile('photo.png', image.getvalue()),
+        )
+
+    def fetch(self):
+        return self.client.get(f'/api/workorders/attachments/{self.attachment.pk}/').data
+
+    def test_pending_thumbnail_falls_back_to_a_delivery_transformation(self):
+        data = self.fetch()
+        self.assertEqual((data['thumbnail_status'], data['thumbnails']), ('pending', {}))
+        self.assertEqual(data['thumbnail_url'], f'cdn/thumbnail/{self.attachment.file.name}')
+
+    def test_stored_thumbnails_are_served_once_done(self):
+        before = self.attachment.updated_at
+        self.assertTrue(generate_thumbnails(self.attachment.pk))
+
+        self.attachment.refresh_from_db()
+        self.assertEqual(set(self.attachment.thumbnails), set(settings.THUMBNAIL_SIZES))
+        self.assertGreater(self.attachment.updated_at, before)
+        data = self.fetch()
+        self.assertEqual(data['thumbnail_status'], 'done')
+        self.assertEqual(data['thumbnail_url'], f"/media/{self.attachment.thumbnails['thumb']}")
+        self.assertEqual(data['thumbnails'], {
+            size: f'/media/{name}' for size, name in self.attachment.thumbnails.items()
+        })
+
+    def test_failed_render_is_recorded(self):
+        before = self.attachment.updated_at
+        with mock.patch('workorders.thumbnails.render_thumbnails', side_effect=OSError('truncated')), \
+                self.assertLogs('workorders.thumbnails', 'ERROR'):
+            self.assertFalse(generate_thumbnails(self.attachment.pk))
+
+        self.attachment.refresh_from_db()
+        self.assertEqual((self.attachment.thumbnail_status, self.attachment.thumbnail_error), ('failed', 'truncated'))
+        self.assertGreater(self.attachment.updated_at, before)
+        self.assertEqual(self.fetch()['thumbnail_url'], f'cdn/thumbnail/{self.attachment.file.name}')
+
+    def test_finished_thumbnails_are_not_rendered_again(self):
+        generate_thumbnails(self.attachment.pk)
+        self.attachment.refresh_from_db()
+        with mock.patch('workorders.thumbnails.render_thumbnails') as render:
+            self.assertTrue(generate_thumbnails(self.attachment.pk))
+            out = StringIO()
+            call_command('retry_thumbnails', '--include-pending', stdout=out)
+        render.assert_not_called()
+        self.assertIn('Rendered thumbnails for 0 attachments, 0 failed', out.getvalue())
+        self.assertEqual(JobAttachment.objects.get(pk=self.attachment.pk).thumbnails, self.attachment.thumbnails)
+
+    def test_copies_of_a_file_reuse_its_thumbnails(self):
+        generate_thumbnails(self.attachment.pk)
+        self.attachment.refresh_from_db()
+        with self.attachment.file.open('rb') as f:
+            copy = JobAttachment.objects.create(
+                work_order=self.attachment.work_order, file=SimpleUploadedFile('copy.png', f.read()),
+            )
+        self.assertEqual(copy.file.name, self.attachment.file.name)
+
+        with mock.patch('workorders.thumbnails.render_thumbnails') as render:
+            self.assertTrue(generate_thumbnails(copy.pk))
+        render.assert_not_called()
+        copy.refresh_from_db()
+        self.assertEqual((copy.thumbnail_status, copy.thumbnails), ('done', self.attachment.thumbnails))
+
+    def test_unreadable_image_is_recorded_and_retried_up_to_the_limit(self):
+        broken = JobAttachment.objects.create(
+            work_order=self.attachment.work_order, file=SimpleUploadedFile('broken.jpg', b'not an image'),
+        )
+        with self.assertLogs('workorders.thumbnails', 'ERROR'):
+            self.assertFalse(generate_thumbnails(broken.pk))
+        broken.refresh_from_db()
+        self.assertEqual((broken.thumbnail_status, broken.thumbnail_attempts), ('failed', 1))
+        self.assertIn('cannot identify image file', broken.thumbnail_error)
+
+        with self.settings(THUMBNAIL_MAX_ATTEMPTS=2), self.assertLogs('workorders.thumbnails', 'ERROR'):
+            for _ in range(3):
+                call_command('retry_thumbnails', stdout=StringIO())
+        broken.refresh_from_db()
+        self.assertEqual(broken.thumbnail_attempts, 2)
+
+
+@without_throttling
+class SearchRefreshTests(APITestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first, self.second = make_work_order(events=3), make_work_order()
+        # Queue refreshes as on PostgreSQL, from here on.
+        patcher = mock.patch('workorders.search.search_enabled', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_refresh_per_transaction(self):
+        with mock.patch('workorders.search.refresh_search_index') as refresh, \
+                self.captureOnCommitCallbacks(execute=True):
+            for event in self.first.events.all():
+                event.save()
+            self.second.save()
+        refresh.assert_called_once_with({self.first.pk, self.second.pk})
+
+    def test_rolled_back_ids_are_not_refreshed(self):
+        with mock.patch('workorders.search.refresh_search_index') as refresh, \
+                self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.first.save()
+                raise RuntimeError
+            self.second.save()
+        refresh.assert_called_once_with({self.second.pk})
+
+
+@without_throttling
+@skipUnless(search_enabled(), "Full-text search needs PostgreSQL")
+class FullTextSearchTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(CustomUser.objects.create_user('search', password='search-pass'))
+        with self.captureOnCommitCallbacks(execute=True):
+            # Notes and events are bulk inserted after the work order is saved,
+            # and still reach its document because the refresh waits for commit.
+            self.by_note = make_work_order(client=make_client(name='Harbor Gallery'))
+            JobNote.objects.create(work_order=self.by_note, note='Crate the sculptures for shipping')
+            self.by_client = make_work_order(client=make_client(name='Sculpture Park'))
+            add_events(self.by_client, 1)
+
+    def search(self, term):
+        response = self.client.get('/api/workorders/', {'search': term})
+        return [row['id'] for row in response.data['results']]
+
+    def test_matches_are_stemmed_and_ranked(self):
+        # The client name outranks a note.
+        self.assertEqual(self.search('sculpture'), [self.by_client.pk, self.by_note.pk])
+
+    def test_addresses_match_exact_tokens(self):
+        self.assertEqual(self.search('Main'), [self.by_client.pk])
+
+    def test_document_follows_client_renames(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            client = self.by_note.client
+            client.name = 'Lighthouse Gallery'
+            client.save()
+        self.assertEqual(self.search('lighthouse'), [self.by_note.pk])
+
+
+@without_throttling
+class SignalBatchTests(APITestCase):
+    def test_tombstones_are_written_in_the_delete_transaction(self):
+        work_order = make_work_order(events=3)
+        event_ids = set(work_order.events.values_list('id', flat=True))
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            WorkOrder.objects.filter(pk=work_order.pk).delete()
+            raise RuntimeError
+        self.assertFalse(EventTombstone.objects.exists())
+
+        # No commit callbacks run here: the tombstones don't wait for one.
+        WorkOrder.objects.filter(pk=work_order.pk).delete()
+        self.assertEqual(set(EventTombstone.objects.values_list('event_id', flat=True)), event_ids)
+
+    def test_commit_batch_flushes_once_without_rolled_back_items(self):
+        flush = mock.Mock()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                on_commit_batch(flush, 'rolled back')
+                raise RuntimeError
+            on_commit_batch(flush, 'first')
+            on_commit_batch(flush, 'second')
+
+        self.assertEqual(len(callbacks), 1)
+        flush.assert_called_once_with(['first', 'second'])
+
+        # A batch that has run starts over.
+        with self.captureOnCommitCallbacks(execute=True):
+            on_commit_batch(flush, 'next')
+        flush.assert_called_with(['next'])
+
+
+class JobAttachmentQueryBudgetTests(QueryBudgetTestCase):
+    def setUpFixtures(self):
+        self.work_order = make_work_order()
+
+    def add_attachments(self, rows):
+        return JobAttachment.objects.bulk_create(
+            JobAttachment(work_order=self.work_order, file=f"job_attachments/budget/{i}.txt", file_type='text')
+            for i in range(rows)
+        )
+
+    def test_list(self):
+        self.assertQueryBudget(2, self.add_attachments, lambda _: self.client.get('/api/workorders/attachments/'))
+
+    def test_list_for_work_order(self):
+        self.assertQueryBudget(
+            2, self.add_attachments,
+            lambda _: self.client.get('/api/workorders/attachments/', {'work_order': self.work_order.pk}),
+        )
+
+    def test_retrieve(self):
+        self.assertQueryBudget(
+            1, self.add_attachments,
+            lambda attachments: self.client.get(f'/api/workorders/attachments/{attachments[0].pk}/'),
+        )
+
+    def test_create(self):
+        def upload(attachments):
+            # Distinct content each time, so every upload stores a new blob.
+            return self.client.post('/api/workorders/attachments/', {
+                'work_order': self.work_order.pk,
+                'file': SimpleUploadedFile('notes.txt', f'hang at eye level ({len(attachments)})'.encode()),
+            })
+
+        self.assertQueryBudget(10, self.add_attachments, upload, status_code=201)
+
+    def test_batch(self):
+        def make_files(rows):
+            # One file repeats content already stored, the rest are new.
+            stored = SimpleUploadedFile('stored.txt', f'stored {rows}'.encode())
+            self.client.post('/api/workorders/attachments/', {'work_order': self.work_order.pk, 'file': stored})
+            return [SimpleUploadedFile('again.txt', f'stored {rows}'.encode())] + [
+                SimpleUploadedFile(f'{i}.txt', f'new {rows} {i}'.encode()) for i in range(rows)
+            ]
+
+        self.assertQueryBudget(
+            10, make_files,
+            lambda files: self.client.post('/api/workorders/attachments/batch/', {
+                'work_order': self.work_order.pk, 'files': files,
+            }),
+            status_code=201, rows=settings.ATTACHMENT_BATCH_MAX_FILES - 1,
+        )
+
+    def test_destroy(self):
+        self.assertQueryBudget(
+            6, self.add_attachments,
+            lambda attachments: self.client.delete(f'/api/workorders/attachments/{attachments[0].pk}/'),
+            status_code=204,
+        )
+
+
+class JobNoteQueryBudgetTests(QueryBudgetTestCase):
+    def setUpFixtures(self):
+        self.work_order = make_work_order()
+
+    def add_notes(self, rows):
+        return JobNote.objects.bulk_create(JobNote(work_order=self.work_order, note=f"Note {i}") for i in range(rows))
+
+    def test_list(self):
+        self.assertQueryBudget(2, self.add_notes, lambda _: self.client.get('/api/workorders/notes/'))
+
+    def test_retrieve(self):
+        self.assertQueryBudget(
+            1, self.add_notes, lambda notes: self.client.get(f'/api/workorders/notes/{notes[0].pk}/'),
+        )
+
+    def test_create(self):
+        self.assertQueryBudget(
+            2 + SEARCH_REFRESH, self.add_notes,
+            lambda _: self.client.post('/api/workorders/notes/', {
+                'work_order': self.work_order.pk, 'note': 'Gate code 1234',
+            }, format='json'),
+            status_code=201,
+        )
+
+    def test_partial_update(self):
+        self.assertQueryBudget(
+            2 + SEARCH_REFRESH, self.add_notes,
+            lambda notes: self.client.patch(f'/api/workorders/notes/{notes[0].pk}/', {'note': 'Done'}, format='json'),
+        )
+
+    def test_destroy(self):
+        self.assertQueryBudget(
+            2 + SEARCH_REFRESH, self.add_notes,
+            lambda notes: self.client.delete(f'/api/workorders/notes/{notes[0].pk}/'), status_code=204,
+        )
+
+
+@without_throttling
+class ChunkedUploadTests(APITestCase):
+    CONTENT = b'0123456789' * 3
+
+    def setUp(self):
+        use_temp_upload_dir(self)
+        use_local_attachment_storage(self)
+        self.client.force_authenticate(CustomUser.objects.create_user('uploader', password='uploader-pass'))
+        self.session = UploadSession.objects.create(
+            work_order=make_work_order(), filename='scan.txt', size=len(self.CONTENT),
+        )
+        self.url = f'/api/workorders/uploads/{self.session.pk}/'
+
+    def put_chunk(self, offset, data):
+        return self.client.generic(
+            'PUT', f'{self.url}chunk/', data,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_chunks_then_finalize(self):
+        for offset in range(0, len(self.CONTENT), 10):
+            response = self.put_chunk(offset, self.CONTENT[offset:offset + 10])
+            self.assertEqual((response.status_code, response['Upload-Offset']), (200, str(offset + 10)))
+        self.assertEqual(self.client.get(self.url).data['offset'], len(self.CONTENT))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{self.url}finalize/')
+        self.assertEqual(response.status_code, 201)
+        attachment = JobAttachment.objects.get(pk=response.data['id'])
+        with attachment.file.open('rb') as f:
+            self.assertEqual(f.read(), self.CONTENT)
+        self.assertFalse(uploads.part_path(self.session.pk).exists())
+
+        # Finalizing again returns the same attachment.
+        again = self.client.post(f'{self.url}finalize/')
+        self.assertEqual((again.status_code, again.data['id']), (201, attachment.pk))
+
+    def test_offset_mismatch_reports_the_expected_offset(self):
+        self.put_chunk(0, self.CONTENT[:10])
+        for offset in (0, 20):
+            response = self.put_chunk(offset, self.CONTENT[offset:offset + 10])
+            self.assertEqual((response.status_code, response.data['offset']), (409, 10))
+
+    def test_chunk_that_lands_while_another_is_read_is_rejected(self):
+        class Stream:
+            # A retry of the same chunk is committed while this one is still arriving.
+            def __init__(self, data):
+                self.data = data
+
+            def read(self, size):
+                UploadSession.objects.filter(pk=session.pk).update(offset=10)
+                data, self.data = self.data[:size], self.data[size:]
+                return data
+
+        session = self.session
+        with self.assertRaises(uploads.OffsetMismatch):
+            uploads.append_chunk(session, 0, Stream(self.CONTENT[:10]), 10)
+        self.assertFalse(uploads.part_path(session.pk).exists())
+
+    def test_chunk_past_the_declared_size(self):
+        response = self.put_chunk(0, self.CONTENT + b'!')
+        self.assertEqual(response.status_code, 400)
+
+    def test_incomplete_upload_cannot_be_finalized(self):
+        self.put_chunk(0, self.CONTENT[:10])
+        response = self.client.post(f'{self.url}finalize/')
+        self.assertEqual((response.status_code, response.data['offset']), (409, 10))
+
+
+class UploadSessionQueryBudgetTests(QueryBudgetTestCase):
+    SIZE = 10
+
+    def setUpFixtures(self):
+        self.work_order = make_work_order()
+
+    def add_sessions(self, rows):
+        return UploadSession.objects.bulk_create(
+            UploadSession(work_order=self.work_order, filename=f'scan{i}.txt', size=self.SIZE)
+            for i in range(rows)
+        )
+
+    def put_chunk(self, session):
+        # Content differs per session, so finalizing always stores a new blob.
+        return self.client.generic(
+            'PUT', f'/api/workorders/uploads/{session.pk}/chunk/', session.pk.hex[:self.SIZE].encode(),
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET='0',
+        )
+
+    def test_create(self):
+        self.assertQueryBudget(
+            2, self.add_sessions,
+            lambda _: self.client.post('/api/workorders/uploads/', {
+                'work_order': self.work_order.pk, 'filename': 'scan.txt', 'size': self.SIZE,
+            }, format='json'),
+            status_code=201,
+        )
+
+    def test_retrieve(self):
+        self.assertQueryBudget(
+            1, self.add_sessions, lambda sessions: self.client.get(f'/api/workorders/uploads/{sessions[0].pk}/'),
+        )
+
+    def test_chunk(self):
+        self.assertQueryBudget(5, self.add_sessions, lambda sessions: self.put_chunk(sessions[0]))
+
+    def test_finalize(self):
+        def make_rows(rows):
+            sessions = self.add_sessions(rows)
+            self.put_chunk(sessions[0])
+            return sessions
+
+        self.assertQueryBudget(
+            14, make_rows,
+            lambda sessions: self.client.post(f'/api/workorders/uploads/{sessions[0].pk}/finalize/'),
+            status_code=201,
+        )
+
+    def test_destroy(self):
+        self.assertQueryBudget(
+            2, self.add_sessions,
+            lambda sessions: self.client.delete(f'/api/workorders/uploads/{sessions[0].pk}/'), status_code=204,
+        )
+
+
+class SeedDataTests(APITestCase):
+    def test_rows_and_derived_data(self):
+        with mock.patch(
+            'workorders.management.commands.seed_data.refresh_search_index', wraps=refresh_search_index,
+        ) as refresh:
+            call_command(
+                'seed_data', work_orders=12, orders_per_client=4, chunk_size=5, invoice_ratio=1,
+                seed=1, force=True, stdout=StringIO(),
+            )
+
+        completed = WorkOrder.objects.filter(status='completed')
+        self.assertEqual(Client.objects.count(), 3)
+        self.assertEqual(WorkOrder.objects.count(), 12)
+        self.assertEqual(Event.objects.count(), 24)
+        self.assertEqual(JobNote.objects.count(), 12)
+        self.assertEqual(JobAttachment.objects.count(), 12)
+        self.assertEqual(Invoice.objects.count(), completed.count())
+        self.assertEqual(WorkOrder.objects.filter(invoiced=True).count(), completed.count())
+
+        # bulk_create skips the signals, so these only hold if the rebuilds ran.
+        stored = Client.objects.values_list('pk', 'last_activity', 'work_order_count')
+        fresh = Client.objects.annotate(latest=Max('work_orders__updated_at'), n=Count('work_orders'))
+        self.assertCountEqual(stored, fresh.values_list('pk', 'latest', 'n'))
+        self.assertEqual(
+            InvoiceRollup.objects.aggregate(count=Sum('count'), total=Sum('total')),
+            Invoice.objects.aggregate(count=Count('id'), total=Sum('amount')),
+        )
+        refresh.assert_called_once_with()
+        if search_enabled():
+            self.assertFalse(WorkOrder.objects.filter(search_document='').exists())
+
+    def test_refuses_with_debug_off(self):
+        with self.assertRaises(CommandError):
+            call_command('seed_data', work_orders=1, stdout=StringIO())
+        self.assertFalse(WorkOrder.objects.exists())
+
+
+class BenchmarkTests(APITestCase):
+    ENDPOINTS = 'workorder-list,client-list'
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_work_order(events=1, notes=1)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.output = os.path.join(directory, 'results.json')
+        self.baseline = os.path.join(directory, 'baseline.json')
+
+    def benchmark(self, **options):
+        call_command(
+            'benchmark', endpoints=self.ENDPOINTS, iterations=2, warmup=0, output=self.output,
+            stdout=StringIO(), **options,
+        )
+
+    def write_baseline(self, adjust):
+        with open(self.output) as f:
+            results = json.load(f)
+        for rows in results['results'].values():
+            for row in rows.values():
+                adjust(row)
+        with open(self.baseline, 'w') as f:
+            json.dump(results, f)
+
+    def test_within_baseline_passes(self):
+        self.benchmark()
+
+        def slower(row):
+            row['p95_ms'] = 1_000_000
+        self.write_baseline(slower)
+        self.benchmark(baseline=self.baseline)
+
+    def test_regression_exits_non_zero(self):
+        self.benchmark()
+
+        def fewer_queries(row):
+            row['p95_ms'] = 1_000_000
+            row['queries'] -= 1
+        self.write_baseline(fewer_queries)
+        with self.assertRaises(CommandError) as error:
+            self.benchmark(baseline=self.baseline)
+        self.assertEqual(error.exception.returncode, 1)
+        self.assertIn('workorder-list at 1:', str(error.exception))
+        self.assertIn('baseline ran', str(error.exception))
+
+    def test_p95_over_the_baseline_fails(self):
+        self.benchmark()
+
+        def faster(row):
+            row['p95_ms'] = 0
+        self.write_baseline(faster)
+        with self.assertRaisesMessage(CommandError, 'Benchmark thresholds exceeded'):
+            self.benchmark(baseline=self.baseline, max_regression=0)
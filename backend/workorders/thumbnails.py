@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import JobAttachment
+
+logger = logging.getLogger(__name__)
+
+# Thumbnails are rendered on a small thread pool after the upload commits, so
+# the upload request only stores the original. Pillow releases the GIL while
+# decoding and resampling, so threads are enough here.
+
+_lock = threading.Lock()
+_executor = None
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def enqueue_thumbnails(attachment_id):
+    """Render the attachment's thumbnails in the background once the current transaction commits."""
+    transaction.on_commit(lambda: get_executor().submit(_run, attachment_id))
+
+
+def _run(attachment_id):
+    close_old_connections()
+    try:
+        generate_thumbnails(attachment_id)
+    except Exception:
+        logger.exception("Thumbnail job for attachment %s crashed", attachment_id)
+    finally:
+        close_old_connections()
+
+
+def render_thumbnails(source, sizes):
+    """Return {size name: JPEG bytes} for every (width, height) box in `sizes`.
+
+    The source is decoded once. For JPEGs, `draft` lets libjpeg decode
+    straight to the smallest power-of-two scale that still covers the
+    largest box, so a 12 MP photo is never fully expanded in memory. Each
+    size is then resampled from the next larger one.
+    """
+    image = Image.open(source)
+    image.draft('RGB', (max(w for w, _ in sizes.values()), max(h for _, h in sizes.values())))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    rendered = {}
+    for name, box in sorted(sizes.items(), key=lambda item: item[1][0] * item[1][1], reverse=True):
+        image.thumbnail(box, Image.Resampling.LANCZOS)
+        out = BytesIO()
+        image.save(out, 'JPEG', quality=settings.THUMBNAIL_JPEG_QUALITY, optimize=True)
+        rendered[name] = out.getvalue()
+    return rendered
+
+
+def generate_thumbnails(attachment_id):
+    """Render and store every configured size for one attachment, recording the outcome on the row."""
+    attachment = JobAttachment.objects.filter(pk=attachment_id, file_type='image').first()
+    if attachment is None or not attachment.file:
+        return False
+
+    sizes = settings.THUMBNAIL_SIZES
+    if attachment.thumbnail_status == 'done' and set(attachment.thumbnails) == set(sizes):
+        # Already rendered, e.g. a retry run that overlapped the background job.
+        return True
+    attempts = F('thumbnail_attempts') + 1
+    # update() skips auto_now, so each write below sets updated_at itself.
+
+    # Attachments sharing a deduplicated blob can share its thumbnails too.
+    sibling = JobAttachment.objects.filter(
+        file=attachment.file.name, thumbnail_status='done',
+    ).exclude(pk=attachment_id).values('thumbnail', 'thumbnails').first()
+    if sibling and set(sibling['thumbnails']) == set(sizes):
+        JobAttachment.objects.filter(pk=attachment_id).update(
+            **sibling, thumbnail_status='done', thumbnail_error='', thumbnail_attempts=attempts,
+            updated_at=timezone.now(),
+        )
+        return True
+
+    try:
+        with attachment.file.open('rb') as source:
+            rendered = render_thumbnails(source, sizes)
+        # Blob names carry a 64-character digest; keep thumbnail names within the 100-character column.
+        stem = os.path.splitext(os.path.basename(attachment.file.name))[0][:32]
+        storage = attachment.thumbnail.storage
+        stored = {
+            name: storage.save(f'job_attachments/thumbnails/{stem}_{name}.jpg', ContentFile(data))
+            for name, data in rendered.items()
+        }
+    except Exception as exc:
+        logger.exception("Thumbnail generation failed for attachment %s", attachment_id)
+        JobAttachment.objects.filter(pk=attachment_id).update(
+            thumbnail_status='failed', thumbnail_error=str(exc)[:1000], thumbnail_attempts=attempts,
+            updated_at=timezone.now(),
+        )
+        return False
+
+    smallest = min(sizes, key=lambda name: sizes[name][0] * sizes[name][1])
+    JobAttachment.objects.filter(pk=attachment_id).update(
+        thumbnail=stored[smallest], thumbnails=stored,
+        thumbnail_status='done', thumbnail_error='', thumbnail_attempts=attempts, updated_at=timezone.now(),
+    )
+    return True
@@ -0,0 +1,178 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from django.http import UnreadablePostError
+
+from .models import (
+    JobAttachment,
+    UploadSession,
+    attachment_file_type,
+    validate_file_size,
+    validate_file_type,
+)
+from .thumbnails import enqueue_thumbnails
+
+# Chunked uploads: the client creates an UploadSession, appends chunks at the
+# offset the server reports, and finalizes once every byte has arrived. Chunks
+# are copied from the request stream to a temp file in small blocks, and the
+# finished file is handed to storage as an open file, so neither step holds
+# the upload in memory.
+
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset):
+        super().__init__(f"Expected offset {offset}")
+        self.offset = offset
+
+
+def temp_dir():
+    return Path(settings.ATTACHMENT_UPLOAD_TEMP_DIR)
+
+
+def part_path(session_id):
+    return temp_dir() / f"{session_id}.part"
+
+
+def discard_part(session_id):
+    try:
+        os.remove(part_path(session_id))
+    except FileNotFoundError:
+        pass
+
+
+def _check_chunk(session, offset, length):
+    if session.attachment_id or offset != session.offset:
+        raise OffsetMismatch(session.offset)
+    if offset + length > session.size:
+        raise ValueError("Chunk runs past the declared upload size")
+
+
+def append_chunk(session, offset, stream, length):
+    """Write `length` bytes from `stream` at `offset` and return the new offset.
+
+    The chunk is spooled to a temp file before the session row is locked,
+    so no lock or transaction is held while it arrives over the network.
+    Under the lock the offset is checked again, which keeps concurrent
+    retries of the same chunk from both landing, and the spooled bytes are
+    appended to the part file. If the client disconnects mid-chunk the
+    bytes that did arrive are kept, and the client resumes from the offset
+    it gets back from a status request.
+    """
+    # Turn away a stale retry before reading its body.
+    _check_chunk(session, offset, length)
+
+    temp_dir().mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryFile(dir=temp_dir()) as spool:
+        received = 0
+        try:
+            while received < length:
+                block = stream.read(min(COPY_BLOCK_SIZE, length - received))
+                if not block:
+                    break
+                spool.write(block)
+                received += len(block)
+        except UnreadablePostError:
+            pass
+        spool.seek(0)
+
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            _check_chunk(session, offset, length)
+            with open(part_path(session.pk), 'ab') as f:
+                # Drop any tail left by a write that died before the offset was saved.
+                f.truncate(session.offset)
+                shutil.copyfileobj(spool, f, COPY_BLOCK_SIZE)
+            session.offset += received
+            session.save(update_fields=['offset', 'updated_at'])
+    return session.offset
+
+
+def finalize(session_id):
+    """Turn a fully received session into a JobAttachment. Finalizing twice returns the same attachment."""
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(pk=session_id)
+        if session.attachment_id:
+            return session.attachment
+        if session.offset != session.size:
+            raise OffsetMismatch(session.offset)
+
+        with open(part_path(session_id), 'rb') as f:
+            upload = File(f, name=session.filename)
+            validate_file_type(upload)
+            validate_file_size(upload)
+            attachment = JobAttachment(work_order_id=session.work_order_id, file=upload)
+            attachment.save()
+
+        session.attachment = attachment
+        session.save(update_fields=['attachment', 'updated_at'])
+        transaction.on_commit(lambda: discard_part(session_id))
+    return attachment
+
+
+def save_batch(work_order, files):
+    """Store many uploads for one work order and create their JobAttachment rows together.
+
+    Every file is validated first. Valid ones are stored with one
+    save_many call, which uploads new content in parallel on up to
+    ATTACHMENT_UPLOAD_WORKERS threads while all database work stays on this
+    thread, and their rows are inserted with one bulk_create. Returns
+    (filename, attachment, error) per file in input order, with exactly one
+    of attachment/error set.
+    """
+    results = [[file.name, None, None] for file in files]
+    valid = []
+    for i, file in enumerate(files):
+        try:
+            if not file.size:
+                raise ValidationError("Empty file cannot be uploaded")
+            validate_file_type(file)
+            validate_file_size(file)
+        except ValidationError as exc:
+            results[i][2] = ' '.join(exc.messages)
+        else:
+            valid.append(i)
+
+    field = JobAttachment._meta.get_field('file')
+    saved = field.storage.save_many(
+        [(field.generate_filename(None, files[i].name), files[i]) for i in valid],
+        max_workers=settings.ATTACHMENT_UPLOAD_WORKERS,
+    )
+    stored = {}
+    for i, result in zip(valid, saved):
+        if isinstance(result, Exception):
+            results[i][2] = f"Upload failed: {result}"
+        else:
+            stored[i] = result
+
+    rows = [
+        JobAttachment(
+            work_order=work_order,
+            file=name,
+            file_type=attachment_file_type(name),
+            file_size=files[i].size,
+            thumbnail_status='pending' if attachment_file_type(name) == 'image' else '',
+        )
+        for i, name in stored.items()
+    ]
+    try:
+        with transaction.atomic():
+            JobAttachment.objects.bulk_create(rows)
+    except Exception:
+        # bulk_create skips JobAttachment.save and signals, so give back the
+        # blob references the storage saves took.
+        field.storage.delete_many(stored.values())
+        raise
+
+    for i, row in zip(stored, rows):
+        results[i][1] = row
+        if row.file_type == 'image':
+            enqueue_thumbnails(row.pk)
+    return [tuple(result) for result in results]
@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import WorkOrderViewSet, EventViewSet, JobAttachmentViewSet, JobNoteViewSet, workorder_pdf
+from .views import WorkOrderViewSet, EventViewSet, JobAttachmentViewSet, JobNoteViewSet, UploadSessionViewSet, workorder_pdf
 
 router = DefaultRouter()
 router.register(r'events', EventViewSet, basename='event')
 router.register(r'attachments', JobAttachmentViewSet, basename='attachment')
 router.register(r'notes', JobNoteViewSet, basename='note')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 router.register(r'', WorkOrderViewSet, basename='workorder')
 
 urlpatterns = [
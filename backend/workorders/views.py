@@ -1,15 +1,25 @@
-from rest_framework import viewsets, status, filters
+from datetime import date, time
+from functools import partial
+
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.db.models import Q
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, prefetch_related_objects
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
-from django.template.loader import render_to_string
 from django.utils import timezone
-from weasyprint import HTML
+from django.utils.dateparse import parse_date
+
+from pdfs.export import filter_export_queryset, pdf_zip_response
+from pdfs.render import serve_pdf
 
-from .models import WorkOrder, Event, JobAttachment, JobNote
+from . import routing, scheduling, uploads
+from .models import WorkOrder, Event, JobAttachment, JobNote, UploadSession
+from .search import SearchRankOrderingFilter, search_work_orders
 from .serializers import (
     WorkOrderListSerializer,
     WorkOrderDetailSerializer,
@@ -17,16 +27,35 @@ from .serializers import (
     EventSerializer,
     JobAttachmentSerializer,
     JobNoteSerializer,
+    UploadSessionSerializer,
 )
 
 
+def related_count(model):
+    """Correlated COUNT of `model` rows per work order, as an annotation."""
+    counts = model.objects.filter(work_order=OuterRef('pk')).order_by().values('work_order').annotate(
+        n=Count('id')
+    ).values('n')
+    return Coalesce(Subquery(counts), 0)
+
+
+def day_order_key(event):
+    """Sort key matching Event.Meta.ordering within one day, with NULLs last as Postgres sorts them."""
+    return (
+        event.daily_order is None, event.daily_order or 0,
+        event.scheduled_time is None, event.scheduled_time or time.min,
+        event.id,
+    )
+
+
 class WorkOrderViewSet(viewsets.ModelViewSet):
     queryset = WorkOrder.objects.select_related('client').prefetch_related(
         'events', 'attachments', 'notes'
     ).order_by('-created_at')
-    filter_backends = [filters.OrderingFilter]
+    filter_backends = [SearchRankOrderingFilter]
     ordering_fields = ['created_at', 'updated_at', 'client__name', 'status', 'id']
     ordering = ['-created_at']
+    keyset_ordering = ('-created_at', 'id')
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -53,7 +82,17 @@ class WorkOrderViewSet(viewsets.ModelViewSet):
         return Response(detail)
 
     def get_queryset(self):
-        qs = super().get_queryset()
+        if self.action == 'list':
+            # The list only shows counts; compute them in SQL instead of prefetching every related row.
+            qs = WorkOrder.objects.select_related('client').annotate(
+                event_count=related_count(Event),
+                attachment_count=related_count(JobAttachment),
+            ).order_by('-created_at')
+        elif self.action == 'retrieve':
+            qs = super().get_queryset()
+        else:
+            # Writes and exports reload what they need; prefetching every related row up front is wasted.
+            qs = WorkOrder.objects.select_related('client').order_by('-created_at')
         status_filter = self.request.query_params.get('status')
         invoiced = self.request.query_params.get('invoiced')
         client_id = self.request.query_params.get('client')
@@ -67,14 +106,27 @@ class WorkOrderViewSet(viewsets.ModelViewSet):
             qs = qs.filter(client_id=client_id)
 
         if search:
-            q = Q(client__name__icontains=search) | Q(job_description__icontains=search)
-            numeric = search.lstrip('#').strip()
-            if numeric.isdigit():
-                q |= Q(id=int(numeric))
-            qs = qs.filter(q)
+            qs = search_work_orders(qs, search)
 
         return qs
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream a ZIP of work order PDFs. Accepts the list filters or ?ids=1,2,3."""
+        queryset = WorkOrder.with_pdf_fingerprint(
+            filter_export_queryset(request, self.filter_queryset(self.get_queryset()))
+        )
+        items = (
+            (
+                workorder_pdf_filename(workorder),
+                WORKORDER_PDF_TEMPLATE,
+                workorder.pdf_fingerprint(),
+                partial(workorder_pdf_context, workorder),
+            )
+            for workorder in queryset.iterator(chunk_size=100)
+        )
+        return pdf_zip_response(items, "work_orders.zip")
+
     @action(detail=True, methods=['post'])
     def mark_completed(self, request, pk=None):
         work_order = self.get_object()
@@ -124,6 +176,8 @@ class WorkOrderViewSet(viewsets.ModelViewSet):
 class EventViewSet(viewsets.ModelViewSet):
     queryset = Event.objects.select_related('work_order__client').all()
     serializer_class = EventSerializer
+    # Keyset mode walks events by id; date/daily_order are nullable and can't key a cursor.
+    keyset_ordering = ('id',)
 
     def get_queryset(self):
         qs = super().get_queryset()
@@ -155,7 +209,7 @@ class EventViewSet(viewsets.ModelViewSet):
             wo.status = 'in_progress'
             wo.completed_at = None
             wo.save()
-        elif event.completed and wo.events.filter(completed=False).count() == 0:
+        elif event.completed and not wo.events.filter(completed=False).exists():
             # All events are now completed — mark work order completed
             wo.status = 'completed'
             wo.completed_at = timezone.now()
@@ -179,12 +233,115 @@ class EventViewSet(viewsets.ModelViewSet):
         events_data = request.data.get('events', [])
         serializer = DailyOrderItemSerializer(data=events_data, many=True)
         serializer.is_valid(raise_exception=True)
-        for item in serializer.validated_data:
-            update_fields = {'daily_order': item['daily_order']}
-            if 'scheduled_time' in item:
-                update_fields['scheduled_time'] = item['scheduled_time']
-            Event.objects.filter(id=item['id']).update(**update_fields)
-        return Response({'status': 'ok'})
+        items = serializer.validated_data
+        if not items:
+            return Response({'status': 'ok', 'date': None, 'events': []})
+
+        ids = [item['id'] for item in items]
+        if len(set(ids)) != len(ids):
+            return Response({'error': 'Duplicate event ids'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            events = (
+                Event.objects.select_related('work_order__client')
+                .select_for_update(of=('self',))
+                .in_bulk(ids)
+            )
+            missing = sorted(set(ids) - events.keys())
+            if missing:
+                return Response(
+                    {'error': 'Events not found', 'ids': missing},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            dates = {event.date for event in events.values()}
+            if len(dates) != 1:
+                return Response(
+                    {'error': 'All events must be scheduled on the same date'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            now = timezone.now()
+            fields = ['daily_order', 'updated_at']
+            if any('scheduled_time' in item for item in items):
+                fields.append('scheduled_time')
+            for item in items:
+                event = events[item['id']]
+                event.daily_order = item['daily_order']
+                if 'scheduled_time' in item:
+                    event.scheduled_time = item['scheduled_time']
+                event.updated_at = now
+            # One UPDATE ... SET daily_order = CASE id WHEN ... for the whole day.
+            Event.objects.bulk_update(events.values(), fields, batch_size=len(events))
+
+        ordered = sorted(events.values(), key=day_order_key)
+        return Response({
+            'status': 'ok',
+            'date': dates.pop(),
+            'events': EventSerializer(ordered, many=True).data,
+        })
+
+    @action(detail=False, methods=['get'])
+    def optimize_route(self, request):
+        """Propose a stop order for the events on ?date=. Nothing is saved.
+
+        `events` is a ready update_daily_order payload; POST it there to apply
+        the proposal. Scheduled times are kept and stay in order.
+        """
+        try:
+            day = parse_date(request.query_params.get('date', ''))
+        except ValueError:
+            day = None
+        if day is None:
+            return Response({'error': 'A date (YYYY-MM-DD) is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        events = sorted(Event.objects.filter(date=day), key=day_order_key)
+        plan = routing.plan_route(events)
+        return Response({
+            'date': day,
+            'events': [
+                {'id': event.pk, 'daily_order': position}
+                for position, event in enumerate(plan['events'], start=1)
+            ],
+            'unlocated': [event.pk for event in plan['unlocated']],
+            'current_cost': round(plan['current_cost'], 2),
+            'proposed_cost': round(plan['proposed_cost'], 2),
+        })
+
+    @action(detail=False, methods=['post'])
+    def schedule_backlog(self, request):
+        """Give dates to unscheduled events over the coming working days.
+
+        Accepts optional `start` (default tomorrow), `days` (the horizon) and
+        `dry_run`. A dry run returns the same plan without saving it.
+        """
+        from rest_framework import serializers as drf_serializers
+
+        class ScheduleBacklogSerializer(drf_serializers.Serializer):
+            start = drf_serializers.DateField(required=False)
+            days = drf_serializers.IntegerField(required=False, min_value=1, max_value=366)
+            dry_run = drf_serializers.BooleanField(default=False)
+
+        serializer = ScheduleBacklogSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+
+        scheduled, unscheduled = scheduling.schedule_backlog(
+            start=options.get('start'), days=options.get('days'), dry_run=options['dry_run'],
+        )
+        return Response({
+            'dry_run': options['dry_run'],
+            'scheduled': [
+                {
+                    'id': event.pk,
+                    'work_order': event.work_order_id,
+                    'event_type': event.event_type,
+                    'date': day,
+                    'daily_order': daily_order,
+                }
+                for event, day, daily_order in scheduled
+            ],
+            'unscheduled': [event.pk for event in unscheduled],
+        })
 
 
 class JobAttachmentViewSet(viewsets.ModelViewSet):
@@ -198,6 +355,96 @@ class JobAttachmentViewSet(viewsets.ModelViewSet):
             qs = qs.filter(work_order_id=work_order_id)
         return qs
 
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Upload several `files` for one `work_order` in a single multipart request.
+
+        Responds 201 with a result per file if any were stored, 400 if none were.
+        """
+        work_order_id = request.data.get('work_order')
+        if not work_order_id:
+            return Response({'error': 'work_order is required'}, status=status.HTTP_400_BAD_REQUEST)
+        work_order = get_object_or_404(WorkOrder, pk=work_order_id)
+        files = request.FILES.getlist('files')
+        if not files:
+            return Response({'error': 'No files provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(files) > settings.ATTACHMENT_BATCH_MAX_FILES:
+            return Response(
+                {'error': f'At most {settings.ATTACHMENT_BATCH_MAX_FILES} files per batch'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = [
+            {
+                'filename': filename,
+                'status': 'created' if attachment else 'failed',
+                'attachment': self.get_serializer(attachment).data if attachment else None,
+                'error': error,
+            }
+            for filename, attachment, error in uploads.save_batch(work_order, files)
+        ]
+        created = sum(result['status'] == 'created' for result in results)
+        return Response(
+            {'created': created, 'failed': len(results) - created, 'results': results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """Resumable attachment uploads.
+
+    POST a {work_order, filename, size} session, PUT each chunk's raw bytes
+    to chunk/ with an Upload-Offset header, then POST finalize/. After a
+    disconnect, GET the session to find the offset to resume from.
+    """
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+
+    def perform_destroy(self, instance):
+        uploads.discard_part(instance.pk)
+        instance.delete()
+
+    @staticmethod
+    def _offset_response(offset, code=status.HTTP_200_OK, error=None):
+        data = {'offset': offset}
+        if error:
+            data['error'] = error
+        return Response(data, status=code, headers={'Upload-Offset': str(offset)})
+
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        session = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {'error': 'Upload-Offset and Content-Length headers are required'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            # Read the raw request stream; touching request.data would buffer the chunk.
+            new_offset = uploads.append_chunk(session, offset, request.stream, length)
+        except uploads.OffsetMismatch as exc:
+            return self._offset_response(exc.offset, status.HTTP_409_CONFLICT, 'Offset does not match the upload')
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if new_offset != offset + length:
+            return self._offset_response(new_offset, status.HTTP_400_BAD_REQUEST, 'Chunk was cut short')
+        return self._offset_response(new_offset)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        try:
+            attachment = uploads.finalize(session.pk)
+        except uploads.OffsetMismatch as exc:
+            return self._offset_response(exc.offset, status.HTTP_409_CONFLICT, 'Upload is incomplete')
+        except DjangoValidationError as exc:
+            return Response({'error': exc.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(JobAttachmentSerializer(attachment).data, status=status.HTTP_201_CREATED)
+
 
 class JobNoteViewSet(viewsets.ModelViewSet):
     queryset = JobNote.objects.select_related('work_order').order_by('-created_at')
@@ -211,25 +458,37 @@ class JobNoteViewSet(viewsets.ModelViewSet):
         return qs
 
 
+WORKORDER_PDF_TEMPLATE = "workorders/workorder_pdf.html"
+
+
+def workorder_pdf_context(workorder):
+    """Template context for the work order PDF, from one prefetch of each related table.
+
+    The sorted and filtered lists are built from the prefetched rows; asking
+    the related managers for order_by() or exclude() would query again.
+    """
+    prefetch_related_objects([workorder], 'events', 'notes', 'attachments')
+    return {
+        "job": workorder,
+        # Undated events last, as ORDER BY date puts NULLs on PostgreSQL.
+        "events": sorted(workorder.events.all(), key=lambda event: (event.date is None, event.date or date.min)),
+        "notes": sorted(workorder.notes.all(), key=lambda note: note.created_at, reverse=True),
+        "attachments": [attachment for attachment in workorder.attachments.all() if attachment.file],
+    }
+
+
+def workorder_pdf_filename(workorder):
+    return f"WorkOrder_{workorder.id}.pdf"
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def workorder_pdf(request, pk):
-    workorder = get_object_or_404(
-        WorkOrder.objects.select_related('client').prefetch_related(
-            'events', 'notes', 'attachments'
-        ),
-        pk=pk
+    workorder = get_object_or_404(WorkOrder.objects.select_related('client'), pk=pk)
+    return serve_pdf(
+        request,
+        WORKORDER_PDF_TEMPLATE,
+        workorder.pdf_fingerprint(),
+        lambda: workorder_pdf_context(workorder),
+        workorder_pdf_filename(workorder),
     )
-
-    html_string = render_to_string("workorders/workorder_pdf.html", {
-        "job": workorder,
-        "events": workorder.events.all().order_by('date'),
-        "notes": workorder.notes.all().order_by('-created_at'),
-        "attachments": workorder.attachments.exclude(file__exact=''),
-    })
-    html = HTML(string=html_string)
-    pdf = html.write_pdf()
-
-    response = HttpResponse(pdf, content_type="application/pdf")
-    response["Content-Disposition"] = f'inline; filename="WorkOrder_{workorder.id}.pdf"'
-    return response
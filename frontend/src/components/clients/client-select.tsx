@@ -18,7 +18,7 @@ import {
   PopoverContent,
   PopoverTrigger,
 } from "@/components/ui/popover";
-import { useClients, useClient } from "@/hooks/use-clients";
+import { useClientTypeahead, useClient } from "@/hooks/use-clients";
 
 interface ClientSelectProps {
   value?: number;
@@ -37,15 +37,15 @@ export function ClientSelect({
   const debounceRef = useRef<ReturnType<typeof setTimeout>>(undefined);
 
   useEffect(() => {
-    debounceRef.current = setTimeout(() => setDebouncedSearch(search), 300);
+    debounceRef.current = setTimeout(() => setDebouncedSearch(search), 150);
     return () => clearTimeout(debounceRef.current);
   }, [search]);
 
-  const { data } = useClients(debouncedSearch);
+  const { data } = useClientTypeahead(debouncedSearch);
 
-  const clients = data?.results || [];
+  const clients = data || [];
   const clientInList = clients.find((c) => c.id === value);
-  // If value is set but not in the current paginated list, fetch it directly
+  // If value is set but not among the current matches, fetch it directly
   const { data: fetchedClient } = useClient(value && !clientInList ? value : 0);
   const selectedClient = clientInList || (fetchedClient?.id === value ? fetchedClient : undefined);
 
@@ -1,7 +1,7 @@
 import { useQuery, useMutation, useQueryClient } from "@tanstack/react-query";
 import { toast } from "sonner";
 import api from "@/lib/api";
-import type { Client, ClientInput, PaginatedResponse } from "@/types";
+import type { Client, ClientInput, ClientListItem, PaginatedResponse } from "@/types";
 
 export function useClients(search?: string, page?: number) {
   return useQuery({
@@ -18,6 +18,18 @@ export function useClients(search?: string, page?: number) {
   });
 }
 
+export function useClientTypeahead(query: string, limit = 20) {
+  return useQuery({
+    queryKey: ["clients", "typeahead", { query, limit }],
+    queryFn: async () => {
+      const { data } = await api.get<ClientListItem[]>("/clients/typeahead/", {
+        params: { q: query, limit },
+      });
+      return data;
+    },
+  });
+}
+
 export function useClient(id: number) {
   return useQuery({
     queryKey: ["clients", id],